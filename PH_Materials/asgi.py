@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PH_Materials.settings")
+# -- Each ASGI request runs its sync code (and queries) in a thread of its own, so
+# -- a persistent (per-thread) connection would never be re-used. Close them at the
+# -- end of each request instead, or set DB_POOL=True to re-use pooled connections.
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
@@ -63,6 +63,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "webportal.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -109,22 +110,45 @@ SITE_ID = 1
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-if os.getenv("RAILWAY_ENVIRONMENT"):
+# -- Connections are kept open for DB_CONN_MAX_AGE seconds, and health-checked
+# -- before being re-used. Or, with DB_POOL=True (PostgreSQL, psycopg 3 only), they
+# -- are taken from a connection pool. Their statistics are in the /metrics.
+# -- See webportal/db_backends.
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+DB_POOL = str(os.getenv("DB_POOL", "False")) == "True"
+
+if os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("PGDATABASE"):
     DATABASES = {
         "default": {
-            "ENGINE": "django.db.backends.postgresql",
+            "ENGINE": "webportal.db_backends.postgresql",
             "NAME": os.getenv("PGDATABASE"),
             "USER": os.getenv("PGUSER"),
             "PASSWORD": os.getenv("PGPASSWORD"),
             "HOST": os.getenv("PGHOST"),
             "PORT": os.getenv("PGPORT"),
+            # -- A pooled connection goes back to the pool at the end of each request
+            "CONN_MAX_AGE": 0 if DB_POOL else DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": (
+                {
+                    "pool": {
+                        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                    }
+                }
+                if DB_POOL
+                else {}
+            ),
         }
     }
 else:
     DATABASES = {
         "default": {
-            "ENGINE": "django.db.backends.sqlite3",
+            "ENGINE": "webportal.db_backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
         }
     }
 
@@ -196,3 +220,11 @@ INTERNAL_IPS = [
 AUTH_USER_MODEL = "webportal.User"
 LOGIN_REDIRECT_URL = "index"
 PAGE_SIZE = 15
+MATERIAL_COUNT_CACHE_SECONDS = 60
+MATERIAL_SEARCH_LIMIT = 25
+MATERIAL_SEARCH_CACHE_SECONDS = 60
+MATERIAL_FRAGMENT_CACHE_SECONDS = 60 * 60
+# -- Changes per page of the material change feed (/api/materials/changes)
+MATERIAL_CHANGES_PAGE_SIZE = 500
+# -- Scrapers send 'Authorization: Bearer <METRICS_TOKEN>' to read /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
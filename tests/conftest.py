@@ -1,6 +1,17 @@
 import pytest
+from django.core.cache import cache
 
 from webportal.factories import MaterialFactory, UserFactory
+from webportal.models import MaterialCategory
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    MaterialCategory.objects.clear_cache()
+    yield
+    cache.clear()
+    MaterialCategory.objects.clear_cache()
 
 
 @pytest.fixture
@@ -0,0 +1,257 @@
+import gzip
+import json
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from webportal.benchmarks import BenchmarkScale, seed
+from webportal.factories import MaterialFactory, UserFactory
+from webportal.models import (
+    PUBLIC_LIBRARY_USER_ID,
+    Material,
+    MaterialChange,
+    MaterialChangeCounter,
+    User,
+)
+from webportal.resources import MaterialImporter
+
+
+def _content(response) -> bytes:
+    return b"".join(response.streaming_content)
+
+
+@pytest.fixture
+def library(user):
+    public_user = User.objects.filter(pk=PUBLIC_LIBRARY_USER_ID).first()
+    if public_user is None:
+        public_user = UserFactory(pk=PUBLIC_LIBRARY_USER_ID)
+    return [
+        MaterialFactory(user=user, name="own material"),
+        MaterialFactory(user=public_user, name="public material"),
+        MaterialFactory(name="another user's material"),
+        MaterialFactory(user=user, name="another own material"),
+    ]
+
+
+@pytest.mark.django_db
+def test_material_library_lists_the_visible_materials_in_order(user, library, client):
+    client.force_login(user)
+
+    response = client.get(reverse("api-material-library"))
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert "Content-Encoding" not in response
+    data = json.loads(_content(response))
+
+    assert data["api_version"] == 1
+    visible = [library[0], library[1], library[3]]
+    assert [m["uid"] for m in data["materials"]] == [m.uid for m in visible]
+    assert data["materials"][0] == {
+        "uid": library[0].uid,
+        "category": library[0].category.display_name,
+        "name": "own material",
+        "conductivity": library[0].conductivity,
+        "emissivity": library[0].emissivity,
+        "source": library[0].source,
+        "comments": library[0].comments,
+        "color_argb": library[0].color_argb,
+    }
+
+
+@pytest.mark.django_db
+def test_material_library_is_gzipped(user, library, client):
+    client.force_login(user)
+
+    plain = client.get(reverse("api-material-library"))
+    zipped = client.get(reverse("api-material-library"), HTTP_ACCEPT_ENCODING="gzip")
+
+    assert zipped["Content-Encoding"] == "gzip"
+    assert gzip.decompress(_content(zipped)) == _content(plain)
+    assert zipped["ETag"] != plain["ETag"]
+    assert "Accept-Encoding" in zipped["Vary"]
+
+
+@pytest.mark.django_db
+def test_unchanged_material_library_is_not_modified(
+    user, library, client, django_assert_max_num_queries
+):
+    client.force_login(user)
+    response = client.get(reverse("api-material-library"))
+    etag = response["ETag"]
+    assert etag.startswith('"')  # -- A strong ETag
+    assert f"-{json.loads(_content(response))['version']}-" in etag
+
+    # -- Only the session / user lookups and the library version, which is in the
+    # -- database: another worker (ie: with an empty cache) gives the same ETag
+    cache.clear()
+    with django_assert_max_num_queries(3):
+        response = client.get(reverse("api-material-library"), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+
+    library[0].name = "renamed material"
+    library[0].save()
+    response = client.get(reverse("api-material-library"), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert b"renamed material" in _content(response)
+
+
+@pytest.mark.django_db
+def test_material_library_needs_a_login(client):
+    response = client.get(reverse("api-material-library"))
+    assert response.status_code == 302
+
+
+def _changes(client, **params) -> dict:
+    response = client.get(reverse("api-material-changes"), params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.django_db
+def test_change_feed_has_the_latest_change_of_each_material(user, library, client):
+    client.force_login(user)
+    since = _changes(client)["version"]
+
+    own, public, other, _ = library
+    own.name = "first rename"
+    own.save()
+    own.name = "second rename"
+    own.save()
+    other.name = "not visible"
+    other.save()
+    new = MaterialFactory(user=user, name="new material")
+    new.delete()
+    public.delete()
+
+    data = _changes(client, since=since)
+    assert data["has_more"] is False
+    assert [(c["uid"], c["action"]) for c in data["changes"]] == [
+        (own.uid, "updated"),
+        (new.uid, "deleted"),
+        (public.uid, "deleted"),
+    ]
+    assert data["changes"][0]["material"]["name"] == "second rename"
+    assert data["changes"][1]["material"] is None
+    assert data["version"] == data["changes"][-1]["version"] > since
+
+    # -- Nothing has changed since then
+    assert _changes(client, since=data["version"])["changes"] == []
+
+
+@pytest.mark.django_db
+def test_change_feed_is_paged(user, client):
+    client.force_login(user)
+    materials = MaterialFactory.create_batch(5, user=user)
+
+    uids, since, has_more = [], 0, True
+    while has_more:
+        data = _changes(client, since=since, limit=2)
+        assert len(data["changes"]) <= 2
+        uids += [c["uid"] for c in data["changes"]]
+        since, has_more = data["version"], data["has_more"]
+    assert uids == [m.uid for m in materials]
+
+
+@pytest.mark.django_db
+def test_change_feed_follows_the_versions_not_the_ids(user, client):
+    client.force_login(user)
+    early, late = MaterialFactory.create_batch(2, user=user)
+    since = _changes(client)["version"]
+
+    # -- A change whose id was taken first, but which committed last
+    MaterialChange.objects.create(
+        id=10_000,
+        version=since + 2,
+        material_id=early.pk,
+        uid=early.uid,
+        user_id=user.pk,
+        action=MaterialChange.UPDATED,
+    )
+    MaterialChange.objects.create(
+        id=20_000,
+        version=since + 1,
+        material_id=late.pk,
+        uid=late.uid,
+        user_id=user.pk,
+        action=MaterialChange.UPDATED,
+    )
+
+    first = _changes(client, since=since, limit=1)
+    assert [c["uid"] for c in first["changes"]] == [late.uid]
+    second = _changes(client, since=first["version"])
+    assert [c["uid"] for c in second["changes"]] == [early.uid]
+
+
+@pytest.mark.django_db
+def test_changes_take_consecutive_versions_from_the_counter(user):
+    materials = MaterialFactory.create_batch(3, user=user)
+    before = MaterialChangeCounter.objects.get().version
+
+    MaterialChange.record(materials, MaterialChange.UPDATED)
+
+    versions = MaterialChange.objects.order_by("-version").values_list(
+        "version", flat=True
+    )[:3]
+    assert sorted(versions) == [before + 1, before + 2, before + 3]
+    assert MaterialChangeCounter.objects.get().version == before + 3
+
+    # -- A lost counter row carries on from the latest change
+    MaterialChangeCounter.objects.all().delete()
+    MaterialChange.record(materials[:1], MaterialChange.DELETED)
+    assert MaterialChangeCounter.objects.get().version == before + 4
+
+
+@pytest.mark.django_db
+def test_sync_after_a_few_edits_is_small(user, client):
+    client.force_login(user)
+    header = "uid,category,name,conductivity,emissivity,source,comments,color_argb"
+    rows = [f",Insulation,material {i},0.035,0.9,,,255,255,255,255" for i in range(500)]
+    MaterialImporter(user=user).import_csv("\r\n".join([header, *rows]))
+
+    library = json.loads(_content(client.get(reverse("api-material-library"))))
+    assert len(library["materials"]) == 500
+    assert _changes(client, since=0, limit=100)["has_more"] is True
+
+    edited = Material.objects.filter(user=user).first()
+    edited.conductivity = 0.04
+    edited.save()
+
+    response = client.get(
+        reverse("api-material-changes"), {"since": library["version"]}
+    )
+    changes = response.json()["changes"]
+    assert [(c["uid"], c["material"]["conductivity"]) for c in changes] == [
+        (edited.uid, 0.04)
+    ]
+    assert len(response.content) < 1_000
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{"since": "x"}, {"since": -1}, {"limit": 0}])
+def test_change_feed_rejects_bad_params(user, client, params):
+    client.force_login(user)
+    assert client.get(reverse("api-material-changes"), params).status_code == 400
+
+
+@pytest.mark.django_db
+def test_project_constructions_are_streamed_for_the_team_only(client):
+    data = seed(BenchmarkScale(materials=3, projects=1, layers_per_assembly=2))
+    other = seed(BenchmarkScale(materials=3, projects=1), username="other")
+    client.force_login(data.user)
+    project = data.projects[0]
+
+    url = reverse("api-project-constructions", args=[project.pk])
+    response = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+    assert response.status_code == 200
+    assert response["Content-Encoding"] == "gzip"
+    assert project.uid in response["Content-Disposition"]
+    document = json.loads(gzip.decompress(_content(response)))
+    assert list(document["constructions"]) == [
+        a.uid for a in data.assemblies if a.project_id == project.pk
+    ]
+
+    url = reverse("api-project-constructions", args=[other.projects[0].pk])
+    assert client.get(url).status_code == 404
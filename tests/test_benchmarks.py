@@ -0,0 +1,107 @@
+import pytest
+
+from webportal.benchmarks import (
+    ENDPOINTS,
+    BenchmarkResult,
+    BenchmarkScale,
+    find_regressions,
+    percentile,
+    run_benchmarks,
+    run_concurrency,
+    run_fragments,
+    seed,
+)
+from webportal.models import Assembly, Layer, Material, Project
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 21)]
+    assert percentile(values, 50) == 10.0
+    assert percentile(values, 95) == 19.0
+    assert percentile(values, 100) == 20.0
+    assert percentile([], 95) == 0.0
+
+
+def test_find_regressions_flags_extra_queries_and_slow_p95():
+    baseline = {
+        "results": {
+            "assembly": {"queries": 8, "p95_ms": 100.0},
+            "export_csv": {"queries": 3, "p95_ms": 100.0},
+        }
+    }
+    results = [
+        BenchmarkResult("assembly", 5, 50.0, 90.0, 95.0, 9, [200]),
+        BenchmarkResult("export_csv", 5, 50.0, 151.0, 160.0, 3, [200]),
+        BenchmarkResult("get_materials", 5, 50.0, 90.0, 95.0, 4, [200, 500]),
+    ]
+
+    regressions = find_regressions(results, baseline, tolerance=1.5)
+    assert len(regressions) == 3
+    assert regressions[0].startswith("assembly: 9 queries")
+    assert regressions[1].startswith("export_csv: p95")
+    assert regressions[2].startswith("get_materials: status codes")
+
+
+@pytest.mark.django_db
+def test_benchmarks_run_against_a_small_seeded_dataset():
+    scale = BenchmarkScale(
+        materials=30,
+        projects=2,
+        assemblies_per_project=2,
+        layers_per_assembly=3,
+        segments_per_layer=2,
+        import_rows=5,
+    )
+    data = seed(scale)
+    assert Material.objects.filter(user=data.user).count() == 30
+    assert Project.objects.filter(create_by=data.user).count() == 2
+    assert Layer.objects.count() == 12
+    assembly = Assembly.load_tree(data.assemblies[0].pk)
+    assert [
+        len(layer.get_ordered_segments()) for layer in assembly.get_ordered_layers()
+    ] == [2, 2, 2]
+
+    results = run_benchmarks(data, scale, repeat=2)
+    assert [result.name for result in results] == [e.name for e in ENDPOINTS]
+    for result in results:
+        assert result.status_codes == [200], result.name
+        assert result.queries > 0
+        assert result.p95_ms >= result.p50_ms
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrency_benchmark_compares_wsgi_and_asgi():
+    scale = BenchmarkScale(materials=10, projects=2, layers_per_assembly=2)
+    data = seed(scale)
+
+    results = run_concurrency(
+        data, scale, clients=[3, 6], requests_per_client=2, wsgi_threads=2
+    )
+    assert [(r.handler, r.clients) for r in results] == [
+        ("wsgi", 3),
+        ("asgi", 3),
+        ("wsgi", 6),
+        ("asgi", 6),
+    ]
+    for result in results:
+        assert result.requests == result.clients * 2
+        assert result.errors == 0, result
+        assert result.requests_per_second > 0
+
+
+@pytest.mark.django_db
+def test_fragment_benchmark_times_each_fragment():
+    data = seed(BenchmarkScale(materials=3, projects=1, layers_per_assembly=2))
+
+    results = run_fragments(data, renders=5)
+
+    assert [r.name for r in results] == [
+        "assembly-sidebar-list",
+        "assembly-name",
+        "layer",
+        "teams",
+    ]
+    for result in results:
+        assert result.renders == 5
+        assert result.before_p50_us > 0
+        assert result.after_p50_us > 0
@@ -0,0 +1,105 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from webportal.benchmarks import BenchmarkScale, seed
+from webportal.cloning import clone_assembly, clone_project
+from webportal.models import Assembly, Project
+
+
+def _tree(project: Project) -> list:
+    """The (name, [(thickness, [material...]), ...]) of each assembly, in order."""
+    assemblies = Assembly.objects.with_layer_tree().filter(project=project)
+    return [
+        (
+            assembly.name,
+            [
+                (layer.thickness, [s.material_id for s in layer.get_ordered_segments()])
+                for layer in assembly.get_ordered_layers()
+            ],
+        )
+        for assembly in assemblies
+    ]
+
+
+@pytest.mark.django_db
+def test_clone_project_copies_the_whole_tree():
+    data = seed(BenchmarkScale(materials=5, projects=1, layers_per_assembly=3))
+    source = data.projects[0]
+
+    clone = clone_project(source.pk, data.user)
+
+    assert clone.pk != source.pk
+    assert clone.uid != source.uid
+    assert clone.name == f"{source.name} (copy)"
+    assert _tree(clone) == _tree(source)
+    # -- New rows, not moved ones
+    assert Assembly.objects.filter(project=source).count() == 2
+    assert not set(
+        Assembly.objects.filter(project=clone).values_list("uid", flat=True)
+    ) & set(Assembly.objects.filter(project=source).values_list("uid", flat=True))
+
+
+@pytest.mark.django_db
+def test_clone_project_takes_constant_queries():
+    counts = []
+    for n in (2, 10):
+        data = seed(
+            BenchmarkScale(
+                materials=3,
+                projects=1,
+                assemblies_per_project=n,
+                layers_per_assembly=n,
+                segments_per_layer=2,
+            ),
+            username=f"clone-{n}",
+        )
+        with CaptureQueriesContext(connection) as captured:
+            clone_project(data.projects[0].pk, data.user)
+        counts.append(len(captured))
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.django_db
+def test_clone_assembly_goes_to_the_end_of_the_project(client):
+    data = seed(BenchmarkScale(materials=3, projects=2, layers_per_assembly=4))
+    client.force_login(data.user)
+    first, last = data.assemblies[:2]
+
+    url = reverse("clone-assembly", args=[first.project_id, first.pk])
+    response = client.post(url)
+    assert response.status_code == 200
+
+    assemblies = list(Assembly.objects.filter(project_id=first.project_id))
+    assert [a.pk for a in assemblies[:2]] == [first.pk, last.pk]
+    clone = assemblies[2]
+    assert clone.name == f"{first.name} (copy)"
+    assert [l.thickness for l in clone.get_ordered_layers()] == [
+        l.thickness for l in first.get_ordered_layers()
+    ]
+    assert f'id="layer-{clone.get_ordered_layers()[0].pk}"' in response.content.decode()
+
+    # -- The Assembly must be in the Project
+    with pytest.raises(Assembly.DoesNotExist):
+        clone_assembly(data.projects[1].pk, first.pk, data.user)
+
+
+@pytest.mark.django_db
+def test_clone_names_are_cut_to_fit_the_name_column():
+    data = seed(BenchmarkScale(materials=5, projects=1, layers_per_assembly=1))
+    project = data.projects[0]
+    project.name = "p" * 100
+    project.save()
+    assembly = project.get_ordered_assemblies()[0]
+    assembly.name = "a" * 100
+    assembly.save()
+
+    clone = clone_project(project.pk, data.user)
+    assert clone.name == "p" * 93 + " (copy)"
+    # -- And a clone of a clone does not grow
+    assert clone_project(clone.pk, data.user).name == clone.name
+
+    clone = clone_assembly(project.pk, assembly.pk, data.user)
+    assert clone.name == "a" * 93 + " (copy)"
+    assert len(clone_assembly(project.pk, clone.pk, data.user).name) == 100
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+from django.conf import settings
+from django.db.utils import ConnectionHandler
+
+from webportal.db_backends import get_connection_stats
+from webportal.metrics import registry
+
+
+@pytest.fixture
+def database(tmp_path, request, django_db_blocker):
+    """A file SQLite database (not the test's in-memory one) on its own alias."""
+    alias = f"lifecycle-{request.node.name}"
+    handler = ConnectionHandler(
+        {
+            "default": {"ENGINE": "django.db.backends.dummy"},
+            alias: {
+                "ENGINE": "webportal.db_backends.sqlite3",
+                "NAME": tmp_path / "lifecycle.sqlite3",
+                "CONN_MAX_AGE": 60,
+                "CONN_HEALTH_CHECKS": True,
+            },
+        }
+    )
+    with django_db_blocker.unblock():
+        yield handler, alias
+        handler.close_all()
+
+
+def _query(connection) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def test_settings_use_the_lifecycle_backend():
+    default = settings.DATABASES["default"]
+    assert default["ENGINE"].startswith("webportal.db_backends.")
+    assert default["CONN_HEALTH_CHECKS"] is True
+
+
+def test_persistent_connection_is_reused_between_requests(database):
+    handler, alias = database
+    connection = handler[alias]
+    stats = get_connection_stats(alias)
+
+    _query(connection)
+    _query(connection)
+    assert stats.snapshot() == {
+        "open": 1,
+        "in_use": 1,
+        "waiting": 0,
+        "opened": 1,
+        "reused": 0,
+        "health_check_failures": 0,
+    }
+    assert stats.connect_seconds.snapshot()[1] == 1
+
+    # -- The end of the request: the connection stays open, but is idle
+    connection.close_if_unusable_or_obsolete()
+    assert stats.snapshot()["in_use"] == 0
+    assert stats.snapshot()["open"] == 1
+
+    _query(connection)
+    assert stats.snapshot()["opened"] == 1
+    assert stats.snapshot()["reused"] == 1
+    assert stats.snapshot()["in_use"] == 1
+
+    connection.close()
+    assert stats.snapshot()["open"] == 0
+    assert stats.snapshot()["in_use"] == 0
+
+
+def test_broken_connection_is_replaced_on_reuse(database, monkeypatch):
+    handler, alias = database
+    connection = handler[alias]
+    stats = get_connection_stats(alias)
+
+    _query(connection)
+    connection.close_if_unusable_or_obsolete()
+    monkeypatch.setattr(connection, "is_usable", lambda: False)
+    _query(connection)
+
+    assert stats.snapshot()["health_check_failures"] == 1
+    assert stats.snapshot()["opened"] == 2
+    assert stats.snapshot()["open"] == 1
+    assert stats.snapshot()["in_use"] == 1
+
+
+def test_each_thread_has_its_own_connection(database):
+    handler, alias = database
+    stats = get_connection_stats(alias)
+    in_use = []
+    barrier = threading.Barrier(4)
+
+    def worker():
+        _query(handler[alias])
+        barrier.wait()
+        in_use.append(stats.snapshot()["in_use"])
+        barrier.wait()
+        handler[alias].close()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert in_use == [4, 4, 4, 4]
+    assert stats.snapshot()["opened"] == 4
+    assert stats.snapshot()["open"] == 0
+
+
+def test_connection_stats_are_in_the_metrics(database):
+    handler, alias = database
+    _query(handler[alias])
+
+    text = registry.render()
+    assert "db_connections_open{pid=" in text
+    assert f'database="{alias}"}} 1' in text
+    assert "db_connect_duration_seconds_count{pid=" in text
+    assert "# TYPE db_connections_opened_total counter" in text
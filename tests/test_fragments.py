@@ -0,0 +1,63 @@
+import pytest
+from django.template import Context, engines
+from render_block import render_block_to_string
+from render_block.exceptions import BlockNotFound
+
+from webportal import fragments
+from webportal.benchmarks import BenchmarkScale, _fragment_contexts, seed
+from webportal.fragments import render_block, render_fragment
+
+SIDEBAR = "webportal/partials/assemblies/sidebar.html"
+
+
+@pytest.mark.django_db
+def test_fragments_render_the_same_as_render_block_to_string():
+    data = seed(BenchmarkScale(materials=3, projects=1, layers_per_assembly=2))
+    for name, (template_name, block_name, values) in _fragment_contexts(data).items():
+        expected = render_block_to_string(template_name, block_name, Context(values))
+        assert render_fragment(template_name, block_name, Context(values)) == expected
+        assert render_fragment(template_name, block_name, values) == expected, name
+
+
+def test_block_levels_are_found_once_per_template(monkeypatch):
+    found = []
+    find_block_levels = fragments._find_block_levels
+    monkeypatch.setattr(
+        fragments,
+        "_find_block_levels",
+        lambda *args: found.append(args[0]) or find_block_levels(*args),
+    )
+    template = engines["django"].from_string(
+        "{% block a %}A{% block b %}B{{ value }}{% endblock %}{% endblock %}"
+    )
+
+    assert render_block(template, "a", {"value": 1}) == "AB1"
+    assert render_block(template, "b", {"value": 2}) == "B2"
+    assert found == [template.template]
+
+    with pytest.raises(BlockNotFound):
+        render_block(template, "c", {})
+    with pytest.raises(BlockNotFound):
+        render_fragment(SIDEBAR, "no-such-block")
+
+
+def test_blocks_of_an_extended_template_can_use_block_super():
+    template = engines["django"].from_string(
+        '{% extends "webportal/partials/assemblies/sidebar.html" %}'
+        "{% block assembly-sidebar-add-button %}new {{ block.super }}{% endblock %}"
+    )
+    values = {"active_project": {"pk": 1}}
+    parent = render_fragment(SIDEBAR, "assembly-sidebar-add-button", values)
+
+    html = render_block(template, "assembly-sidebar-add-button", values)
+    assert html == f"new {parent}"
+    assert len(fragments._block_levels[template.template]) == 2
+
+
+def test_a_variable_parent_is_not_cached():
+    template = engines["django"].from_string(
+        "{% extends parent %}{% block x %}{{ parent }}{% endblock %}"
+    )
+    for parent in (SIDEBAR, "webportal/partials/assemblies/assembly.html"):
+        assert render_block(template, "x", {"parent": parent}) == parent
+    assert fragments._block_levels[template.template] == ()
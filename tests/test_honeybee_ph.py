@@ -0,0 +1,91 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from webportal.benchmarks import BenchmarkScale, seed
+from webportal.honeybee_ph import iter_project_json
+from webportal.models import Assembly, LayerSegment, Project
+
+
+def _export(project: Project) -> dict:
+    return json.loads("".join(iter_project_json(project)))
+
+
+@pytest.mark.django_db
+def test_project_export_has_every_assembly_layer_and_segment_in_order():
+    data = seed(
+        BenchmarkScale(
+            materials=5,
+            projects=2,
+            assemblies_per_project=3,
+            layers_per_assembly=4,
+            segments_per_layer=2,
+        )
+    )
+    project = data.projects[0]
+    # -- Re-order the assemblies, and add an empty one
+    last = Assembly.objects.filter(project=project).last()
+    last.position = -1
+    last.save()
+    empty = Assembly.objects.create(project=project, name="empty", position=10_000)
+
+    document = _export(project)
+    assert (document["uid"], document["name"]) == (project.uid, project.name)
+
+    assemblies = list(Assembly.objects.with_layer_tree().filter(project=project))
+    assert list(document["constructions"]) == [a.uid for a in assemblies]
+    assert document["constructions"][empty.uid]["materials"] == []
+    for assembly in assemblies:
+        construction = document["constructions"][assembly.uid]
+        assert construction["type"] == "OpaqueConstruction"
+        assert construction["display_name"] == assembly.name
+
+        layers = assembly.get_ordered_layers()
+        assert [m["identifier"] for m in construction["materials"]] == [
+            layer.uid for layer in layers
+        ]
+        for layer, material in zip(layers, construction["materials"]):
+            segments = layer.get_ordered_segments()
+            conductivities = [s.material.conductivity for s in segments]
+            assert material["thickness"] == layer.thickness
+            assert material["conductivity"] == pytest.approx(
+                sum(conductivities) / len(conductivities)
+            )
+            cells = material["properties"]["ph"]["divisions"]["cells"]
+            assert [c["material"]["conductivity"] for c in cells] == conductivities
+            assert material["display_name"] == segments[0].material.name
+
+
+@pytest.mark.django_db
+def test_layer_without_a_material_has_no_conductivity():
+    data = seed(BenchmarkScale(materials=2, projects=1, layers_per_assembly=1))
+    LayerSegment.objects.update(material=None)
+
+    document = _export(data.projects[0])
+
+    for construction in document["constructions"].values():
+        material = construction["materials"][0]
+        assert material["conductivity"] is None
+        assert "divisions" not in material["properties"]["ph"]
+
+
+@pytest.mark.django_db
+def test_project_export_takes_constant_queries():
+    counts = []
+    for n in (2, 10):
+        data = seed(
+            BenchmarkScale(
+                materials=3,
+                projects=1,
+                assemblies_per_project=n,
+                layers_per_assembly=n,
+                segments_per_layer=2,
+            ),
+            username=f"export-{n}",
+        )
+        with CaptureQueriesContext(connection) as captured:
+            _export(data.projects[0])
+        counts.append(len(captured))
+    assert counts == [3, 3]
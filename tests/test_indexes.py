@@ -0,0 +1,78 @@
+import pytest
+from django.core.management import call_command
+
+from webportal.management.commands.explain_queries import plan_problems
+
+
+def test_plan_problems_flags_table_scans_and_unbounded_sorts():
+    plan = "\n".join(
+        [
+            "3 0 0 SCAN webportal_material",
+            "5 0 0 SCAN webportal_layer USING INDEX webportal_layer_assembly_id",
+            "7 0 0 SEARCH webportal_assembly USING INDEX asm_idx (project_id=?)",
+            "9 0 0 SCAN webportal_materialcategory",
+            "11 0 0 SCAN CONSTANT ROW",
+            "13 0 0 USE TEMP B-TREE FOR ORDER BY",
+        ]
+    )
+    assert plan_problems(plan, "sqlite") == [
+        "SCAN webportal_material",
+        "SCAN webportal_layer USING INDEX webportal_layer_assembly_id",
+        "USE TEMP B-TREE FOR ORDER BY",
+    ]
+
+
+def test_plan_problems_allows_sorting_a_few_rows_found_by_pk():
+    plan = "\n".join(
+        [
+            "7 0 0 MULTI-INDEX OR",
+            "8 7 0 INDEX 1",
+            "12 8 0 LIST SUBQUERY 1",
+            "23 12 0 SEARCH U0 USING INDEX material_user_cat_name_idx (user_id=?)",
+            "41 8 0 SEARCH webportal_material USING INTEGER PRIMARY KEY (rowid=?)",
+            "88 0 0 SEARCH webportal_materialcategory USING INTEGER PRIMARY KEY (rowid=?)",
+            "189 0 0 USE TEMP B-TREE FOR ORDER BY",
+        ]
+    )
+    assert plan_problems(plan, "sqlite") == []
+
+    # -- ... but not the sort of a subquery's rows, before its LIMIT
+    plan += "\n30 12 0 USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"
+    assert plan_problems(plan, "sqlite") == [
+        "USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"
+    ]
+
+
+def test_plan_problems_reads_postgresql_plans():
+    plan = "\n".join(
+        [
+            "Limit  (cost=5000.1..5000.2 rows=16 width=120)",
+            "  ->  Sort  (cost=5000.1..5100.2 rows=40000 width=120)",
+            "        Sort Key: webportal_material.category_id",
+            "        ->  Index Scan using material_user_cond_idx on webportal_material"
+            "  (cost=0.29..900.1 rows=40000 width=120)",
+            "              Filter: (user_id = ANY ('{2,1}'::bigint[]))",
+            "  ->  Index Scan using webportal_layer_pkey on webportal_layer"
+            "  (cost=0.29..8.3 rows=1 width=40)",
+            "        Index Cond: (id = 1)",
+            "  ->  Seq Scan on webportal_assembly  (cost=0.0..1.1 rows=10 width=40)",
+            "  ->  Sort  (cost=1.1..1.2 rows=34 width=120)",
+        ]
+    )
+    assert plan_problems(plan, "postgresql") == [
+        "->  Sort  (cost=5000.1..5100.2 rows=40000 width=120)",
+        "->  Index Scan using material_user_cond_idx on webportal_material"
+        "  (cost=0.29..900.1 rows=40000 width=120)",
+        "->  Seq Scan on webportal_assembly  (cost=0.0..1.1 rows=10 width=40)",
+    ]
+    assert plan_problems(plan, "postgresql", allow_sort=True)[0].startswith(
+        "->  Index Scan using material_user_cond_idx"
+    )
+
+
+@pytest.mark.django_db
+def test_hot_queries_use_an_index(capsys):
+    call_command("explain_queries")
+    output = capsys.readouterr().out
+    assert "NO INDEX" not in output
+    assert "All hot queries use an index." in output
@@ -0,0 +1,131 @@
+import pytest
+from django.urls import reverse
+
+from webportal.factories import MaterialFactory
+from webportal.models import Assembly, Layer, Project
+
+
+@pytest.fixture
+def assembly(user):
+    project = Project.create_new_project(user, name="project")
+    assembly = Assembly.create_new_assembly(user, name="wall", project=project)
+    for _ in range(3):
+        assembly.add_new_layer()
+    return assembly
+
+
+def _layer_pks(assembly) -> list[int]:
+    return list(assembly.layers.values_list("pk", flat=True))
+
+
+def _post(client, assembly, operations, project_pk=None):
+    url = reverse(
+        "layer-operations", args=[project_pk or assembly.project_id, assembly.pk]
+    )
+    return client.post(url, {"operations": operations}, content_type="application/json")
+
+
+@pytest.mark.django_db
+def test_layer_operations_apply_in_one_request(user, client, assembly):
+    client.force_login(user)
+    material = MaterialFactory(user=user)
+    first, second, third = _layer_pks(assembly)
+
+    response = _post(
+        client,
+        assembly,
+        [
+            {"op": "insert", "ref": "new", "index": 0, "material": material.pk},
+            {"op": "set_thickness", "layer": "new", "thickness": 0.25},
+            {"op": "set_thickness", "layer": second, "thickness": 0.1},
+            {"op": "set_material", "layer": third, "material": material.pk},
+            {"op": "delete", "layer": first},
+        ],
+    )
+    assert response.status_code == 200
+
+    new_pk = _layer_pks(assembly)[0]
+    assert _layer_pks(assembly) == [new_pk, second, third]
+    assert not Layer.objects.filter(pk=first).exists()
+    assert Layer.objects.get(pk=new_pk).thickness == 0.25
+    assert Layer.objects.get(pk=second).thickness == 0.1
+    for pk in (new_pk, third):
+        segments = Layer.objects.get(pk=pk).get_ordered_segments()
+        assert [s.material for s in segments] == [material]
+
+    # -- Only the changed layers are sent back, as out-of-band swaps
+    html = response.content.decode()
+    assert f'<div id="layer-{first}" hx-swap-oob="delete"></div>' in html
+    assert '<div hx-swap-oob="afterbegin:#assembly-layers">' in html
+    assert f'id="layer-{second}" hx-swap-oob="true"' in html
+    assert f'id="layer-{third}" hx-swap-oob="true"' in html
+    assert html.count('class="layer flex') == 3
+
+
+@pytest.mark.django_db
+def test_layer_operations_reorder_returns_the_whole_list(user, client, assembly):
+    client.force_login(user)
+    first, second, third = _layer_pks(assembly)
+
+    response = _post(
+        client, assembly, [{"op": "reorder", "layers": [third, first, second]}]
+    )
+    assert response.status_code == 200
+    assert _layer_pks(assembly) == [third, first, second]
+
+    html = response.content.decode()
+    assert '<div id="assembly-layers" hx-swap-oob="true">' in html
+    assert html.index(f'id="layer-{third}"') < html.index(f'id="layer-{first}"')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "bad_operation",
+    [
+        {"op": "explode"},
+        {"op": "delete", "layer": 999999},
+        {"op": "set_thickness", "layer": "missing", "thickness": 1},
+        {"op": "set_material", "layer": None, "material": "x"},
+        {"op": "reorder", "layers": []},
+        {"op": "insert", "index": 99, "ref": "new"},
+    ],
+)
+def test_invalid_layer_operations_change_nothing(user, client, assembly, bad_operation):
+    client.force_login(user)
+    before = list(Layer.objects.values_list("pk", "thickness"))
+    first = _layer_pks(assembly)[0]
+
+    response = _post(
+        client,
+        assembly,
+        [{"op": "set_thickness", "layer": first, "thickness": 9.0}, bad_operation],
+    )
+    assert response.status_code == 400
+    assert list(Layer.objects.values_list("pk", "thickness")) == before
+
+
+@pytest.mark.django_db
+def test_layer_operations_need_the_assembly_in_the_project(user, client, assembly):
+    client.force_login(user)
+    other = Project.create_new_project(user, name="other")
+    first = _layer_pks(assembly)[0]
+
+    response = _post(
+        client, assembly, [{"op": "delete", "layer": first}], project_pk=other.pk
+    )
+    assert response.status_code == 404
+    assert Layer.objects.filter(pk=first).exists()
+
+
+@pytest.mark.django_db
+def test_layer_insert_only_writes_the_new_layer_position(user, client, assembly):
+    client.force_login(user)
+    before = list(assembly.layers.values_list("pk", "position"))
+
+    response = _post(client, assembly, [{"op": "insert", "ref": "new", "index": 1}])
+    assert response.status_code == 200
+
+    after = list(assembly.layers.values_list("pk", "position"))
+    assert len(after) == 4
+    assert [after[0], *after[2:]] == before
+    assert before[0][1] < after[1][1] < before[1][1]
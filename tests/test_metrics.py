@@ -0,0 +1,96 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+
+from webportal.metrics import Histogram, registry
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    registry.clear()
+    yield
+    registry.clear()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5, 10))
+    for value in (0.5, 3, 7, 20):
+        histogram.observe(value)
+
+    counts, count, total = histogram.snapshot()
+    assert counts == [1, 2, 3]
+    assert count == 4
+    assert total == 30.5
+
+
+@pytest.mark.django_db
+def test_request_metrics_are_recorded_by_url_name(user_materials, client):
+    client.force_login(user_materials[0].user)
+    response = client.get(reverse("get-materials"))
+    assert response.status_code == 200
+
+    text = registry.render()
+    assert 'view="get-materials",status="200"} 1' in text
+    assert "http_request_duration_seconds_count{pid=" in text
+    for metric in (
+        "http_request_duration_seconds",
+        "http_request_db_queries",
+        "http_request_db_duration_seconds",
+        "http_request_template_duration_seconds",
+        "http_response_size_bytes",
+    ):
+        assert f"{metric}_count{{" in text
+    assert 'view="get-materials",le="+Inf"} 1' in text
+
+    # -- The request ran some SQL, and rendered the table (HTML) fragment
+    db_queries = registry._histograms[("http_request_db_queries", "get-materials")]
+    assert db_queries.snapshot()[2] > 0
+    templates = registry._histograms[
+        ("http_request_template_duration_seconds", "get-materials")
+    ]
+    assert templates.snapshot()[2] > 0
+    sizes = registry._histograms[("http_response_size_bytes", "get-materials")]
+    assert sizes.snapshot()[2] == len(response.content)
+
+
+@pytest.mark.django_db
+def test_request_metrics_are_recorded_under_the_asgi_handler(user_materials):
+    client = AsyncClient()
+    client.force_login(user_materials[0].user)
+    response = async_to_sync(client.get)(reverse("get-materials"))
+    assert response.status_code == 200
+
+    assert 'view="get-materials",status="200"} 1' in registry.render()
+    # -- The queries ran in the async ORM's thread, but are still counted
+    db_queries = registry._histograms[("http_request_db_queries", "get-materials")]
+    assert db_queries.snapshot()[2] > 0
+    sizes = registry._histograms[("http_response_size_bytes", "get-materials")]
+    assert sizes.snapshot()[2] == len(response.content)
+
+
+@pytest.mark.django_db
+def test_streamed_response_size_is_recorded(user_materials, client):
+    client.force_login(user_materials[0].user)
+    response = client.get(reverse("export-csv"))
+    content = b"".join(response.streaming_content)
+
+    sizes = registry._histograms[("http_response_size_bytes", "export-csv")]
+    assert sizes.snapshot()[1:] == (1, len(content))
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_requires_staff_or_token(user, client, settings):
+    settings.METRICS_TOKEN = "secret"
+    client.force_login(user)
+    assert client.get(reverse("metrics")).status_code == 403
+
+    response = client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    assert b"# TYPE http_request_duration_seconds histogram" in response.content
+
+    user.is_staff = True
+    user.save()
+    client.force_login(user)
+    assert client.get(reverse("metrics")).status_code == 200
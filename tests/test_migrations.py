@@ -0,0 +1,65 @@
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+BEFORE = [("webportal", "0004_material_indexes")]
+AFTER = [("webportal", "0005_order_positions")]
+
+
+def _migrate(targets):
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(targets)
+    return executor.loader.project_state(targets).apps
+
+
+@pytest.mark.django_db(transaction=True)
+def test_order_arrays_become_positions_and_hidden_layers_are_deleted():
+    apps = _migrate(BEFORE)
+    Project = apps.get_model("webportal", "Project")
+    Assembly = apps.get_model("webportal", "Assembly")
+    Layer = apps.get_model("webportal", "Layer")
+    LayerSegment = apps.get_model("webportal", "LayerSegment")
+
+    project = Project.objects.create(name="p")
+    first, second, unlisted = (Assembly.objects.create(project=project) for _ in "abc")
+    project.assembly_id_order = [second.pk, first.pk]
+    project.save()
+
+    unlisted_layer = Layer.objects.create(assembly=unlisted, thickness=1)
+    top, bottom, hidden_layer = (
+        Layer.objects.create(assembly=first, thickness=t) for t in (1, 2, 3)
+    )
+    first.layer_id_order = [bottom.pk, top.pk]
+    first.save()
+    unlisted.layer_id_order = [unlisted_layer.pk]
+    unlisted.save()
+
+    kept_segment = LayerSegment.objects.create(layer=top)
+    LayerSegment.objects.create(layer=top)
+    top.segment_id_order = [kept_segment.pk]
+    top.save()
+
+    apps = _migrate(AFTER)
+    Assembly = apps.get_model("webportal", "Assembly")
+    Layer = apps.get_model("webportal", "Layer")
+    LayerSegment = apps.get_model("webportal", "LayerSegment")
+
+    assert list(Assembly.objects.order_by("position").values_list("pk", flat=True)) == [
+        second.pk,
+        first.pk,
+        unlisted.pk,
+    ]
+    assert Layer.objects.filter(assembly=unlisted.pk).get().pk == unlisted_layer.pk
+    assert list(
+        Layer.objects.filter(assembly=first.pk)
+        .order_by("position")
+        .values_list("pk", flat=True)
+    ) == [
+        bottom.pk,
+        top.pk,
+    ]
+    assert list(LayerSegment.objects.values_list("pk", flat=True)) == [kept_segment.pk]
+    assert not Layer.objects.filter(pk=hidden_layer.pk).exists()
+
+    _migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
@@ -1,6 +1,18 @@
 import pytest
+from django.db import IntegrityError
 
-from webportal.models import Material, MaterialCategory, User
+from webportal.factories import MaterialFactory
+from webportal.models import (
+    Assembly,
+    Layer,
+    LayerSegment,
+    Material,
+    MaterialCategory,
+    Project,
+    User,
+    assign_positions,
+)
+from webportal.uids import generate_short_uids
 
 
 @pytest.mark.django_db
@@ -21,3 +33,140 @@ def test_queryset_get_all(materials):
 def test_user_materials_queryset_get_all(user_materials):
     qs = Material.objects.all()
     assert len(qs) == 20
+
+
+@pytest.mark.django_db
+def test_generate_short_uids_are_unique_and_prefixed(materials):
+    existing = set(Material.objects.values_list("uid", flat=True))
+    uids = generate_short_uids(Material, "mat", 500)
+    assert len(set(uids)) == 500
+    assert not existing & set(uids)
+    assert all(uid.startswith("mat") and len(uid) <= 12 for uid in uids)
+
+
+@pytest.mark.django_db
+def test_bulk_create_assigns_uids_with_constant_queries(
+    user, django_assert_max_num_queries
+):
+    assembly = Assembly.objects.create(created_by=user, name="wall")
+    # -- Few enough rows for a single INSERT within SQLite's parameter limit
+    layers = [Layer(assembly=assembly, thickness=0.1) for _ in range(150)]
+    with django_assert_max_num_queries(2):
+        Layer.objects.bulk_create(layers)
+
+    uids = list(Layer.objects.values_list("uid", flat=True))
+    assert len(uids) == 150
+    assert len(set(uids)) == 150
+    assert all(uid.startswith("lyr") for uid in uids)
+
+
+@pytest.mark.django_db
+def test_layer_uid_is_unique(user):
+    assembly = Assembly.objects.create(created_by=user, name="wall")
+    layer = Layer.objects.create(assembly=assembly, thickness=0.1)
+    with pytest.raises(IntegrityError):
+        Layer.objects.create(assembly=assembly, thickness=0.1, uid=layer.uid)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("n_layers", [2, 15])
+def test_assembly_tree_loads_with_fixed_queries(
+    user, n_layers, django_assert_num_queries
+):
+    material = MaterialFactory()
+    project = Project.objects.create(create_by=user)
+    assembly = Assembly.objects.create(created_by=user, project=project)
+    layer_pks, segment_pks = [], {}
+    for i in range(n_layers):
+        # -- Each created before the last, but placed in front of it
+        layer = Layer.objects.create(assembly=assembly, thickness=0.1, position=-i)
+        segments = LayerSegment.objects.bulk_create(
+            [
+                LayerSegment(layer=layer, material=material, position=-j)
+                for j in range(2)
+            ]
+        )
+        layer_pks.insert(0, layer.pk)
+        segment_pks[layer.pk] = [seg.pk for seg in reversed(segments)]
+
+    with django_assert_num_queries(3):
+        loaded = Assembly.load_tree(assembly.pk)
+        assert loaded.project == project
+        layers = loaded.get_ordered_layers()
+        assert [layer.pk for layer in layers] == layer_pks
+        for layer in layers:
+            segments = layer.get_ordered_segments()
+            assert [seg.pk for seg in segments] == segment_pks[layer.pk]
+            assert all(seg.material.category.category for seg in segments)
+
+
+@pytest.mark.parametrize(
+    "positions, expected, moved",
+    [
+        # -- New items go in the gaps, without moving the others
+        ([1024, None, 2048], [1024, 1536, 2048], []),
+        ([None, 1024, None], [512, 1024, 2048], []),
+        # -- Only the item which is out of order moves
+        ([1024, 4096, 2048, 3072], [1024, 1536, 2048, 3072], [1]),
+        # -- No room left in the gap: everything is renumbered
+        ([1, None, 2], [1024, 2048, 3072], [0, 2]),
+    ],
+)
+def test_assign_positions(positions, expected, moved):
+    items = [
+        Layer(pk=None if p is None else i + 1, position=p or 0)
+        for i, p in enumerate(positions)
+    ]
+    assert [items.index(item) for item in assign_positions(items)] == moved
+    assert [item.position for item in items] == expected
+
+
+@pytest.mark.django_db
+def test_material_category_cache_lookups_do_not_query(django_assert_num_queries):
+    insulation = MaterialCategory.objects.get_for_code("IN")
+    with django_assert_num_queries(0):
+        assert MaterialCategory.objects.get_for_code("IN") is insulation
+        assert MaterialCategory.objects.get_for_id(insulation.pk) is insulation
+        assert len(MaterialCategory.objects.get_all_cached()) == 12
+        assert MaterialCategory.get_category_code("Insulation") == "IN"
+        assert MaterialCategory.get_category_display_name("in") == "Insulation"
+
+
+@pytest.mark.django_db
+def test_material_save_does_not_query_categories(user, django_assert_num_queries):
+    category = MaterialCategory.objects.get_for_code("WD")
+    material = Material(user=user, name="pine", category=category)
+    # -- One query for the UID check, one for the insert, two for the change-log
+    with django_assert_num_queries(4):
+        material.save()
+    assert material.category == category
+
+
+@pytest.mark.django_db
+def test_material_category_cache_is_cleared_on_change():
+    category = MaterialCategory.objects.get_for_code("MT")
+    category.delete()
+    with pytest.raises(MaterialCategory.DoesNotExist):
+        MaterialCategory.objects.get_for_id(category.pk)
+    assert MaterialCategory.objects.get_for_code("MT").pk != category.pk
+
+
+@pytest.mark.django_db
+def test_material_save_rejects_unknown_category(user):
+    with pytest.raises(ValueError):
+        Material(user=user, name="x", category=MaterialCategory(category="XX")).save()
+
+
+@pytest.mark.django_db
+def test_material_keeps_a_copy_of_its_category_code(user):
+    insulation = MaterialCategory.objects.get_for_code("IN")
+    saved = MaterialFactory(user=user, category=insulation)
+    (bulk,) = Material.objects.bulk_create(
+        [Material(user=user, name="bulk", category=insulation)]
+    )
+    assert saved.category_code == bulk.category_code == "IN"
+
+    insulation.category = "MT"
+    MaterialCategory.objects.filter(category="MT").delete()
+    insulation.save()
+    assert set(Material.objects.values_list("category_code", flat=True)) == {"MT"}
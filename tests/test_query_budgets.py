@@ -0,0 +1,271 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from webportal import urls
+from webportal.benchmarks import BenchmarkData, BenchmarkScale, seed
+from webportal.models import User
+from webportal.query_budgets import format_queries, get_query_budget
+
+SMALL, LARGE = 2, 12
+
+
+def _dataset(n: int) -> BenchmarkData:
+    """n materials, assemblies, layers-per-assembly and team-members."""
+    scale = BenchmarkScale(
+        materials=n,
+        projects=2,
+        assemblies_per_project=n,
+        layers_per_assembly=n,
+        segments_per_layer=2,
+    )
+    data = seed(scale, username=f"budget-{n}")
+    for i in range(n):
+        User.objects.create(
+            username=f"member-{n}-{i}", email=f"member-{n}-{i}@example.com"
+        )
+    User.objects.filter(username__startswith=f"member-{n}-").update(team=data.user.team)
+    data.user.team_invite = data.user.team
+    data.user.is_staff = True
+    data.user.save()
+    return data
+
+
+def _assembly_args(data: BenchmarkData) -> list[int]:
+    assembly = data.assemblies[0]
+    return [assembly.project_id, assembly.pk]  # type: ignore
+
+
+def _layer_args(data: BenchmarkData) -> list[int]:
+    layer = data.layers[0]
+    return [data.assemblies[0].project_id, layer.assembly_id, layer.pk]  # type: ignore
+
+
+def _materials_csv(n_rows: int) -> SimpleUploadedFile:
+    header = "uid,category,name,conductivity,emissivity,source,comments,color_argb"
+    rows = [f",Insulation,new {i},0.035,0.9,,,255,255,255,255" for i in range(n_rows)]
+    content = "\r\n".join([header, *rows]) + "\r\n"
+    return SimpleUploadedFile("materials.csv", content.encode())
+
+
+def _layer_operations(client: Client, data: BenchmarkData):
+    """Change, insert and delete as many layers as there are in the assembly."""
+    n_layers = data.assemblies[0].layers.count()
+    layers = data.layers[:n_layers]
+    material = data.materials[-1].pk
+    operations = [
+        *({"op": "set_thickness", "layer": l.pk, "thickness": 0.1} for l in layers),
+        *({"op": "set_material", "layer": l.pk, "material": material} for l in layers),
+        *(
+            {"op": "insert", "ref": f"new-{i}", "material": material}
+            for i in range(n_layers)
+        ),
+        {"op": "delete", "layer": layers[-1].pk},
+    ]
+    return client.post(
+        reverse("layer-operations", args=_assembly_args(data)),
+        {"operations": operations},
+        content_type="application/json",
+    )
+
+
+def _streamed(response):
+    """Read the whole streamed response, so its queries are all captured."""
+    b"".join(response.streaming_content)
+    return response
+
+
+# -- One request per URL-name, built from the dataset
+REQUESTS = {
+    "index": lambda c, d: c.get(reverse("index")),
+    "metrics": lambda c, d: c.get(reverse("metrics")),
+    "account-settings": lambda c, d: c.get(reverse("account-settings")),
+    "update-team-name": lambda c, d: c.post(
+        reverse("update-team-name"), {"team_name": f"team {d.user.pk}"}
+    ),
+    "update-first-name": lambda c, d: c.post(
+        reverse("update-first-name"), {"first_name": "first"}
+    ),
+    "update-last-name": lambda c, d: c.post(
+        reverse("update-last-name"), {"last_name": "last"}
+    ),
+    "update-email": lambda c, d: c.post(
+        reverse("update-email"), {"email": "new@example.com"}
+    ),
+    "invite-user-to-team": lambda c, d: c.post(
+        reverse("invite-user-to-team"),
+        {"user_email": User.objects.exclude(email="").first().email},  # type: ignore
+    ),
+    "accept-team-invite": lambda c, d: c.post(reverse("accept-team-invite")),
+    "decline-team-invite": lambda c, d: c.post(reverse("decline-team-invite")),
+    "leave-team": lambda c, d: c.post(reverse("leave-team")),
+    "materials-page": lambda c, d: c.get(reverse("materials-page")),
+    "materials-list": lambda c, d: c.get(reverse("materials-list")),
+    "create-material": lambda c, d: c.post(
+        reverse("create-material"),
+        {
+            "name": "new material",
+            "conductivity": 0.04,
+            "emissivity": 0.9,
+            "color_argb": "255,255,255,255",
+            "category": d.materials[0].category_id,
+        },
+    ),
+    "update-material": lambda c, d: c.get(
+        reverse("update-material", args=[d.materials[0].pk])
+    ),
+    "delete-material": lambda c, d: c.delete(
+        reverse("delete-material", args=[d.materials[0].pk])
+    ),
+    "get-materials": lambda c, d: c.get(reverse("get-materials")),
+    "material-search": lambda c, d: c.get(reverse("material-search"), {"term": "mat"}),
+    "export-csv": lambda c, d: _streamed(c.get(reverse("export-csv"))),
+    "import-materials": lambda c, d: c.post(
+        reverse("import-materials"), {"file": _materials_csv(len(d.materials))}
+    ),
+    "set-unit-system": lambda c, d: c.post(
+        reverse("set-unit-system"), {"unit-system": "on"}
+    ),
+    "api-material-library": lambda c, d: _streamed(
+        c.get(reverse("api-material-library"), HTTP_ACCEPT_ENCODING="gzip")
+    ),
+    "api-material-changes": lambda c, d: c.get(reverse("api-material-changes")),
+    "api-project-constructions": lambda c, d: _streamed(
+        c.get(reverse("api-project-constructions", args=[d.projects[0].pk]))
+    ),
+    "assemblies-page-landing": lambda c, d: c.get(reverse("assemblies-page-landing")),
+    "assembly-landing": lambda c, d: c.get(
+        reverse("assembly-landing", args=[d.projects[0].pk])
+    ),
+    "change-project": lambda c, d: c.get(
+        reverse("change-project"), {"project_pk": d.projects[0].pk}
+    ),
+    "assembly": lambda c, d: c.get(reverse("assembly", args=_assembly_args(d))),
+    "add-new-assembly": lambda c, d: c.post(
+        reverse("add-new-assembly", args=[d.projects[0].pk])
+    ),
+    "update-assembly-name": lambda c, d: c.post(
+        reverse("update-assembly-name", args=_assembly_args(d)), {"name": "new"}
+    ),
+    "delete-assembly": lambda c, d: c.get(
+        reverse("delete-assembly", args=_assembly_args(d))
+    ),
+    "clone-assembly": lambda c, d: c.post(
+        reverse("clone-assembly", args=_assembly_args(d))
+    ),
+    "clone-project": lambda c, d: c.post(
+        reverse("clone-project", args=[d.projects[0].pk])
+    ),
+    "add-layer": lambda c, d: c.get(reverse("add-layer", args=_assembly_args(d))),
+    "delete-layer": lambda c, d: c.get(reverse("delete-layer", args=_layer_args(d))),
+    "update-layer-thickness": lambda c, d: c.post(
+        reverse("update-layer-thickness", args=_layer_args(d)), {"thickness": 0.2}
+    ),
+    "update-layer-material": lambda c, d: c.post(
+        reverse("update-layer-material", args=_layer_args(d)),
+        {
+            f"form_{d.segments[0].pk}-material": d.materials[-1].pk,
+        },
+    ),
+    "layer-operations": _layer_operations,
+}
+
+VIEW_PATTERNS = [
+    pattern for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)
+]
+
+
+def _run(url_name: str, data: BenchmarkData) -> CaptureQueriesContext:
+    client = Client()
+    client.force_login(data.user)
+    cache.clear()
+    with CaptureQueriesContext(connection) as captured:
+        response = REQUESTS[url_name](client, data)
+    assert response.status_code in (200, 302), f"{url_name}: {response.status_code}"
+    return captured
+
+
+INSERT_RE = re.compile(r"INSERT INTO (\S+) \((.*?)\) VALUES (.*)", re.DOTALL)
+
+
+def _insert_rows(sql: str) -> tuple[str, int, int] | None:
+    """The (table, column count, row count) of an INSERT, or None."""
+    if not (match := INSERT_RE.match(sql)):
+        return None
+    table, columns, values = match.groups()
+    return table, columns.count(",") + 1, values.count("), (") + 1
+
+
+def _count(captured: CaptureQueriesContext) -> int:
+    """The number of queries, counting a bulk INSERT which was split up as one.
+
+    (Django splits a bulk INSERT into batches of connection.ops.bulk_batch_size
+    rows, ie: every 999 parameters on SQLite.) Only an INSERT following a full
+    batch into the same table is merged, so a per-row INSERT loop is still counted
+    once per row.
+    """
+    count = 0
+    previous = None
+    for query in captured.captured_queries:
+        insert = _insert_rows(query["sql"])
+        if not (
+            insert
+            and previous
+            and insert[0] == previous[0]
+            and previous[2]
+            >= connection.ops.bulk_batch_size([None] * previous[1], [None] * 10_000)
+        ):
+            count += 1
+        previous = insert
+    return count
+
+
+def _inserts(*rows: int) -> SimpleNamespace:
+    """A captured INSERT of each number of rows."""
+    sql = 'INSERT INTO "webportal_layer" ("uid", "assembly_id") VALUES '
+    return SimpleNamespace(
+        captured_queries=[
+            {"sql": sql + ", ".join(f"('{i}', {i})" for i in range(n))} for n in rows
+        ]
+    )
+
+
+def test_count_merges_only_the_batches_of_a_split_bulk_insert():
+    batch = connection.ops.bulk_batch_size([None, None], [None] * 10_000)
+    assert _count(_inserts(batch, batch, 5)) == 1
+    # -- A per-row INSERT loop is an N+1
+    assert _count(_inserts(1, 1, 1)) == 3
+    assert _count(_inserts(5, 5)) == 2
+
+
+@pytest.mark.parametrize("pattern", VIEW_PATTERNS, ids=lambda p: p.name)
+def test_every_view_declares_a_query_budget(pattern):
+    assert get_query_budget(pattern.callback) is not None, pattern.name
+    assert pattern.name in REQUESTS, pattern.name
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_name", list(REQUESTS))
+def test_view_stays_within_query_budget_at_any_size(url_name):
+    pattern = next(p for p in VIEW_PATTERNS if p.name == url_name)
+    budget = get_query_budget(pattern.callback)
+
+    small = _run(url_name, _dataset(SMALL))
+    large = _run(url_name, _dataset(LARGE))
+
+    for size, captured in ((SMALL, small), (LARGE, large)):
+        assert _count(captured) <= budget, (
+            f"'{url_name}' ran {_count(captured)} queries (budget {budget}) "
+            f"with {size} rows:\n{format_queries(captured)}"
+        )
+    assert _count(large) <= _count(small), (
+        f"'{url_name}' queries grow with the data: {_count(small)} queries with "
+        f"{SMALL} rows, {_count(large)} with {LARGE} rows:\n{format_queries(large)}"
+    )
@@ -0,0 +1,210 @@
+import numpy as np
+import pytest
+from django.urls import reverse
+
+from webportal.factories import MaterialFactory
+from webportal.models import (
+    Assembly,
+    Layer,
+    LayerSegment,
+    Material,
+    Project,
+    next_position,
+)
+from webportal.thermal import (
+    AssemblyArrays,
+    calculate,
+    calculate_assemblies,
+    calculate_project,
+    get_stored_results,
+    store_results,
+)
+
+
+def _layer(assembly: Assembly, thickness: float, *conductivities: float) -> Layer:
+    layer = Layer.objects.create(
+        assembly=assembly, thickness=thickness, position=next_position(assembly.layers)
+    )
+    for position, conductivity in enumerate(conductivities):
+        LayerSegment.objects.create(
+            layer=layer,
+            material=MaterialFactory(conductivity=conductivity),
+            position=position,
+        )
+    return layer
+
+
+@pytest.mark.django_db
+def test_single_layer_assembly(user):
+    assembly = Assembly.objects.create(created_by=user)
+    _layer(assembly, 0.1, 0.04)
+
+    results = calculate(AssemblyArrays.from_assemblies([assembly]))
+    assert results.layer_r_values[0, 0] == pytest.approx(2.5)
+    assert results.r_isothermal[0] == pytest.approx(2.5)
+    assert results.r_parallel[0] == pytest.approx(2.5)
+    assert results.u_value[0] == pytest.approx(0.4)
+
+
+@pytest.mark.django_db
+def test_stud_layer_isothermal_and_parallel_path(user):
+    assembly = Assembly.objects.create(created_by=user)
+    _layer(assembly, 0.1, 0.12, 0.04)
+    _layer(assembly, 0.05, 0.04)
+
+    results = calculate(AssemblyArrays.from_assemblies([assembly]), r_si=0.13)
+    assert results.layer_r_values[0].tolist() == pytest.approx([1.25, 1.25])
+    assert results.r_isothermal[0] == pytest.approx(2.5 + 0.13)
+    u_parallel = 0.5 / (0.1 / 0.12 + 1.25 + 0.13) + 0.5 / (2.5 + 1.25 + 0.13)
+    assert results.r_parallel[0] == pytest.approx(1 / u_parallel)
+    assert results.r_total[0] == pytest.approx(
+        (results.r_isothermal[0] + results.r_parallel[0]) / 2
+    )
+
+
+@pytest.mark.django_db
+def test_project_batch_pads_layers_and_flags_missing_material(user):
+    project = Project.objects.create(create_by=user)
+    thin = Assembly.objects.create(created_by=user, project=project)
+    _layer(thin, 0.1, 0.04)
+    thick = Assembly.objects.create(created_by=user, project=project)
+    _layer(thick, 0.1, 0.04)
+    _layer(thick, 0.2, 0.04)
+    _layer(thick, 0.1, 0.12, 0.04, 0.12)
+    no_material = Assembly.objects.create(created_by=user, project=project)
+    Layer.new_layer_with_single_segment(no_material)
+
+    assemblies, results = calculate_project(project)
+    r_values = dict(zip([a.pk for a in assemblies], results.r_isothermal))
+    assert len(results) == 3
+    assert r_values[thin.pk] == pytest.approx(2.5)
+    assert r_values[thick.pk] == pytest.approx(2.5 + 5.0 + 0.1 / (0.28 / 3))
+    assert np.isnan(r_values[no_material.pk])
+
+
+@pytest.mark.django_db
+def test_stored_results_match_the_calculation(user):
+    project = Project.objects.create(create_by=user)
+    stud = Assembly.objects.create(created_by=user, project=project)
+    _layer(stud, 0.1, 0.12, 0.04)
+    _layer(stud, 0.05, 0.04)
+    no_material = Assembly.objects.create(created_by=user, project=project)
+    Layer.new_layer_with_single_segment(no_material)
+    empty = Assembly.objects.create(created_by=user, project=project)
+
+    assemblies = get_stored_results(Assembly.objects.filter(project=project))
+    results = calculate_assemblies(
+        Assembly.objects.with_layer_tree().filter(pk=stud.pk)
+    )
+    stored = {a.pk: a for a in assemblies}
+    assert not any(a.thermal_stale for a in assemblies)
+    assert stored[stud.pk].r_isothermal == pytest.approx(results.r_isothermal[0])
+    assert stored[stud.pk].r_parallel == pytest.approx(results.r_parallel[0])
+    assert stored[stud.pk].u_value == pytest.approx(results.u_value[0])
+    assert [l.r_value for l in stud.get_ordered_layers()] == pytest.approx(
+        results.layer_r_values[0].tolist()
+    )
+    assert stored[no_material.pk].u_value is None
+    assert no_material.layers.get().r_value is None
+    assert stored[empty.pk].u_value is None
+
+
+@pytest.mark.django_db
+def test_layer_edit_updates_the_stored_results(user, client):
+    client.force_login(user)
+    project = Project.objects.create(create_by=user)
+    assembly = Assembly.objects.create(created_by=user, project=project)
+    layer = _layer(assembly, 0.1, 0.04)
+    store_results([assembly.pk])
+
+    url = reverse("update-layer-thickness", args=[project.pk, assembly.pk, layer.pk])
+    client.post(url, {"thickness": "0.2"})
+
+    layer.refresh_from_db()
+    assembly.refresh_from_db()
+    assert layer.r_value == pytest.approx(5.0)
+    assert assembly.u_value == pytest.approx(0.2)
+
+
+@pytest.mark.django_db
+def test_conductivity_edit_marks_assemblies_stale(user):
+    project = Project.objects.create(create_by=user)
+    assembly = Assembly.objects.create(created_by=user, project=project)
+    material = _layer(assembly, 0.1, 0.04).get_ordered_segments()[0].material
+    other = Assembly.objects.create(created_by=user, project=project)
+    _layer(other, 0.1, 0.04)
+    store_results([assembly.pk, other.pk])
+
+    material = Material.objects.get(pk=material.pk)
+    material.name = "renamed"
+    material.save()
+    assert not Assembly.objects.get(pk=assembly.pk).thermal_stale
+
+    material.conductivity = 0.02
+    material.save()
+    assert Assembly.objects.get(pk=assembly.pk).thermal_stale
+    assert not Assembly.objects.get(pk=other.pk).thermal_stale
+
+    assembly = get_stored_results(Assembly.objects.filter(pk=assembly.pk))[0]
+    assert not assembly.thermal_stale
+    assert assembly.u_value == pytest.approx(0.2)
+
+
+def _stale(assembly: Assembly) -> bool:
+    return Assembly.objects.get(pk=assembly.pk).thermal_stale
+
+
+@pytest.mark.django_db
+def test_layer_and_segment_writes_mark_the_assembly_stale(user):
+    project = Project.objects.create(create_by=user)
+    assembly = Assembly.objects.create(created_by=user, project=project)
+    layer = _layer(assembly, 0.1, 0.04, 0.12)
+    other = _layer(assembly, 0.1, 0.04)
+    segment = layer.get_ordered_segments()[0]
+
+    # -- ie: edits in the admin
+    writes = [
+        lambda: layer.save(),
+        lambda: segment.save(),
+        lambda: LayerSegment.objects.filter(pk=segment.pk).delete(),
+        lambda: layer.segments.get().delete(),
+        lambda: Layer.objects.filter(pk=other.pk).delete(),
+        lambda: layer.delete(),
+    ]
+    for write in writes:
+        store_results([assembly.pk])
+        assert not _stale(assembly)
+        write()
+        assert _stale(assembly)
+
+    assembly = get_stored_results([Assembly.objects.get(pk=assembly.pk)])[0]
+    assert not assembly.thermal_stale
+    assert assembly.u_value is None
+    assert not _stale(assembly)
+
+
+@pytest.mark.django_db
+def test_assembly_view_reads_the_stored_results(user, client):
+    client.force_login(user)
+    project = Project.objects.create(create_by=user)
+    assembly = Assembly.objects.create(created_by=user, project=project)
+    _layer(assembly, 0.1, 0.04)
+    assert _stale(assembly)
+
+    response = client.get(reverse("assembly", args=[project.pk, assembly.pk]))
+    assert "U-Value [W/M2-K]: 0.400" in response.content.decode()
+    assert not _stale(assembly)
+
+
+@pytest.mark.django_db
+def test_layer_edit_sends_the_new_results(user, client):
+    client.force_login(user)
+    project = Project.objects.create(create_by=user)
+    assembly = Assembly.objects.create(created_by=user, project=project)
+    layer = _layer(assembly, 0.1, 0.04)
+
+    url = reverse("update-layer-thickness", args=[project.pk, assembly.pk, layer.pk])
+    html = client.post(url, {"thickness": "0.2"}).content.decode()
+    assert html.split("<", 1)[0].strip() == "0.2"
+    assert 'id="assembly-thermal"' in html and 'hx-swap-oob="true"' in html
+    assert "U-Value [W/M2-K]: 0.200" in html
@@ -1,8 +1,26 @@
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from pytest_django.asserts import assertTemplateUsed
 
-from webportal.models import Material, MaterialCategory, User
+from webportal.benchmarks import BenchmarkScale, seed
+from webportal.factories import MaterialFactory, UserFactory
+from webportal.filters import MaterialCategoryFilter
+from webportal.models import (
+    PUBLIC_LIBRARY_USER_ID,
+    Assembly,
+    Layer,
+    Material,
+    MaterialCategory,
+    Project,
+    User,
+)
+from webportal.resources import MaterialImporter, MaterialResource
+from webportal.views.materials import IMPORT_ERRORS_SHOWN
 
 
 @pytest.mark.django_db
@@ -10,10 +28,8 @@ def test_material_category_filter(user, user_materials, client):
     user = user_materials[0].user
     client.force_login(user)
 
-    # -- Get the first two Primary Keys of MaterialCategory
-    category_primary_keys = MaterialCategory.objects.all()[:2].values_list(
-        "pk", flat=True
-    )
+    # -- Get the first two Primary Keys of the MaterialCategories in use
+    category_primary_keys = sorted({m.category_id for m in user_materials})[:2]
 
     # # -- Filter the Materials
     GET_params = {"category": category_primary_keys}
@@ -135,3 +151,432 @@ def test_delete_material_request(user, material_dict_params, client):
     client.delete(reverse("delete-material", kwargs={"pk": material.pk}))
 
     assert Material.objects.filter(user=user).count() == 0
+
+
+@pytest.mark.django_db
+def test_assembly_view_renders_ordered_layers(user, client):
+    client.force_login(user)
+    project = Project.create_new_project(user, name="project")
+    assembly = Assembly.create_new_assembly(user, name="wall", project=project)
+    first = assembly.add_new_layer()
+    second = assembly.add_new_layer()
+    second.position = first.position - 1
+    second.save()
+
+    response = client.get(reverse("assembly", args=[project.pk, assembly.pk]))
+    assert response.status_code == 200
+    html = response.content.decode()
+    assert html.index(f'id="layer-{second.pk}"') < html.index(f'id="layer-{first.pk}"')
+
+
+@pytest.mark.django_db
+def test_composed_fragments_load_each_object_once(client):
+    data = seed(BenchmarkScale(materials=3, projects=1, layers_per_assembly=2))
+    client.force_login(data.user)
+    project, assembly = data.projects[0], data.assemblies[0]
+
+    requests = [
+        lambda: client.post(reverse("add-new-assembly", args=[project.pk])),
+        lambda: client.get(reverse("delete-assembly", args=[project.pk, assembly.pk])),
+        lambda: client.get(reverse("change-project"), {"project_pk": project.pk}),
+    ]
+    for request in requests:
+        with CaptureQueriesContext(connection) as captured:
+            assert request().status_code == 200
+        project_selects = [
+            q["sql"]
+            for q in captured.captured_queries
+            if q["sql"].startswith("SELECT") and 'FROM "webportal_project"' in q["sql"]
+        ]
+        assert len(project_selects) <= 1, project_selects
+
+
+@pytest.mark.django_db
+def test_assembly_views_only_find_the_teams_objects(client):
+    data = seed(BenchmarkScale(materials=3, projects=1, layers_per_assembly=2))
+    other = seed(
+        BenchmarkScale(materials=3, projects=1, layers_per_assembly=2), username="other"
+    )
+    client.force_login(data.user)
+    project, assembly, layer = other.projects[0], other.assemblies[0], other.layers[0]
+
+    layer_args = [project.pk, assembly.pk, layer.pk]
+    responses = [
+        client.get(reverse("change-project"), {"project_pk": project.pk}),
+        client.get(reverse("assembly", args=[project.pk, assembly.pk])),
+        client.get(reverse("add-layer", args=[project.pk, assembly.pk])),
+        client.post(reverse("add-new-assembly", args=[project.pk])),
+        client.get(reverse("delete-layer", args=layer_args)),
+        client.post(
+            reverse("update-layer-thickness", args=layer_args), {"thickness": 1}
+        ),
+        client.post(reverse("clone-project", args=[project.pk])),
+        # -- Our own Project, but the other team's Assembly
+        client.get(reverse("assembly", args=[data.projects[0].pk, assembly.pk])),
+    ]
+    assert [r.status_code for r in responses] == [404] * len(responses)
+    assert Assembly.objects.filter(project=project).count() == 2
+    assert Layer.objects.filter(pk=layer.pk, thickness=layer.thickness).exists()
+
+
+@pytest.mark.django_db
+def test_materials_cursor_pagination_walks_every_material(
+    user_materials, client, settings
+):
+    settings.PAGE_SIZE = 6
+    user = user_materials[0].user
+    client.force_login(user)
+
+    # -- Forward, through every page
+    seen, pages, cursor = [], [], None
+    while True:
+        params = {"cursor": cursor} if cursor else {}
+        response = client.get(reverse("get-materials"), params)
+        page = response.context["materials"]
+        pages.append(page)
+        seen.extend(material.pk for material in page)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    expected = list(
+        response.context["filter"]
+        .qs.order_by("category_code", "lower_name", "pk")
+        .values_list("pk", flat=True)
+    )
+    assert seen == expected
+    assert len(pages) == 4
+    assert response.context["material_count"] == 20
+
+    # -- And back again from the last page
+    response = client.get(
+        reverse("get-materials"), {"cursor": pages[-1].previous_cursor}
+    )
+    assert [m.pk for m in response.context["materials"]] == [m.pk for m in pages[-2]]
+
+
+@pytest.mark.django_db
+def test_materials_list_follows_the_category_codes_not_their_ids(user, client):
+    client.force_login(user)
+    # -- (The categories are created in CATEGORY_NAMES order: IN, WD, ... AD)
+    for code in ("WD", "IN", "AD"):
+        category = MaterialCategory.objects.get_for_code(code)
+        MaterialFactory(user=user, category=category, name="b")
+        MaterialFactory(user=user, category=category, name="A")
+
+    response = client.get(reverse("get-materials"))
+    materials = response.context["materials"]
+    assert [(m.category.category, m.name) for m in materials] == [
+        ("AD", "A"),
+        ("AD", "b"),
+        ("IN", "A"),
+        ("IN", "b"),
+        ("WD", "A"),
+        ("WD", "b"),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("sort", ["category", "name", "-conductivity"])
+def test_materials_pages_merge_the_users_and_the_public_materials(
+    client, settings, sort
+):
+    settings.PAGE_SIZE = 4
+    public = User.objects.get(pk=PUBLIC_LIBRARY_USER_ID)
+    user = UserFactory()
+    MaterialFactory.create_batch(9, user=public)
+    MaterialFactory.create_batch(9, user=user)
+    MaterialFactory.create_batch(3)
+    client.force_login(user)
+
+    seen, cursor = [], None
+    while True:
+        params = {"sort": sort, **({"cursor": cursor} if cursor else {})}
+        page = client.get(reverse("get-materials"), params).context["materials"]
+        seen.extend(material.pk for material in page)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    numbered = []
+    for number in range(1, 6):
+        response = client.get(reverse("get-materials"), {"sort": sort, "page": number})
+        numbered.extend(material.pk for material in response.context["materials"])
+
+    materials = Material.objects.visible_to(user.pk).with_list_columns("SI")
+    keys = MaterialCategoryFilter.SORT_KEYS[sort]
+    expected = list(materials.order_by(*keys).values_list("pk", flat=True))
+    assert len(expected) == 18
+    assert seen == numbered == expected
+
+
+@pytest.mark.django_db
+def test_materials_cursor_page_queries_do_not_grow(
+    user_materials, client, settings, django_assert_max_num_queries
+):
+    settings.PAGE_SIZE = 5
+    user = user_materials[0].user
+    client.force_login(user)
+
+    response = client.get(reverse("get-materials"))
+    first = response.context["materials"]
+    response = client.get(reverse("get-materials"), {"cursor": first.next_cursor})
+    second = response.context["materials"]
+
+    # -- Count is cached, so a deep page costs the same as the first page
+    with django_assert_max_num_queries(5):
+        response = client.get(reverse("get-materials"), {"cursor": second.next_cursor})
+    assert response.status_code == 200
+    assert response.context["materials"].has_previous
+
+
+@pytest.mark.django_db
+def test_materials_invalid_cursor_returns_first_page(user_materials, client):
+    client.force_login(user_materials[0].user)
+    response = client.get(reverse("get-materials"), {"cursor": "not-a-cursor"})
+    assert response.status_code == 200
+    assert not response.context["materials"].has_previous
+
+
+@pytest.mark.django_db
+def test_materials_numbered_pages_still_supported(user_materials, client, settings):
+    settings.PAGE_SIZE = 6
+    client.force_login(user_materials[0].user)
+    response = client.get(reverse("get-materials"), {"page": 2})
+    page = response.context["materials"]
+    assert page.number == 2
+    assert page.paginator.num_pages == 4
+    assert len(page) == 6
+
+
+@pytest.mark.django_db
+def test_export_csv_streams_same_columns_as_material_resource(user_materials, client):
+    user = user_materials[0].user
+    client.force_login(user)
+    material = user_materials[0]
+    material.source = None
+    material.comments = 'quoted, "comma"\nand newline'
+    material.save()
+
+    response = client.get(reverse("export-csv"))
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Disposition"] == "attachment; filename=ph_materials.csv"
+    streamed = b"".join(response.streaming_content).decode("utf-8")
+
+    queryset = Material.objects.filter(user=user).select_related("category")
+    assert streamed == MaterialResource().export(queryset).csv
+
+
+@pytest.mark.django_db
+def test_material_resource_iter_csv_yields_chunks(user_materials):
+    chunks = list(MaterialResource().iter_csv(Material.objects.all(), chunk_size=5))
+    assert len(chunks) == 4
+    assert "".join(chunks).count("\r\n") == 21
+
+
+def _materials_csv(n_rows: int, uid: str = "") -> str:
+    header = "uid,category,name,conductivity,emissivity,source,comments,color_argb"
+    rows = [
+        f"{uid},Insulation,material {i},0.0{i % 9 + 1},0.9,source,,255,255,255,255"
+        for i in range(n_rows)
+    ]
+    return "\r\n".join([header, *rows]) + "\r\n"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("n_rows", [5, 200])
+def test_import_materials_bulk_creates_with_fixed_queries(
+    user, client, n_rows, django_assert_max_num_queries
+):
+    client.force_login(user)
+    csv_file = SimpleUploadedFile("materials.csv", _materials_csv(n_rows).encode())
+
+    # -- (SQLite's parameter limit splits the 200-row INSERT into 3 batches)
+    with django_assert_max_num_queries(13):
+        response = client.post(reverse("import-materials"), {"file": csv_file})
+    assert response.status_code == 200
+    assert f"{n_rows} materials imported" in response.content.decode()
+    assert Material.objects.filter(user=user).count() == n_rows
+
+
+@pytest.mark.django_db
+def test_import_materials_skips_existing_and_reassigns_used_uids(user, client):
+    client.force_login(user)
+    MaterialImporter(user).import_csv(_materials_csv(3))
+    used_uid = Material.objects.filter(user=user).first().uid
+
+    result = MaterialImporter(user).import_csv(_materials_csv(5, uid=used_uid))
+    assert not result.has_errors()
+    assert result.skipped == 3
+    assert len(result.created) == 2
+    uids = list(Material.objects.values_list("uid", flat=True))
+    assert len(set(uids)) == len(uids) == 5
+
+
+@pytest.mark.django_db
+def test_import_materials_with_errors_writes_nothing(user, client):
+    client.force_login(user)
+    csv_text = _materials_csv(3) + ",Not A Category,bad,-1,2,,,\r\n"
+    result = MaterialImporter(user).import_csv(csv_text)
+    assert len(result.errors) == 1
+    assert result.errors[0].startswith("Line 5:")
+    assert Material.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_import_materials_lists_and_logs_the_row_errors(user, client, caplog):
+    client.force_login(user)
+    bad_row = ",Not A Category,bad,-1,2,,,\r\n"
+    csv_text = _materials_csv(3) + bad_row * (IMPORT_ERRORS_SHOWN + 2)
+    csv_file = SimpleUploadedFile("materials.csv", csv_text.encode())
+
+    response = client.post(reverse("import-materials"), {"file": csv_file})
+    html = response.content.decode()
+    assert f"{IMPORT_ERRORS_SHOWN + 2} row(s) have errors" in html
+    assert "<li>Line 5:" in html
+    assert "... and 2 more" in html
+    assert f"Line {IMPORT_ERRORS_SHOWN + 6}:" in caplog.text
+    assert Material.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_assembly_view_only_renders_selected_material(user, client):
+    client.force_login(user)
+    library = MaterialFactory.create_batch(30, user=user)
+    project = Project.create_new_project(user, name="project")
+    assembly = Assembly.create_new_assembly(user, name="wall", project=project)
+    layer = assembly.add_new_layer()
+    layer.segments.first().set_segment_material(library[0])
+
+    response = client.get(reverse("assembly", args=[project.pk, assembly.pk]))
+    html = response.content.decode()
+    assert html.count("<option") == 2  # -- The empty option, and the selected one
+    assert f'<option value="{library[0].pk}" selected>' in html
+    assert reverse("material-search") in html
+
+
+@pytest.mark.django_db
+def test_read_views_run_under_the_asgi_handler(user):
+    client = AsyncClient()
+    client.force_login(user)
+    material = MaterialFactory.create(user=user, name="asgi material")
+    project = Project.create_new_project(user, name="project")
+    assembly = Assembly.objects.get(project=project)
+    # -- An Assembly with no layers gets its first one when it is opened
+    assembly.layers.all().delete()
+
+    html = async_to_sync(client.get)(
+        reverse("assembly", args=[project.pk, assembly.pk])
+    ).content.decode()
+    layer = assembly.layers.get()
+    assert f'id="layer-{layer.pk}"' in html
+    assert f"id=assembly-{assembly.pk}" in html
+
+    html = async_to_sync(client.get)(
+        reverse("change-project"), {"project_pk": project.pk}
+    ).content.decode()
+    assert project.uid in html
+
+    for params in ({}, {"page": 1}, {"category": material.category_id}):
+        response = async_to_sync(client.get)(reverse("get-materials"), params)
+        assert "asgi material" in response.content.decode(), params
+
+    response = async_to_sync(client.get)(reverse("material-search"), {"term": "asgi"})
+    assert response.json()["results"] == [{"id": material.pk, "text": "asgi material"}]
+
+
+@pytest.mark.django_db
+def test_material_search_prefix_limit_and_cache(
+    user, client, settings, django_assert_max_num_queries
+):
+    settings.MATERIAL_SEARCH_LIMIT = 3
+    client.force_login(user)
+    for name in ["Brick A", "brick B", "Brick C", "Brick D", "Concrete"]:
+        MaterialFactory(user=user, name=name)
+    MaterialFactory(name="Brick of another user")
+
+    response = client.get(reverse("material-search"), {"term": "bri"})
+    data = response.json()
+    assert [r["text"] for r in data["results"]] == ["Brick A", "brick B", "Brick C"]
+    assert data["pagination"]["more"] is True
+
+    response = client.get(reverse("material-search"), {"term": "bri", "page": 2})
+    data = response.json()
+    assert [r["text"] for r in data["results"]] == ["Brick D"]
+    assert data["pagination"]["more"] is False
+
+    # -- Only the session / user and library version lookups, the results come from
+    # -- the cache
+    with django_assert_max_num_queries(3):
+        client.get(reverse("material-search"), {"term": "bri"})
+
+
+@pytest.mark.django_db
+def test_materials_table_fragment_is_cached_until_library_changes(
+    user_materials,
+    client,
+    django_assert_max_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    user = user_materials[0].user
+    client.force_login(user)
+    material = user_materials[0]
+    params = {"category": material.category_id}
+    first = client.get(reverse("get-materials"), params).content
+
+    # -- A repeat request is served from the cache: only the session / user and
+    # -- library version queries
+    with django_assert_max_num_queries(3):
+        assert client.get(reverse("get-materials"), params).content == first
+
+    # -- Changing a Material bumps the library version
+    with django_capture_on_commit_callbacks(execute=True):
+        material.name = "AAA renamed material"
+        material.save()
+    html = client.get(reverse("get-materials"), params).content.decode()
+    assert "AAA renamed material" in html
+
+    # -- So does an import
+    with django_capture_on_commit_callbacks(execute=True):
+        MaterialImporter(user).import_csv(_materials_csv(1))
+    html = client.get(reverse("get-materials"), {"cursor": ""}).content.decode()
+    assert "21 materials" in html
+
+
+@pytest.mark.django_db
+def test_materials_sort_and_filter_by_ip_resistivity(user, client, settings):
+    settings.PAGE_SIZE = 2
+    client.force_login(user)
+    for conductivity in [0.02, 0.035, 0.04, 0.13, 1.4]:
+        MaterialFactory(user=user, conductivity=conductivity)
+    client.post(reverse("set-unit-system"), {"unit-system": "on"})
+
+    # -- R > 4 per inch [IP] ie: conductivity < 0.0361 W/(m-K)
+    params = {"resistivity_min": 4, "sort": "-resistivity"}
+    response = client.get(reverse("get-materials"), params)
+    page = response.context["materials"]
+    assert [m.conductivity for m in page] == [0.02, 0.035]
+    assert not page.has_next
+    assert page.object_list[0].display_resistivity == pytest.approx(
+        1 / (0.02 * 0.577789236 * 12)
+    )
+
+    # -- Sorted by resistivity, lowest first, across pages
+    params = {"sort": "resistivity"}
+    first = client.get(reverse("get-materials"), params).context["materials"]
+    params["cursor"] = first.next_cursor
+    second = client.get(reverse("get-materials"), params).context["materials"]
+    assert [m.conductivity for m in [*first, *second]] == [1.4, 0.13, 0.04, 0.035]
+
+
+@pytest.mark.django_db
+def test_materials_si_conductivity_range_filter(user, client):
+    client.force_login(user)
+    for conductivity in [0.02, 0.04, 0.13, 1.4]:
+        MaterialFactory(user=user, conductivity=conductivity)
+
+    params = {"conductivity_min": 0.03, "conductivity_max": 0.2}
+    materials = client.get(reverse("get-materials"), params).context["materials"]
+    assert sorted(m.conductivity for m in materials) == [0.04, 0.13]
+    assert {m.display_resistivity for m in materials} == {1 / 0.04, 1 / 0.13}
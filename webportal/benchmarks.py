@@ -0,0 +1,654 @@
+"""Endpoint benchmarks against large, synthetic datasets.
+
+`seed` fills the database with a realistic amount of data (by default 100k
+Materials, 1k Projects and 50-layer Assemblies) using bulk inserts, and
+`run_benchmarks` then times the key endpoints through the Django test Client,
+reporting the p50 / p95 latency and the SQL query count of each.
+
+Results can be saved as a baseline (JSON) and later runs compared against it:
+any endpoint which runs more queries than the baseline, or whose p95 latency is
+more than `tolerance` times the baseline's, is reported as a regression.
+
+`run_concurrency` instead measures the throughput of the read-only (HTMX)
+endpoints with many concurrent clients, through both request handlers: the WSGI
+handler on a fixed pool of worker threads (like a threaded WSGI server), and the
+ASGI handler on a single event loop (like an ASGI server). Both run in-process,
+on the same hardware and database, so only the handler and the view code differ.
+
+`run_fragments` is a micro-benchmark of the hottest HTMX fragments (named template
+blocks): the render time of each with django-render-block's
+`render_block_to_string` (before) and with `webportal.fragments.render_fragment`
+(after), from the same, pre-loaded, context.
+
+Run with: 'python manage.py benchmark' (see the command for the options).
+"""
+
+import asyncio
+import contextlib
+import inspect
+import io
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, connection
+from django.template import Context, Template
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from render_block import render_block_to_string
+
+from webportal.fragments import render_fragment
+from webportal.models import (
+    POSITION_GAP,
+    Assembly,
+    Layer,
+    LayerSegment,
+    Material,
+    MaterialCategory,
+    Project,
+    User,
+)
+from webportal.views._types import LayerView
+
+BULK_BATCH_SIZE = 5_000
+
+
+@dataclass
+class BenchmarkScale:
+    """The size of the synthetic dataset."""
+
+    materials: int = 100_000
+    projects: int = 1_000
+    assemblies_per_project: int = 2
+    layers_per_assembly: int = 50
+    segments_per_layer: int = 1
+    import_rows: int = 1_000
+
+
+@dataclass
+class BenchmarkData:
+    """The seeded objects which the benchmark requests are built from."""
+
+    user: User
+    projects: list[Project]
+    assemblies: list[Assembly]
+    layers: list[Layer]
+    segments: list[LayerSegment]
+    materials: list[Material]
+
+
+@dataclass
+class BenchmarkResult:
+    """The timings (in milliseconds) and query count of one endpoint."""
+
+    name: str
+    samples: int
+    p50_ms: float
+    p95_ms: float
+    max_ms: float
+    queries: int
+    status_codes: list[int] = field(default_factory=list)
+
+
+@dataclass
+class ConcurrencyResult:
+    """The throughput and latency (in milliseconds) of one handler, at one load."""
+
+    handler: str
+    clients: int
+    requests: int
+    seconds: float
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    errors: int
+
+
+@dataclass
+class FragmentResult:
+    """The render time (in microseconds) of one template block, before and after."""
+
+    name: str
+    renders: int
+    before_p50_us: float
+    after_p50_us: float
+    speedup: float
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return the nearest-rank percentile of the values (pct in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+# ---------------------------------------------------------------------------------------
+# -- Seeding
+
+
+def seed(scale: BenchmarkScale, username: str = "benchmark") -> BenchmarkData:
+    """Bulk-insert the synthetic dataset, owned by a (paid) benchmark user."""
+    rand = random.Random(0)
+    # -- Saved first, as User.save creates a paid user's Team with created_by=user
+    user = User.objects.create(username=username)
+    user.is_paid_user, user.team = True, None
+    user.save()
+    categories = [
+        MaterialCategory.objects.get_for_code(code)
+        for code in MaterialCategory.CATEGORY_NAMES
+    ]
+
+    materials = Material.objects.bulk_create(
+        (
+            Material(
+                user=user,
+                name=f"material {i:06d}",
+                conductivity=rand.uniform(0.02, 50.0),
+                emissivity=rand.uniform(0.1, 1.0),
+                source="benchmark",
+                color_argb="255,255,255,255",
+                category=categories[i % len(categories)],
+            )
+            for i in range(scale.materials)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+    projects = Project.objects.bulk_create(
+        (Project(create_by=user, name=f"project {i}") for i in range(scale.projects)),
+        batch_size=BULK_BATCH_SIZE,
+    )
+    # -- Children are created in display order, with sparse positions
+    assemblies = Assembly.objects.bulk_create(
+        (
+            Assembly(
+                project=project,
+                created_by=user,
+                name=f"assembly {i}",
+                position=(i + 1) * POSITION_GAP,
+            )
+            for project in projects
+            for i in range(scale.assemblies_per_project)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+    layers = Layer.objects.bulk_create(
+        (
+            Layer(
+                assembly=assembly,
+                thickness=rand.uniform(0.01, 0.3),
+                position=(i + 1) * POSITION_GAP,
+            )
+            for assembly in assemblies
+            for i in range(scale.layers_per_assembly)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+    segments = LayerSegment.objects.bulk_create(
+        (
+            LayerSegment(
+                layer=layer,
+                material=rand.choice(materials) if materials else None,
+                position=(i + 1) * POSITION_GAP,
+            )
+            for layer in layers
+            for i in range(scale.segments_per_layer)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+    return BenchmarkData(user, projects, assemblies, layers, segments, materials)
+
+
+def _import_csv(n_rows: int, run: int) -> SimpleUploadedFile:
+    """A Materials CSV with new (not yet imported) names for each run."""
+    header = "uid,category,name,conductivity,emissivity,source,comments,color_argb"
+    rows = [
+        f",Insulation,import {run}-{i},0.035,0.9,benchmark,,255,255,255,255"
+        for i in range(n_rows)
+    ]
+    content = "\r\n".join([header, *rows]) + "\r\n"
+    return SimpleUploadedFile("materials.csv", content.encode("utf-8"))
+
+
+# ---------------------------------------------------------------------------------------
+# -- Endpoints
+
+
+@dataclass
+class Endpoint:
+    """A benchmarked endpoint: a function which makes the i-th request."""
+
+    name: str
+    request: Callable[[Client, BenchmarkData, BenchmarkScale, int], object]
+
+
+def _get(url_name: str, **kwargs) -> Callable:
+    def request(client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int):
+        return client.get(reverse(url_name), **kwargs)
+
+    return request
+
+
+def _assembly(client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int):
+    assembly = data.assemblies[i % len(data.assemblies)]
+    return client.get(reverse("assembly", args=[assembly.project_id, assembly.pk]))
+
+
+def _change_project(client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int):
+    project = data.projects[i % len(data.projects)]
+    return client.get(reverse("change-project"), {"project_pk": project.pk})
+
+
+def _export_csv(client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int):
+    response = client.get(reverse("export-csv"))
+    # -- Consume the streamed rows, so they are part of the timing
+    b"".join(response.streaming_content)  # type: ignore
+    return response
+
+
+def _project_constructions(
+    client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int
+):
+    project = data.projects[i % len(data.projects)]
+    response = client.get(reverse("api-project-constructions", args=[project.pk]))
+    b"".join(response.streaming_content)  # type: ignore
+    return response
+
+
+def _import_materials(
+    client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int
+):
+    csv_file = _import_csv(scale.import_rows, i)
+    return client.post(reverse("import-materials"), {"file": csv_file})
+
+
+def _update_layer_material(
+    client: Client, data: BenchmarkData, scale: BenchmarkScale, i: int
+):
+    n = i % len(data.layers)
+    layer = data.layers[n]
+    segment_pk = data.segments[n * scale.segments_per_layer].pk
+    material = data.materials[i % len(data.materials)]
+    assembly = next(a for a in data.assemblies if a.pk == layer.assembly_id)  # type: ignore
+    url = reverse(
+        "update-layer-material",
+        args=[assembly.project_id, assembly.pk, layer.pk],  # type: ignore
+    )
+    return client.post(url, {f"form_{segment_pk}-material": material.pk})
+
+
+ENDPOINTS = [
+    Endpoint("materials_list", _get("materials-list")),
+    Endpoint("get_materials", _get("get-materials")),
+    Endpoint("assembly", _assembly),
+    Endpoint("change_project", _change_project),
+    Endpoint("export_csv", _export_csv),
+    Endpoint("project_constructions", _project_constructions),
+    Endpoint("import_materials", _import_materials),
+    Endpoint("update_layer_material", _update_layer_material),
+]
+
+
+def run_endpoint(
+    endpoint: Endpoint,
+    client: Client,
+    data: BenchmarkData,
+    scale: BenchmarkScale,
+    repeat: int,
+    warm_cache: bool = False,
+) -> BenchmarkResult:
+    """Time `repeat` requests to the endpoint.
+
+    The cache is cleared before every request unless `warm_cache` is set, so by
+    default the timings are for the uncached (worst-case) path.
+    """
+    timings: list[float] = []
+    queries: list[int] = []
+    status_codes: list[int] = []
+    for i in range(repeat):
+        if not warm_cache:
+            cache.clear()
+        # -- The views print a trace line for every request, keep them out of the report
+        with CaptureQueriesContext(connection) as captured, contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            start = time.perf_counter()
+            response = endpoint.request(client, data, scale, i)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+        status_codes.append(response.status_code)  # type: ignore
+
+    return BenchmarkResult(
+        name=endpoint.name,
+        samples=repeat,
+        p50_ms=round(percentile(timings, 50), 3),
+        p95_ms=round(percentile(timings, 95), 3),
+        max_ms=round(max(timings), 3),
+        queries=max(queries),
+        status_codes=sorted(set(status_codes)),
+    )
+
+
+def run_benchmarks(
+    data: BenchmarkData,
+    scale: BenchmarkScale,
+    repeat: int = 20,
+    endpoints: list[Endpoint] | None = None,
+    warm_cache: bool = False,
+) -> list[BenchmarkResult]:
+    """Run every endpoint's benchmark, as the seeded benchmark user."""
+    client = Client()
+    client.force_login(data.user)
+    return [
+        run_endpoint(endpoint, client, data, scale, repeat, warm_cache)
+        for endpoint in (endpoints or ENDPOINTS)
+    ]
+
+
+# ---------------------------------------------------------------------------------------
+# -- Baselines
+
+
+def save_baseline(
+    path: Path, scale: BenchmarkScale, results: list[BenchmarkResult]
+) -> None:
+    """Write the results (and the scale they were measured at) as a JSON baseline."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    baseline = {
+        "scale": asdict(scale),
+        "results": {result.name: asdict(result) for result in results},
+    }
+    path.write_text(json.dumps(baseline, indent=2) + "\n")
+
+
+def load_baseline(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def find_regressions(
+    results: list[BenchmarkResult], baseline: dict, tolerance: float = 1.5
+) -> list[str]:
+    """Return a description of every result which is worse than the baseline."""
+    regressions = []
+    baseline_results = baseline.get("results", {})
+    for result in results:
+        if result.status_codes != [200]:
+            regressions.append(f"{result.name}: status codes {result.status_codes}")
+        if not (base := baseline_results.get(result.name)):
+            continue
+        if result.queries > base["queries"]:
+            regressions.append(
+                f"{result.name}: {result.queries} queries (baseline {base['queries']})"
+            )
+        if result.p95_ms > base["p95_ms"] * tolerance:
+            regressions.append(
+                f"{result.name}: p95 {result.p95_ms:.1f} ms "
+                f"(baseline {base['p95_ms']:.1f} ms x {tolerance})"
+            )
+    return regressions
+
+
+# ---------------------------------------------------------------------------------------
+# -- Concurrency
+
+# -- The read-only endpoints, which have async views
+CONCURRENCY_ENDPOINTS = [
+    endpoint
+    for endpoint in ENDPOINTS
+    if endpoint.name
+    in ("materials_list", "get_materials", "assembly", "change_project")
+]
+
+
+@contextlib.contextmanager
+def _uninstrumented_templates():
+    """Render the templates without the test environment's 'template_rendered' signal.
+
+    Every in-flight test client receives the signal for every render, which would
+    make the cost of a render grow with the number of concurrent requests.
+    """
+    instrumented = Template._render
+    # -- The debug-toolbar (first) or the test environment saved the original render
+    Template._render = getattr(
+        Template, "original_render", getattr(Template, "_original_render", instrumented)
+    )
+    try:
+        yield
+    finally:
+        Template._render = instrumented
+
+
+def _concurrency_result(
+    handler: str,
+    clients: int,
+    seconds: float,
+    timings: list[float],
+    status_codes: list[int],
+) -> ConcurrencyResult:
+    return ConcurrencyResult(
+        handler=handler,
+        clients=clients,
+        requests=len(timings),
+        seconds=round(seconds, 3),
+        requests_per_second=round(len(timings) / seconds, 1) if seconds else 0.0,
+        p50_ms=round(percentile(timings, 50), 3),
+        p95_ms=round(percentile(timings, 95), 3),
+        errors=sum(status != 200 for status in status_codes),
+    )
+
+
+def _run_wsgi(
+    data: BenchmarkData,
+    scale: BenchmarkScale,
+    clients: int,
+    requests_per_client: int,
+    endpoints: list[Endpoint],
+    threads: int,
+    cookies,
+) -> ConcurrencyResult:
+    """Each client's requests queue for one of the `threads` WSGI worker threads."""
+    workers = threading.local()
+    timings: list[float] = []
+    status_codes: list[int] = []
+
+    def handle(endpoint: Endpoint, i: int) -> int:
+        if (client := getattr(workers, "client", None)) is None:
+            client = workers.client = Client()
+            client.cookies.update(cookies)
+        try:
+            return endpoint.request(client, data, scale, i).status_code  # type: ignore
+        finally:
+            close_old_connections()
+
+    def run_client(pool: ThreadPoolExecutor, n: int) -> None:
+        for i in range(requests_per_client):
+            endpoint = endpoints[(n + i) % len(endpoints)]
+            start = time.perf_counter()
+            status = pool.submit(handle, endpoint, n * requests_per_client + i).result()
+            timings.append((time.perf_counter() - start) * 1000)
+            status_codes.append(status)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        client_threads = [
+            threading.Thread(target=run_client, args=(pool, n)) for n in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in client_threads:
+            thread.start()
+        for thread in client_threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+    return _concurrency_result("wsgi", clients, seconds, timings, status_codes)
+
+
+async def _run_asgi(
+    data: BenchmarkData,
+    scale: BenchmarkScale,
+    clients: int,
+    requests_per_client: int,
+    endpoints: list[Endpoint],
+    cookies,
+) -> ConcurrencyResult:
+    """All of the clients' requests are handled concurrently, on one event loop."""
+    timings: list[float] = []
+    status_codes: list[int] = []
+
+    async def run_client(n: int) -> None:
+        client = AsyncClient()
+        client.cookies.update(cookies)
+        for i in range(requests_per_client):
+            endpoint = endpoints[(n + i) % len(endpoints)]
+            start = time.perf_counter()
+            # -- Like the ASGI handler: each request's sync code gets its own thread
+            async with ThreadSensitiveContext():
+                response = endpoint.request(
+                    client, data, scale, n * requests_per_client + i  # type: ignore
+                )
+                if inspect.isawaitable(response):
+                    response = await response
+                await sync_to_async(close_old_connections)()
+            timings.append((time.perf_counter() - start) * 1000)
+            status_codes.append(response.status_code)  # type: ignore
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(n) for n in range(clients)))
+    seconds = time.perf_counter() - start
+    return _concurrency_result("asgi", clients, seconds, timings, status_codes)
+
+
+def run_concurrency(
+    data: BenchmarkData,
+    scale: BenchmarkScale,
+    clients: list[int],
+    requests_per_client: int = 5,
+    wsgi_threads: int = 8,
+    endpoints: list[Endpoint] | None = None,
+) -> list[ConcurrencyResult]:
+    """Compare the WSGI and ASGI throughput with each number of concurrent clients.
+
+    The clients request the endpoints in turn, as the seeded benchmark user, with
+    a warm cache (as repeated HTMX requests would be).
+    """
+    login = Client()
+    login.force_login(data.user)
+    endpoints = endpoints or CONCURRENCY_ENDPOINTS
+
+    results = []
+    # -- The views print a trace line for every request, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()), _uninstrumented_templates():
+        for n in clients:
+            results.append(
+                _run_wsgi(
+                    data,
+                    scale,
+                    n,
+                    requests_per_client,
+                    endpoints,
+                    wsgi_threads,
+                    login.cookies,
+                )
+            )
+            # -- On a new thread, like a server's event loop, so no (async_to_sync)
+            # -- state of the calling thread is picked up by the event loop
+            with ThreadPoolExecutor(max_workers=1) as loop_thread:
+                asgi = loop_thread.submit(
+                    asyncio.run,
+                    _run_asgi(
+                        data, scale, n, requests_per_client, endpoints, login.cookies
+                    ),
+                )
+                results.append(asgi.result())
+    return results
+
+
+# ---------------------------------------------------------------------------------------
+# -- Fragments
+
+
+def _fragment_contexts(data: BenchmarkData) -> dict[str, tuple[str, str, dict]]:
+    """The (template, block, context) of the hottest fragments, with all data loaded."""
+    assembly = Assembly.load_tree(data.assemblies[0].pk)  # type: ignore
+    project = assembly.project
+    assemblies = list(Assembly.objects.filter(project=project))
+    layer = assembly.get_ordered_layers()[0]
+    user = User.objects.select_related("team").get(pk=data.user.pk)
+    team_members = list(user.team_members)
+
+    assembly_template = "webportal/partials/assemblies/assembly.html"
+    return {
+        "assembly-sidebar-list": (
+            "webportal/partials/assemblies/sidebar.html",
+            "assembly-sidebar-list",
+            {
+                "assemblies": assemblies,
+                "active_assembly_id": assembly.pk,
+                "active_project": project,
+            },
+        ),
+        "assembly-name": (
+            assembly_template,
+            "assembly-name",
+            {"assembly": assembly, "active_project": project},
+        ),
+        "layer": (
+            assembly_template,
+            "layer",
+            {
+                "assembly": assembly,
+                "layer_view": LayerView(layer),
+                "active_project": project,
+            },
+        ),
+        "teams": (
+            "webportal/partials/account_settings/settings.html",
+            "teams",
+            {"user": user, "team": user.team, "team_members": team_members},
+        ),
+    }
+
+
+def _time_renders(render: Callable, args: tuple, renders: int) -> list[float]:
+    render(*args)  # -- warm up (load and compile the template)
+    timings = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        render(*args)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+
+def run_fragments(data: BenchmarkData, renders: int = 1_000) -> list[FragmentResult]:
+    """Time the render of each fragment with render_block_to_string and render_fragment."""
+    results = []
+    with _uninstrumented_templates():
+        for name, (template_name, block_name, values) in _fragment_contexts(
+            data
+        ).items():
+            args = (template_name, block_name, Context(values))
+            before = percentile(
+                _time_renders(render_block_to_string, args, renders), 50
+            )
+            after = percentile(_time_renders(render_fragment, args, renders), 50)
+            results.append(
+                FragmentResult(
+                    name=name,
+                    renders=renders,
+                    before_p50_us=round(before, 1),
+                    after_p50_us=round(after, 1),
+                    speedup=round(before / after, 2) if after else 0.0,
+                )
+            )
+    return results
@@ -0,0 +1,57 @@
+"""Versions for the cached material-library responses.
+
+The version of a user's visible library (their own Materials plus the public
+ones) is the version of the latest change to it in the change-log (see
+MaterialChange): it is read from the database, so every worker process sees a
+change as soon as it is committed. Cache keys for anything built from the
+library include the version, so a change makes the old entries unreachable
+instead of having to find and delete them.
+
+The version must be read before the Materials are: a change committed in between
+then only caches the new rows under the old key, never the old rows under the
+new one.
+"""
+
+import hashlib
+
+from django.core.handlers.wsgi import WSGIRequest
+
+from webportal.models import MaterialChange
+
+
+def visible_library_version(request: WSGIRequest) -> int:
+    """Return the version of the request-user's visible material library.
+
+    Read once per request, so that everything the request caches has one version.
+    """
+    if not hasattr(request, "_library_version"):
+        user_pk = request.user.pk
+        request._library_version = MaterialChange.objects.latest_version(user_pk)
+    return request._library_version
+
+
+async def avisible_library_version(request: WSGIRequest, user_pk: int) -> int:
+    """The async version of visible_library_version, for the (already loaded) user."""
+    if not hasattr(request, "_library_version"):
+        version = await MaterialChange.objects.alatest_version(user_pk)
+        request._library_version = version
+    return request._library_version
+
+
+def _cache_key(prefix: str, user_pk: int, version: int, parts: tuple) -> str:
+    digest = hashlib.md5(repr((version, *parts)).encode("utf-8")).hexdigest()
+    return f"{prefix}:{user_pk}:{digest}"
+
+
+def library_cache_key(prefix: str, request: WSGIRequest, *parts) -> str:
+    """Return a cache key for data built from the request-user's visible library."""
+    version = visible_library_version(request)
+    return _cache_key(prefix, request.user.pk, version, parts)
+
+
+async def alibrary_cache_key(
+    prefix: str, request: WSGIRequest, user_pk: int, *parts
+) -> str:
+    """The async version of library_cache_key, for the (already loaded) user."""
+    version = await avisible_library_version(request, user_pk)
+    return _cache_key(prefix, user_pk, version, parts)
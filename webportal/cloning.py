@@ -0,0 +1,84 @@
+"""Deep copies of a Project or an Assembly, with all of their layers and segments.
+
+The source tree is loaded with a fixed number of prefetch queries, and each level
+of the copy (assemblies, layers, segments) is written with a single `bulk_create`
+and a single UID-allocation query. A clone therefore takes the same number of
+queries however many assemblies, layers or segments it has.
+
+Sibling positions are copied as they are, so the copies keep their order. The
+stored thermal results are copied too, as the copy is identical.
+"""
+
+from django.db import models, transaction
+
+from webportal.models import Assembly, Layer, LayerSegment, Project, User, next_position
+
+COPY_SUFFIX = " (copy)"
+
+
+def _copy(obj: models.Model, **changes) -> models.Model:
+    """An unsaved copy of the object. It gets a new pk and UID when created."""
+    values = {
+        field.attname: getattr(obj, field.attname)
+        for field in obj._meta.concrete_fields
+        if not field.primary_key and field.name not in ("uid", "created_at", *changes)
+    }
+    return type(obj)(**values, **changes)
+
+
+def _copy_name(source: Project | Assembly) -> str:
+    """The source's name with the COPY_SUFFIX, cut to fit the name column."""
+    max_length = type(source)._meta.get_field("name").max_length
+    return source.name[: max_length - len(COPY_SUFFIX)] + COPY_SUFFIX
+
+
+def _clone_layers(assemblies: list[tuple[Assembly, Assembly]]) -> None:
+    """Copy the layers and segments of each (source, copy) pair of Assemblies."""
+    layers = [
+        (layer, _copy(layer, assembly=copy))
+        for source, copy in assemblies
+        for layer in source.get_ordered_layers()
+    ]
+    Layer.objects.bulk_create([copy for _, copy in layers])
+    LayerSegment.objects.bulk_create(
+        [
+            _copy(segment, layer=copy)
+            for source, copy in layers
+            for segment in source.get_ordered_segments()
+        ]
+    )
+
+
+def clone_assembly(project_pk: int, assembly_pk: int, user: User) -> Assembly:
+    """Copy the Assembly to the end of its Project.
+
+    Raises Assembly.DoesNotExist if the Assembly is not in the Project.
+    """
+    with transaction.atomic():
+        source = Assembly.objects.with_layer_tree().get(
+            pk=assembly_pk, project_id=project_pk
+        )
+        clone = _copy(
+            source,
+            name=_copy_name(source),
+            created_by=user,
+            position=next_position(Assembly.objects.filter(project_id=project_pk)),
+        )
+        Assembly.objects.bulk_create([clone])
+        _clone_layers([(source, clone)])
+    return clone
+
+
+def clone_project(project_pk: int, user: User) -> Project:
+    """Copy the Project, with all of its Assemblies."""
+    with transaction.atomic():
+        source = Project.objects.with_assembly_tree().get(pk=project_pk)
+        clone = _copy(source, name=_copy_name(source), create_by=user)
+        Project.objects.bulk_create([clone])
+        assemblies = [
+            (assembly, _copy(assembly, project=clone, created_by=user))
+            for assembly in source.get_ordered_assemblies()
+        ]
+        Assembly.objects.bulk_create([copy for _, copy in assemblies])
+        _clone_layers(assemblies)
+    return clone
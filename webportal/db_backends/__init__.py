@@ -0,0 +1,141 @@
+"""Database backends which record the lifecycle of their connections.
+
+Use 'webportal.db_backends.postgresql' or 'webportal.db_backends.sqlite3' as the
+database ENGINE. They are Django's own backends, plus `ConnectionLifecycleMixin`,
+which keeps these statistics for each database alias:
+
+    * open: connections held by a worker thread (in use or idle)
+    * in_use: connections checked out by a request (or command), ie: used since
+      the start of the request
+    * waiting: requests waiting for a connection from the pool
+    * opened / reused: new connections, and checkouts of an already-open one
+    * health_check_failures: open connections found broken before being reused
+    * connect latency: the time to open a connection (or take one from the pool)
+
+How connections are kept between requests is set in the DATABASES settings:
+persistent connections ('CONN_MAX_AGE', health-checked before re-use with
+'CONN_HEALTH_CHECKS'), or a psycopg (3) connection pool ('OPTIONS': {'pool': ...}),
+which also reports the pool size and its waiting requests.
+
+Connections belong to a thread, so the statistics are kept per process, behind a
+lock: they are shared by every thread of a threaded (WSGI) worker, and by the
+per-request threads which run the sync code of an async (ASGI) worker.
+"""
+
+import threading
+import time
+
+from webportal.metrics import Histogram
+
+CONNECT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class ConnectionStats:
+    """The connection counters and gauges of one database alias."""
+
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.opened = 0
+        self.reused = 0
+        self.health_check_failures = 0
+        self.connect_seconds = Histogram(CONNECT_BUCKETS)
+        self.pool = None
+        self._lock = threading.Lock()
+
+    def add(self, **changes: int) -> None:
+        with self._lock:
+            for name, change in changes.items():
+                setattr(self, name, getattr(self, name) + change)
+
+    def snapshot(self) -> dict:
+        """The current values, with the pool's size and waiting requests (if any)."""
+        with self._lock:
+            values = {
+                "open": self.open,
+                "in_use": self.in_use,
+                "waiting": 0,
+                "opened": self.opened,
+                "reused": self.reused,
+                "health_check_failures": self.health_check_failures,
+            }
+        if self.pool is not None:
+            pool_stats = self.pool.get_stats()
+            values["waiting"] = pool_stats.get("requests_waiting", 0)
+            values["pool_size"] = pool_stats.get("pool_size", 0)
+            values["pool_available"] = pool_stats.get("pool_available", 0)
+        return values
+
+
+_stats: dict[str, ConnectionStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_connection_stats(alias: str) -> ConnectionStats:
+    if (stats := _stats.get(alias)) is None:
+        with _stats_lock:
+            stats = _stats.setdefault(alias, ConnectionStats())
+    return stats
+
+
+def all_connection_stats() -> dict[str, ConnectionStats]:
+    """The statistics of every database alias which has opened a connection."""
+    with _stats_lock:
+        return dict(sorted(_stats.items()))
+
+
+class ConnectionLifecycleMixin:
+    """Record the opening, checkout, health-checks and closing of the connection.
+
+    A connection is checked out when it is first used, and checked back in when
+    Django closes it, or (re-)checks it at the start and end of each request.
+    """
+
+    checked_out = False
+
+    @property
+    def connection_stats(self) -> ConnectionStats:
+        return get_connection_stats(self.alias)  # type: ignore
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+        connection = super().get_new_connection(conn_params)  # type: ignore
+        stats = self.connection_stats
+        stats.connect_seconds.observe(time.perf_counter() - start)
+        stats.add(opened=1, open=1, in_use=int(not self.checked_out))
+        stats.pool = getattr(self, "pool", None)
+        self.checked_out = True
+        return connection
+
+    def ensure_connection(self):
+        super().ensure_connection()  # type: ignore
+        # -- (A new connection was checked out as it was opened)
+        if not self.checked_out:
+            self.checked_out = True
+            self.connection_stats.add(in_use=1, reused=1)
+
+    def _check_in(self) -> None:
+        if self.checked_out:
+            self.checked_out = False
+            self.connection_stats.add(in_use=-1)
+
+    def close(self):
+        was_open = self.connection is not None  # type: ignore
+        try:
+            super().close()  # type: ignore
+        finally:
+            # -- (An in-memory SQLite database is never closed)
+            if was_open and self.connection is None:  # type: ignore
+                self._check_in()
+                self.connection_stats.add(open=-1)
+
+    def close_if_health_check_failed(self):
+        was_open = self.connection is not None  # type: ignore
+        super().close_if_health_check_failed()  # type: ignore
+        if was_open and self.connection is None:  # type: ignore
+            self.connection_stats.add(health_check_failures=1)
+
+    def close_if_unusable_or_obsolete(self):
+        # -- Called at the start and end of every request
+        super().close_if_unusable_or_obsolete()  # type: ignore
+        self._check_in()
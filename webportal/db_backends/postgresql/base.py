@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from webportal.db_backends import ConnectionLifecycleMixin
+
+
+class DatabaseWrapper(ConnectionLifecycleMixin, base.DatabaseWrapper):
+    pass
@@ -18,14 +18,13 @@ class MaterialCategoryFactory(factory.django.DjangoModelFactory):
         model = MaterialCategory
 
     category = factory.Faker(
-        "random_element", elements=[x[0] for x in MaterialCategory.MATERIAL_CATEGORIES]
+        "random_element", elements=list(MaterialCategory.CATEGORY_NAMES)
     )
 
     @classmethod
     def _create(cls, model_class, *args, **kwargs):
-        # Use get_or_create to avoid creating duplicate categories
-        category, created = model_class.objects.get_or_create(**kwargs)
-        return category
+        # Use the cached categories to avoid creating duplicate categories
+        return model_class.objects.get_for_code(kwargs["category"])
 
 
 class MaterialFactory(factory.django.DjangoModelFactory):
@@ -1,14 +1,108 @@
 import django_filters
 from django import forms
+from django_filters import fields
 
+from webportal.forms import MaterialCategoryChoiceIterator
 from webportal.models import Material, MaterialCategory
 
 
+class MaterialCategoryFilterChoiceIterator(
+    fields.ModelChoiceIterator, MaterialCategoryChoiceIterator
+):
+    pass
+
+
+class MaterialCategoryMultipleChoiceField(fields.ModelMultipleChoiceField):
+    """Multiple MaterialCategory choice field which reads the cached categories."""
+
+    iterator = MaterialCategoryFilterChoiceIterator
+
+    def _check_values(self, value) -> list[MaterialCategory]:
+        categories = {
+            str(category.pk): category
+            for category in MaterialCategory.objects.get_all_cached()
+        }
+        result = []
+        for pk in dict.fromkeys(value):
+            if str(pk) not in categories:
+                raise forms.ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": pk},
+                )
+            result.append(categories[str(pk)])
+        return result
+
+
+class MaterialCategoryMultipleChoiceFilter(django_filters.ModelMultipleChoiceFilter):
+    field_class = MaterialCategoryMultipleChoiceField
+
+
 class MaterialCategoryFilter(django_filters.FilterSet):
+    # -- The keyset (cursor) pagination keys for each sort order
+    SORT_KEYS = {
+        "category": ("category_code", "lower_name", "pk"),
+        "name": ("lower_name", "pk"),
+        # -- (Ties in the same direction, so the index can be read backwards)
+        "conductivity": ("conductivity", "pk"),
+        "-conductivity": ("-conductivity", "-pk"),
+        # -- Resistivity sorts in the opposite direction to the conductivity
+        "resistivity": ("-conductivity", "-pk"),
+        "-resistivity": ("conductivity", "pk"),
+    }
+    SORT_CHOICES = (
+        ("category", "Category"),
+        ("name", "Name"),
+        ("conductivity", "Conductivity (low-high)"),
+        ("-conductivity", "Conductivity (high-low)"),
+        ("resistivity", "Resistivity (low-high)"),
+        ("-resistivity", "Resistivity (high-low)"),
+    )
 
-    category = django_filters.ModelMultipleChoiceFilter(
-        queryset=MaterialCategory.objects.all(), widget=forms.CheckboxSelectMultiple()
+    category = MaterialCategoryMultipleChoiceFilter(
+        queryset=MaterialCategory.objects.all(),
+        widget=forms.CheckboxSelectMultiple(),
+        method="filter_category",
+    )
+    sort = django_filters.ChoiceFilter(
+        label="Sort by",
+        choices=SORT_CHOICES,
+        empty_label=None,
+        method="sort_materials",
     )
+    conductivity_min = django_filters.NumberFilter(method="filter_conductivity")
+    conductivity_max = django_filters.NumberFilter(method="filter_conductivity")
+    resistivity_min = django_filters.NumberFilter(method="filter_resistivity")
+    resistivity_max = django_filters.NumberFilter(method="filter_resistivity")
+
+    @property
+    def unit_system(self) -> str:
+        if self.request is None:
+            return "SI"
+        return self.request.session.get("unit_system", "SI")
+
+    @property
+    def sort_keys(self) -> tuple[str, ...]:
+        """The ordering of the filtered materials, as keyset pagination keys."""
+        sort = self.form.cleaned_data.get("sort") if self.is_valid() else None
+        return self.SORT_KEYS[sort or "category"]
+
+    def sort_materials(self, queryset, name, value):
+        return queryset.order_by(*self.SORT_KEYS[value])
+
+    def filter_category(self, queryset, name, value):
+        # -- By code, so the filter and the category order use the same index
+        if not value:
+            return queryset
+        return queryset.filter(category_code__in=[c.category for c in value])
+
+    def filter_conductivity(self, queryset, name, value):
+        bound = {"minimum" if name.endswith("_min") else "maximum": float(value)}
+        return queryset.filter_conductivity(self.unit_system, **bound)
+
+    def filter_resistivity(self, queryset, name, value):
+        bound = {"minimum" if name.endswith("_min") else "maximum": float(value)}
+        return queryset.filter_resistivity(self.unit_system, **bound)
 
     class Meta:
         model = Material
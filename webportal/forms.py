@@ -1,7 +1,42 @@
 from django import forms
-from django_select2.forms import Select2Widget
+from django.forms.models import ModelChoiceIterator
+from django_select2.forms import HeavySelect2Widget, Select2Widget
 
-from webportal.models import Material
+from webportal.models import Material, MaterialCategory
+
+
+class MaterialCategoryChoiceIterator(ModelChoiceIterator):
+    """Build the choices from the cached MaterialCategories instead of a query."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in MaterialCategory.objects.get_all_cached():
+            yield self.choice(category)
+
+    def __len__(self):
+        empty = 1 if self.field.empty_label is not None else 0
+        return len(MaterialCategory.objects.get_all_cached()) + empty
+
+
+class MaterialCategoryChoiceField(forms.ModelChoiceField):
+    """A MaterialCategory choice field which never queries the database."""
+
+    iterator = MaterialCategoryChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, MaterialCategory):
+            return value
+        try:
+            return MaterialCategory.objects.get_for_id(int(value))
+        except (ValueError, TypeError, MaterialCategory.DoesNotExist):
+            raise forms.ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
 
 
 class MaterialForm(forms.ModelForm):
@@ -35,11 +70,38 @@ class MaterialForm(forms.ModelForm):
             "comments",
             "color_argb",
         }
+        field_classes = {"category": MaterialCategoryChoiceField}
+
+
+class MaterialSelect2Widget(HeavySelect2Widget):
+    """Select2 widget which searches the Materials on the server as the user types.
+
+    Only the options set on the widget (ie: the selected Material) are rendered into
+    the page. Every other option is fetched from the 'material-search' view.
+    """
+
+    def __init__(self, attrs=None, choices=(), **kwargs):
+        kwargs.setdefault("data_view", "material-search")
+        attrs = {"data-minimum-input-length": 1, **(attrs or {})}
+        super().__init__(attrs, choices, **kwargs)
+
+    def render(self, *args, **kwargs):
+        # -- The 'material-search' view does not need the widget pickled into the cache
+        return Select2Widget.render(self, *args, **kwargs)
 
 
 class MaterialSearchForm(forms.Form):
     material = forms.ModelChoiceField(
         queryset=Material.objects.all(),
-        widget=Select2Widget(),
+        widget=MaterialSelect2Widget(),
         label="",
     )
+
+    def __init__(self, *args, material: Material | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields["material"]
+        choices = [("", field.empty_label)]
+        if material:
+            choices.append((material.pk, material.name))
+            self.initial.setdefault("material", material.pk)
+        field.widget.choices = choices
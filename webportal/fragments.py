@@ -0,0 +1,110 @@
+"""Render a single named block of a template (an HTMX fragment), like django-render-block.
+
+`render_block_to_string` walks the compiled template's whole node tree (and its
+parents') on every call to find the template's blocks. `render_fragment` does
+that walk once per compiled template and keeps the result: the blocks of each
+level of the template's inheritance chain, which are replayed into a fresh
+BlockContext on each render (so `{{ block.super }}` and nested blocks still work).
+
+The registry is keyed on the compiled Template, which Django's cached template
+loader keeps for the life of the process (and replaces when a template changes
+in development), so the registry never outlives the template it describes.
+Templates which extend a variable parent are not cached (the parent depends on
+the context), and fall back to django-render-block.
+"""
+
+import weakref
+from copy import copy
+
+from django.http import HttpRequest
+from django.template import Context, RequestContext, loader
+from django.template.backends.django import Template as DjangoTemplate
+from django.template.base import Template
+from django.template.context import RenderContext
+from django.template.loader_tags import (
+    BLOCK_CONTEXT_KEY,
+    BlockContext,
+    BlockNode,
+    ExtendsNode,
+)
+from render_block import render_block_to_string
+from render_block.django import django_render_block
+from render_block.exceptions import BlockNotFound
+
+# -- Compiled Template -> the {name: BlockNode} of it and each of its parents,
+# -- or () if it cannot be cached
+_block_levels: weakref.WeakKeyDictionary[Template, tuple[dict[str, BlockNode], ...]]
+_block_levels = weakref.WeakKeyDictionary()
+
+
+def _find_block_levels(
+    template: Template, context: Context
+) -> tuple[dict[str, BlockNode], ...]:
+    """The blocks of the template and its parents (or () if a parent is a variable)."""
+    levels = []
+    while template is not None:
+        levels.append(
+            {n.name: n for n in template.nodelist.get_nodes_by_type(BlockNode)}
+        )
+        parent = None
+        # -- (There should only ever be 0 or 1 ExtendsNode)
+        for node in template.nodelist.get_nodes_by_type(ExtendsNode):
+            if not isinstance(node.parent_name.var, str):
+                return ()
+            parent = node.get_parent(context)
+        template = parent
+    return tuple(levels)
+
+
+def render_block(
+    template: DjangoTemplate,
+    block_name: str,
+    context: Context | dict,
+    request: HttpRequest | None = None,
+) -> str:
+    """Render the block of the (backend) template, with its blocks from the registry."""
+    base_template = template.template
+    if (levels := _block_levels.get(base_template)) == ():
+        return django_render_block(template, block_name, context, request)
+
+    if isinstance(context, Context):
+        # -- A copy, with fresh rendering state (as django-render-block does)
+        context_instance = copy(context)
+        context_instance.render_context = RenderContext()
+    elif request:
+        context_instance = RequestContext(request, context)
+    else:
+        context_instance = Context(context)
+
+    with context_instance.render_context.push_state(base_template):
+        with context_instance.bind_template(base_template):
+            if levels is None:
+                levels = _find_block_levels(base_template, context_instance)
+                _block_levels[base_template] = levels
+                if not levels:
+                    return django_render_block(template, block_name, context, request)
+
+            block_context = BlockContext()
+            for blocks in levels:
+                block_context.add_blocks(blocks)
+            context_instance.render_context[BLOCK_CONTEXT_KEY] = block_context
+
+            if (block_node := block_context.get_block(block_name)) is None:
+                raise BlockNotFound(f"block with name '{block_name}' does not exist")
+            return block_node.render(context_instance)
+
+
+def render_fragment(
+    template_name: str | list[str] | tuple[str, ...],
+    block_name: str,
+    context: Context | dict | None = None,
+    request: HttpRequest | None = None,
+) -> str:
+    """Render the named block of the template: a drop-in for render_block_to_string."""
+    if isinstance(template_name, (tuple, list)):
+        template = loader.select_template(template_name)
+    else:
+        template = loader.get_template(template_name)
+    if not isinstance(template, DjangoTemplate):
+        return render_block_to_string(template_name, block_name, context, request)
+    return render_block(template, block_name, context or {}, request)
@@ -0,0 +1,179 @@
+"""Export of a Project's Assemblies as Honeybee-PH constructions (JSON).
+
+Each Assembly is written as a honeybee-energy `OpaqueConstruction` dict, with its
+Layers (in order) as `EnergyMaterial` dicts: the Layer's thickness and the
+conductivity, emissivity and color of its Material. A Layer with more than one
+LayerSegment gets the (equal-width, parallel) equivalent conductivity, and its
+segments as the Honeybee-PH 'divisions' of the material. The constructions are
+keyed by their identifier (the Assembly's UID), as in a honeybee construction
+library file, so a client can load them with `OpaqueConstruction.from_dict`.
+
+The document is streamed while the Project is walked: the Assemblies, Layers and
+LayerSegments (with their Materials) are read with one server-side cursor each,
+all in the same (Assembly, Layer, Segment position) order, and merged as they
+are read. An export therefore takes the same 3 queries, and the same memory,
+however many Assemblies, Layers or segments the Project has.
+"""
+
+import json
+from itertools import groupby
+from typing import Iterable, Iterator
+
+from webportal.models import Assembly, Layer, LayerSegment, Project
+
+# -- PH_Materials does not store a Material's density or specific heat (they do
+# -- not affect the steady-state U-value), but honeybee-energy needs them.
+DEFAULT_DENSITY = 999.0  # [kg/m3]
+DEFAULT_SPECIFIC_HEAT = 999.0  # [J/kg-K]
+DEFAULT_ROUGHNESS = "MediumRough"
+DEFAULT_ABSORPTANCE = 0.7
+
+CHUNK_SIZE = 2000
+
+SEGMENT_COLUMNS = (
+    "layer_id",
+    "material__name",
+    "material__conductivity",
+    "material__emissivity",
+    "material__color_argb",
+)
+
+
+def _ph_color(color_argb: str | None) -> dict | None:
+    try:
+        a, r, g, b = (int(value) for value in (color_argb or "").split(","))
+    except ValueError:
+        return None
+    return {"a": a, "r": r, "g": g, "b": b}
+
+
+def _material_dict(
+    identifier: str,
+    name: str,
+    thickness: float,
+    conductivity: float | None,
+    emissivity: float | None,
+) -> dict:
+    """An honeybee-energy EnergyMaterial dict."""
+    return {
+        "type": "EnergyMaterial",
+        "identifier": identifier,
+        "display_name": name,
+        "roughness": DEFAULT_ROUGHNESS,
+        "thickness": thickness,
+        "conductivity": conductivity,
+        "density": DEFAULT_DENSITY,
+        "specific_heat": DEFAULT_SPECIFIC_HEAT,
+        "thermal_absorptance": emissivity,
+        "solar_absorptance": DEFAULT_ABSORPTANCE,
+        "visible_absorptance": DEFAULT_ABSORPTANCE,
+    }
+
+
+def layer_dict(layer_uid: str, thickness: float, segments: list[tuple]) -> dict:
+    """The Layer as an EnergyMaterial, from the SEGMENT_COLUMNS of its segments."""
+    materials = [s for s in segments if s[1] is not None]
+    conductivities = [s[2] for s in materials]
+    # -- Equal-width segments in parallel: the mean conductivity (as webportal.thermal)
+    conductivity = (
+        sum(conductivities) / len(conductivities)
+        if conductivities and len(materials) == len(segments)
+        else None
+    )
+    first = materials[0] if materials else (None, "", None, None, None)
+    layer = _material_dict(layer_uid, first[1], thickness, conductivity, first[3])
+
+    ph = {"type": "EnergyMaterialPhProperties", "ph_color": _ph_color(first[4])}
+    if len(segments) > 1:
+        width = 1.0 / len(segments)
+        ph["divisions"] = {
+            "type": "PhDivisionGrid",
+            "column_widths": [width] * len(segments),
+            "row_heights": [1.0],
+            "cells": [
+                {
+                    "column": i,
+                    "row": 0,
+                    "material": _material_dict(
+                        f"{layer_uid}_{i}", name or "", thickness, k, emissivity
+                    ),
+                }
+                for i, (_, name, k, emissivity, _) in enumerate(segments)
+            ],
+        }
+    layer["properties"] = {"type": "EnergyMaterialProperties", "ph": ph}
+    return layer
+
+
+def construction_dict(assembly_uid: str, name: str, layers: Iterable[dict]) -> dict:
+    """An honeybee-energy OpaqueConstruction dict, with the (full) layer materials."""
+    return {
+        "type": "OpaqueConstruction",
+        "identifier": assembly_uid,
+        "display_name": name,
+        "materials": list(layers),
+    }
+
+
+def _iter_layers(
+    layers: Iterator[tuple], segments: Iterator[tuple]
+) -> Iterator[tuple[int, dict]]:
+    """The (assembly_id, layer dict) of each Layer, merged with its segments."""
+    segments_by_layer = groupby(segments, key=lambda segment: segment[0])
+    current = next(segments_by_layer, None)
+    for layer_id, assembly_id, uid, thickness in layers:
+        layer_segments = []
+        if current is not None and current[0] == layer_id:
+            layer_segments = list(current[1])
+            current = next(segments_by_layer, None)
+        yield assembly_id, layer_dict(uid, thickness, layer_segments)
+
+
+def iter_project_constructions(project: Project) -> Iterator[dict]:
+    """Yield the construction dict of each of the Project's Assemblies, in order."""
+    assembly_order = ("position", "pk")
+    assemblies = (
+        Assembly.objects.filter(project=project)
+        .order_by(*assembly_order)
+        .values_list("pk", "uid", "name")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    layer_order = [f"assembly__{field}" for field in assembly_order]
+    layers = (
+        Layer.objects.filter(assembly__project=project)
+        .order_by(*layer_order, "position", "pk")
+        .values_list("pk", "assembly_id", "uid", "thickness")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    segments = (
+        LayerSegment.objects.filter(layer__assembly__project=project)
+        .order_by(
+            *(f"layer__{field}" for field in layer_order),
+            "layer__position",
+            "layer__pk",
+            "position",
+            "pk",
+        )
+        .values_list(*SEGMENT_COLUMNS)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    layers_by_assembly = groupby(_iter_layers(layers, segments), key=lambda l: l[0])
+    current = next(layers_by_assembly, None)
+    for assembly_id, uid, name in assemblies:
+        if current is None or current[0] != assembly_id:
+            yield construction_dict(uid, name, [])
+            continue
+        yield construction_dict(uid, name, (layer for _, layer in current[1]))
+        current = next(layers_by_assembly, None)
+
+
+def iter_project_json(project: Project, api_version: int = 1) -> Iterator[str]:
+    """Yield the Project's constructions document, one Assembly at a time."""
+    header = {"api_version": api_version, "uid": project.uid, "name": project.name}
+    yield json.dumps(header, separators=(",", ":"))[:-1] + ',"constructions":{'
+    for i, construction in enumerate(iter_project_constructions(project)):
+        key = json.dumps(construction["identifier"])
+        value = json.dumps(construction, separators=(",", ":"))
+        yield f"{',' if i else ''}{key}:{value}"
+    yield "}}"
@@ -0,0 +1,235 @@
+"""Apply a batch of layer operations to an Assembly, in a single transaction.
+
+The operations are a list of dicts, applied in order:
+
+    {"op": "insert", "ref": "new-1", "index": 0, "thickness": 0.1, "material": 12}
+    {"op": "delete", "layer": 34}
+    {"op": "reorder", "layers": [35, "new-1", 36]}
+    {"op": "set_thickness", "layer": "new-1", "thickness": 0.2}
+    {"op": "set_material", "layer": 35, "material": 12, "segment": 81}
+
+Layers are referenced by their pk, or by the 'ref' given to a layer inserted
+earlier in the same batch. 'index' (insert) defaults to the end of the assembly
+and 'segment' (set_material) defaults to all of the layer's segments. A reorder
+must list every layer of the assembly.
+
+Every operation is validated before anything is written, and the writes are
+done in bulk, so the number of queries does not depend on the number of
+operations or layers. Only the layers which move (or are new) get a new
+position, and the Assembly's stored thermal results are updated at the end.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+from django.db import transaction
+
+from webportal.models import (
+    POSITION_GAP,
+    Assembly,
+    Layer,
+    LayerSegment,
+    Material,
+    User,
+    assign_positions,
+)
+from webportal.thermal import store_results
+
+MAX_OPERATIONS = 500
+
+
+class LayerOperationError(ValueError):
+    """An invalid operation: nothing in the batch was applied."""
+
+
+@dataclass
+class LayerOperationsResult:
+    """The reloaded Assembly, and what changed."""
+
+    assembly: Assembly
+    created: list[int] = field(default_factory=list)
+    deleted: list[int] = field(default_factory=list)
+    changed: set[int] = field(default_factory=set)
+    reordered: bool = False
+
+
+def _thickness(i: int, value: Any) -> float:
+    try:
+        thickness = float(value)
+    except (TypeError, ValueError):
+        raise LayerOperationError(f"Operation {i}: invalid thickness: {value!r}")
+    if not thickness >= 0:
+        raise LayerOperationError(f"Operation {i}: thickness must be >= 0")
+    return thickness
+
+
+def _load_materials(operations: list[dict], user: User) -> dict[int, Material]:
+    """Load every Material used by the operations, in one query."""
+    ids = set()
+    for i, operation in enumerate(operations):
+        if operation.get("material") is None:
+            continue
+        try:
+            ids.add(int(operation["material"]))
+        except (TypeError, ValueError):
+            raise LayerOperationError(
+                f"Operation {i}: invalid material: {operation['material']!r}"
+            )
+    if not ids:
+        return {}
+    return Material.objects.visible_to(user.pk).order_by().in_bulk(ids)
+
+
+def apply_layer_operations(
+    project_pk: int, assembly_pk: int, operations: list[dict], user: User
+) -> LayerOperationsResult:
+    """Apply the operations to the Assembly's layers, all-or-nothing.
+
+    Raises Assembly.DoesNotExist if the Assembly is not in the Project.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise LayerOperationError("Expected a list of operations.")
+    if len(operations) > MAX_OPERATIONS:
+        raise LayerOperationError(f"At most {MAX_OPERATIONS} operations per request.")
+    if not all(isinstance(operation, dict) for operation in operations):
+        raise LayerOperationError("Each operation must be an object.")
+
+    with transaction.atomic():
+        # -- 'of': the (nullable) project is outer-joined, which can't be locked
+        assembly = (
+            Assembly.objects.select_for_update(of=("self",))
+            .with_layer_tree()
+            .get(pk=assembly_pk, project_id=project_pk)
+        )
+        materials = _load_materials(operations, user)
+        order: list[Layer] = assembly.get_ordered_layers()
+        layers: dict[Any, Layer] = {layer.pk: layer for layer in order}
+        new_segments: dict[int, LayerSegment] = {}  # -- by id() of the new Layer
+        deleted: list[Layer] = []
+        changed_layers: set[int] = set()  # -- id() of the changed (existing) Layers
+        changed_segments: set[int] = set()
+        reordered = False
+
+        def get_layer(i: int, ref: Any) -> Layer:
+            if not isinstance(ref, (int, str)) or ref not in layers:
+                raise LayerOperationError(f"Operation {i}: unknown layer: {ref!r}")
+            return layers[ref]
+
+        def get_material(i: int, pk: Any) -> Material | None:
+            if pk is None:
+                return None
+            if (material := materials.get(int(pk))) is None:
+                raise LayerOperationError(f"Operation {i}: unknown material: {pk!r}")
+            return material
+
+        # -- Validate and apply every operation in memory first
+        for i, operation in enumerate(operations):
+            match operation.get("op"):
+                case "insert":
+                    ref = operation.get("ref")
+                    if not isinstance(ref, (int, str)) or ref in layers:
+                        raise LayerOperationError(
+                            f"Operation {i}: insert needs a new, unique 'ref'."
+                        )
+                    index = operation.get("index", len(order))
+                    if not isinstance(index, int) or not 0 <= index <= len(order):
+                        raise LayerOperationError(f"Operation {i}: invalid index.")
+                    layer = Layer(
+                        assembly=assembly,
+                        thickness=_thickness(i, operation.get("thickness", 1.0)),
+                    )
+                    new_segments[id(layer)] = LayerSegment(
+                        material=get_material(i, operation.get("material")),
+                        position=POSITION_GAP,
+                    )
+                    layers[ref] = layer
+                    order.insert(index, layer)
+
+                case "delete":
+                    layer = get_layer(i, operation.get("layer"))
+                    order.remove(layer)
+                    layers = {k: v for k, v in layers.items() if v is not layer}
+                    if layer.pk:
+                        deleted.append(layer)
+
+                case "reorder":
+                    refs = operation.get("layers")
+                    if not isinstance(refs, list):
+                        raise LayerOperationError(
+                            f"Operation {i}: 'layers' list needed."
+                        )
+                    new_order = [get_layer(i, ref) for ref in refs]
+                    if len(new_order) != len(order) or {id(l) for l in new_order} != {
+                        id(l) for l in order
+                    }:
+                        raise LayerOperationError(
+                            f"Operation {i}: reorder must list every layer once."
+                        )
+                    reordered = reordered or new_order != order
+                    order = new_order
+
+                case "set_thickness":
+                    layer = get_layer(i, operation.get("layer"))
+                    layer.thickness = _thickness(i, operation.get("thickness"))
+                    changed_layers.add(id(layer))
+
+                case "set_material":
+                    layer = get_layer(i, operation.get("layer"))
+                    material = get_material(i, operation.get("material"))
+                    if not layer.pk:
+                        new_segments[id(layer)].material = material
+                        continue
+                    segments = layer.get_ordered_segments()
+                    if (segment_pk := operation.get("segment")) is not None:
+                        segments = [s for s in segments if str(s.pk) == str(segment_pk)]
+                        if not segments:
+                            raise LayerOperationError(
+                                f"Operation {i}: unknown segment: {segment_pk!r}"
+                            )
+                    for segment in segments:
+                        segment.material = material
+                        changed_segments.add(id(segment))
+                    changed_layers.add(id(layer))
+
+                case other:
+                    raise LayerOperationError(f"Operation {i}: unknown op: {other!r}")
+
+        # -- Then write all of the changes, in bulk
+        if deleted:
+            Layer.objects.filter(pk__in=[layer.pk for layer in deleted]).delete()
+
+        moved = assign_positions(order)
+        created = [layer for layer in order if not layer.pk]
+        if created:
+            Layer.objects.bulk_create(created)
+            segments = [new_segments[id(layer)] for layer in created]
+            for layer, segment in zip(created, segments):
+                segment.layer = layer
+            LayerSegment.objects.bulk_create(segments)
+
+        created_ids = {id(layer) for layer in created}
+        updated = [
+            layer
+            for layer in order
+            if id(layer) in changed_layers and id(layer) not in created_ids
+        ]
+        moved = [layer for layer in moved if id(layer) not in changed_layers]
+        if updated or moved:
+            Layer.objects.bulk_update([*updated, *moved], ["thickness", "position"])
+        segments = [
+            segment
+            for layer in updated
+            for segment in layer.get_ordered_segments()
+            if id(segment) in changed_segments
+        ]
+        if segments:
+            LayerSegment.objects.bulk_update(segments, ["material"])
+        store_results([assembly.pk])
+
+    return LayerOperationsResult(
+        assembly=Assembly.load_tree(assembly_pk),
+        created=[layer.pk for layer in created],  # type: ignore
+        deleted=[layer.pk for layer in deleted],  # type: ignore
+        changed={layer.pk for layer in updated},  # type: ignore
+        reordered=reordered,
+    )
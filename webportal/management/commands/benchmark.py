@@ -0,0 +1,207 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from webportal.benchmarks import (
+    BenchmarkScale,
+    find_regressions,
+    load_baseline,
+    run_benchmarks,
+    run_concurrency,
+    run_fragments,
+    save_baseline,
+    seed,
+)
+
+DEFAULT_BASELINE = Path("benchmarks") / "baseline.json"
+
+
+class Command(BaseCommand):
+    help = """
+        Seed a throw-away (test) database with a large synthetic dataset, and time
+        the key endpoints (p50 / p95 latency and SQL query counts).
+        Fails if any endpoint is slower, or runs more queries, than the baseline.
+        To run: 'python manage.py benchmark --materials 100000 --projects 1000'
+        To record a new baseline: 'python manage.py benchmark --save-baseline'
+        To compare the WSGI and ASGI throughput of the HTMX endpoints with 50, 100
+        and 200 concurrent clients: 'python manage.py benchmark --concurrency 50 100 200'
+        To time the hottest template-block fragments, before and after the fragment
+        registry: 'python manage.py benchmark --fragments'
+    """
+
+    def add_arguments(self, parser):
+        defaults = BenchmarkScale()
+        parser.add_argument("--materials", type=int, default=defaults.materials)
+        parser.add_argument("--projects", type=int, default=defaults.projects)
+        parser.add_argument(
+            "--assemblies-per-project",
+            type=int,
+            default=defaults.assemblies_per_project,
+        )
+        parser.add_argument(
+            "--layers-per-assembly", type=int, default=defaults.layers_per_assembly
+        )
+        parser.add_argument(
+            "--segments-per-layer", type=int, default=defaults.segments_per_layer
+        )
+        parser.add_argument("--import-rows", type=int, default=defaults.import_rows)
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Requests per endpoint."
+        )
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Keep the cache between requests (default: clear it before each).",
+        )
+        parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Write the results to the baseline file instead of comparing.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.5,
+            help="Allowed p95 slow-down, as a multiple of the baseline p95.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            help="Numbers of concurrent clients: compare WSGI and ASGI throughput.",
+        )
+        parser.add_argument(
+            "--requests-per-client",
+            type=int,
+            default=5,
+            help="Requests made by each concurrent client.",
+        )
+        parser.add_argument(
+            "--wsgi-threads",
+            type=int,
+            default=8,
+            help="Worker threads of the WSGI handler, in the concurrency benchmark.",
+        )
+        parser.add_argument(
+            "--fragments",
+            action="store_true",
+            help="Time the renders of the hottest template-block fragments instead.",
+        )
+        parser.add_argument(
+            "--fragment-renders",
+            type=int,
+            default=1_000,
+            help="Renders of each fragment, in the fragments benchmark.",
+        )
+
+    def handle(self, *args, **options):
+        scale = BenchmarkScale(
+            materials=options["materials"],
+            projects=options["projects"],
+            assemblies_per_project=options["assemblies_per_project"],
+            layers_per_assembly=options["layers_per_assembly"],
+            segments_per_layer=options["segments_per_layer"],
+            import_rows=options["import_rows"],
+        )
+        if min(scale.materials, scale.projects, scale.assemblies_per_project) < 1:
+            raise CommandError("The benchmark needs at least 1 material and assembly.")
+        if min(scale.layers_per_assembly, scale.segments_per_layer) < 1:
+            raise CommandError("The benchmark needs at least 1 layer and segment.")
+
+        # -- Never touch the real database: seed and run against a test database
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write(f"Seeding: {scale}")
+            data = seed(scale)
+            if options["fragments"]:
+                fragment_results = run_fragments(data, options["fragment_renders"])
+            elif options["concurrency"]:
+                concurrency_results = run_concurrency(
+                    data,
+                    scale,
+                    options["concurrency"],
+                    requests_per_client=options["requests_per_client"],
+                    wsgi_threads=options["wsgi_threads"],
+                )
+            else:
+                results = run_benchmarks(
+                    data,
+                    scale,
+                    repeat=options["repeat"],
+                    warm_cache=options["warm_cache"],
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if options["fragments"]:
+            self.write_fragment_results(fragment_results)
+            return
+        if options["concurrency"]:
+            self.write_concurrency_results(concurrency_results)
+            return
+
+        self.stdout.write(
+            f"{'endpoint':<24}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'queries':>9}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result.name:<24}{result.p50_ms:>10.1f}{result.p95_ms:>10.1f}"
+                f"{result.max_ms:>10.1f}{result.queries:>9}"
+            )
+
+        baseline_path: Path = options["baseline"]
+        if options["save_baseline"]:
+            save_baseline(baseline_path, scale, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(
+                self.style.WARNING(
+                    f"No baseline at {baseline_path}, run with --save-baseline to create one."
+                )
+            )
+            return
+
+        baseline = load_baseline(baseline_path)
+        if baseline.get("scale") != vars(scale):
+            raise CommandError(
+                f"The baseline was recorded at a different scale: {baseline.get('scale')}"
+            )
+        if regressions := find_regressions(results, baseline, options["tolerance"]):
+            raise CommandError(
+                "Benchmark regressions:\n" + "\n".join(f"  {r}" for r in regressions)
+            )
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def write_concurrency_results(self, results):
+        self.stdout.write(
+            f"{'handler':<10}{'clients':>9}{'requests':>10}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result.handler:<10}{result.clients:>9}{result.requests:>10}"
+                f"{result.requests_per_second:>10.1f}{result.p50_ms:>10.1f}"
+                f"{result.p95_ms:>10.1f}{result.errors:>8}"
+            )
+
+    def write_fragment_results(self, results):
+        self.stdout.write(
+            f"{'fragment':<24}{'renders':>9}{'before us':>11}{'after us':>10}"
+            f"{'speedup':>9}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result.name:<24}{result.renders:>9}{result.before_p50_us:>11.1f}"
+                f"{result.after_p50_us:>10.1f}{result.speedup:>8.2f}x"
+            )
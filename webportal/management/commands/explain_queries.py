@@ -0,0 +1,233 @@
+import itertools
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.http import QueryDict
+
+from webportal.filters import MaterialCategoryFilter
+from webportal.models import (
+    Assembly,
+    Layer,
+    LayerSegment,
+    Material,
+    MaterialCategory,
+    MaterialChange,
+    Project,
+    visible_owners,
+)
+from webportal.pagination import KeysetPaginator, encode_cursor
+
+# -- Tiny, fixed-size lookup tables which are fine to scan
+SCANNABLE_TABLES = {MaterialCategory._meta.db_table}
+
+# -- PostgreSQL: a sort of more (estimated) rows than this is flagged
+SORT_ROW_LIMIT = 1000
+
+# -- Hot queries which sort, and why that is only ever a few rows
+BOUNDED_SORTS = {
+    # -- Each layer's segments are in order, but not those of several layers
+    "segments: by layer": "the segments of one Assembly's Layers",
+}
+
+PAGE_SIZE = 16
+
+
+def _materials_page(
+    params: str, user_pk: int, cursor: list | None = None
+) -> models.QuerySet:
+    """The materials-list page query (after the cursor), as built by the views."""
+    queryset = Material.objects.visible_to(user_pk).with_list_columns("SI")
+    material_filter = MaterialCategoryFilter(QueryDict(params), queryset=queryset)
+    paginator = KeysetPaginator(
+        material_filter.qs,
+        keys=material_filter.sort_keys,
+        per_page=PAGE_SIZE,
+        partitions=visible_owners(user_pk),
+    )
+    return paginator.page_queryset(cursor and encode_cursor(cursor, "n"))
+
+
+def hot_queries(user_pk: int = 2) -> dict:
+    """The QuerySets for the most frequently run (or most expensive) queries."""
+    category_pk = MaterialCategory.objects.get_all_cached()[0].pk
+    return {
+        "materials: list": _materials_page("", user_pk),
+        "materials: list, deep page": _materials_page(
+            "", user_pk, [category_pk, "m", 1_000_000]
+        ),
+        "materials: list by category": _materials_page(
+            f"category={category_pk}", user_pk
+        ),
+        "materials: list by name": _materials_page("sort=name", user_pk),
+        "materials: list by name, deep page": _materials_page(
+            "sort=name", user_pk, ["m", 1_000_000]
+        ),
+        "materials: list by conductivity": _materials_page(
+            "sort=conductivity", user_pk
+        ),
+        "materials: resistivity range": _materials_page(
+            "resistivity_min=1&resistivity_max=10&sort=resistivity", user_pk
+        ),
+        "materials: search": Material.objects.name_search(user_pk, "ins", 26),
+        "materials: by uid": Material.objects.filter(uid__in=["mat12345678"]),
+        "material changes: library version": MaterialChange.objects.latest_version_queryset(
+            user_pk
+        ),
+        "projects: by team": Project.objects.filter(create_by__team_id=1),
+        "projects: by uid": Project.objects.filter(uid__in=["prj12345678"]),
+        "assemblies: by project": Assembly.objects.filter(project_id=1),
+        "assemblies: by uid": Assembly.objects.filter(uid__in=["asm12345678"]),
+        "layers: by assembly": Layer.objects.filter(assembly_id__in=[1]),
+        "layers: by uid": Layer.objects.filter(uid__in=["lyr12345678"]),
+        "segments: by layer": LayerSegment.objects.select_related(
+            "material__category"
+        ).filter(layer_id__in=[1, 2]),
+        "segments: by uid": LayerSegment.objects.filter(uid__in=["seg12345678"]),
+    }
+
+
+# ---------------------------------------------------------------------------------------
+# -- SQLite plans: 'id parent notused detail' rows, the parent being the id of the
+# -- step which the row is part of.
+
+
+def _sqlite_steps(plan: str) -> list[tuple[int, int, str]]:
+    steps = []
+    for line in plan.splitlines():
+        step_id, parent, _, detail = (line.split(maxsplit=3) + [""])[:4]
+        steps.append((int(step_id), int(parent), detail))
+    return steps
+
+
+def _sqlite_scans_a_table(detail: str) -> bool:
+    """A 'SCAN <table>', with or without an index, reads every row of the table."""
+    words = detail.split()
+    if not words or words[0] != "SCAN" or len(words) < 2:
+        return False
+    return words[1] not in ("CONSTANT", "subquery") and (
+        words[1].strip('"') not in SCANNABLE_TABLES
+    )
+
+
+def _sqlite_sort_is_bounded(steps: list[tuple[int, int, str]], parent: int) -> bool:
+    """If the rows sorted are only found by primary key (ie: from a LIMITed subquery).
+
+    The (LIST / SCALAR) subqueries are separate queries, and checked on their own.
+    """
+    children: dict[int, list[tuple[int, str]]] = {}
+    for step_id, step_parent, detail in steps:
+        children.setdefault(step_parent, []).append((step_id, detail))
+
+    pending = [parent]
+    while pending:
+        for step_id, detail in children.get(pending.pop(), []):
+            if "SUBQUERY" in detail and not detail.startswith("CO-ROUTINE"):
+                continue
+            if detail.startswith(("SCAN", "SEARCH")) and "PRIMARY KEY" not in detail:
+                return False
+            pending.append(step_id)
+    return True
+
+
+def _sqlite_plan_problems(plan: str, allow_sort: bool) -> list[str]:
+    steps = _sqlite_steps(plan)
+    problems = []
+    for step_id, parent, detail in steps:
+        if _sqlite_scans_a_table(detail):
+            problems.append(detail)
+        elif (
+            detail.startswith("USE TEMP B-TREE")
+            and not allow_sort
+            and not _sqlite_sort_is_bounded(steps, parent)
+        ):
+            problems.append(detail)
+    return problems
+
+
+# ---------------------------------------------------------------------------------------
+# -- PostgreSQL plans: a (text) line per node, with '(cost=...)', each followed by its
+# -- details (ie: 'Index Cond: ...').
+
+PG_SORT_RE = re.compile(r"\bSort\s+\(cost=\S+ rows=(\d+)")
+
+
+def _postgresql_plan_problems(plan: str, allow_sort: bool) -> list[str]:
+    problems = []
+    lines = plan.splitlines()
+    for i, line in enumerate(lines):
+        if "Seq Scan on " in line:
+            table = line.split("Seq Scan on ", 1)[1].split()[0]
+            if table.strip('"') not in SCANNABLE_TABLES:
+                problems.append(line.strip())
+        elif "Index Scan using " in line or "Index Only Scan using " in line:
+            # -- (Sequential scans are off, so a full-index scan may stand in for one)
+            details = itertools.takewhile(lambda l: "(cost=" not in l, lines[i + 1 :])
+            if not any("Index Cond:" in detail for detail in details):
+                problems.append(line.strip())
+        elif (
+            (match := PG_SORT_RE.search(line))
+            and int(match[1]) > SORT_ROW_LIMIT
+            and not allow_sort
+        ):
+            problems.append(line.strip())
+    return problems
+
+
+def plan_problems(
+    plan: str, vendor: str | None = None, allow_sort: bool = False
+) -> list[str]:
+    """Return the steps of the query plan which read (or sort) a whole table.
+
+    These are table scans, full-index scans (without an index condition), and
+    (unless 'allow_sort') sorts of anything but a few rows found by primary key
+    (SQLite) or of more than SORT_ROW_LIMIT rows (PostgreSQL).
+    """
+    if (vendor or connection.vendor) == "postgresql":
+        return _postgresql_plan_problems(plan, allow_sort)
+    return _sqlite_plan_problems(plan, allow_sort)
+
+
+class Command(BaseCommand):
+    help = """
+        Run EXPLAIN on each of the hot queries and flag any step which reads (or
+        sorts) a whole table: table scans, full-index scans and unbounded sorts, to
+        check the index coverage after a schema change.
+        On PostgreSQL, sequential scans are disabled while explaining, so any
+        'Seq Scan' left in a plan means there is no usable index.
+        Run against a populated database (ie: 'python manage.py generate_materials'),
+        so that the PostgreSQL row estimates are realistic.
+        To run: 'python manage.py explain_queries'
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verbose-plans",
+            action="store_true",
+            help="Print the full plan of every query.",
+        )
+
+    def handle(self, *args, **options):
+        flagged: dict[str, list[str]] = {}
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for name, queryset in hot_queries().items():
+                plan = queryset.explain()
+                allow_sort = name in BOUNDED_SORTS
+                if problems := plan_problems(plan, allow_sort=allow_sort):
+                    flagged[name] = problems
+                    self.stdout.write(self.style.WARNING(f"NO INDEX  {name}"))
+                else:
+                    self.stdout.write(f"ok        {name}")
+                if options["verbose_plans"] or problems:
+                    for line in plan.splitlines():
+                        self.stdout.write(f"            {line}")
+
+        if flagged:
+            raise CommandError(
+                f"{len(flagged)} queries read a whole table: {', '.join(flagged)}"
+            )
+        self.stdout.write(self.style.SUCCESS("All hot queries use an index."))
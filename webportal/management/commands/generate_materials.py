@@ -17,13 +17,14 @@ class Command(BaseCommand):
         fake = Faker()
 
         # -- Ensure all the Categories are present in the database
-        for category in MaterialCategory.MATERIAL_CATEGORIES:
-            MaterialCategory.objects.get_or_create(category=category[0])
+        categories = [
+            MaterialCategory.objects.get_for_code(code)
+            for code in MaterialCategory.CATEGORY_NAMES
+        ]
 
         # -- Build 20 random Material objects in the database
-        categories = MaterialCategory.objects.all()
-        for _ in range(20):
-            Material.objects.create(
+        Material.objects.bulk_create(
+            Material(
                 name=fake.word(),
                 conductivity=random.uniform(0.1, 10.0),
                 emissivity=random.uniform(0.1, 1.0),
@@ -32,3 +33,5 @@ class Command(BaseCommand):
                 color_argb=f"{random.randint(0, 255)},{random.randint(0, 255)},{random.randint(0, 255)},{random.randint(0, 255)}",
                 category=random.choice(categories),
             )
+            for _ in range(20)
+        )
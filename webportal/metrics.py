@@ -0,0 +1,356 @@
+"""Request-level performance metrics, exposed in the Prometheus text format.
+
+`RequestMetricsMiddleware` records, for every named URL (ie: 'assembly',
+'get-materials'):
+
+    * the wall-time of the request
+    * the number of SQL queries, and the time spent running them
+    * the time spent rendering templates (and their blocks, see webportal.fragments)
+    * the size of the response
+
+The values are kept in in-process histograms, so with several worker processes
+each worker reports its own numbers (the 'pid' label tells them apart).
+The database connection statistics (open, in use, waiting, connect latency; see
+webportal.db_backends) are exported with them.
+
+The middleware runs under both WSGI and ASGI. The async ORM runs its queries in
+worker threads, each with its own database connection, so the SQL timer is added
+to every connection as it is opened rather than to the request's connection.
+"""
+
+import functools
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Iterator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 10_000_000)
+
+
+class Histogram:
+    """A thread-safe, cumulative histogram (like a Prometheus histogram)."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    self.counts[i] += 1
+
+    def snapshot(self) -> tuple[list[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+
+class MetricsRegistry:
+    """All of the request histograms and counters, by metric name and URL name."""
+
+    HISTOGRAMS = {
+        "http_request_duration_seconds": ("Request wall-time.", DURATION_BUCKETS),
+        "http_request_db_queries": ("SQL queries per request.", QUERY_BUCKETS),
+        "http_request_db_duration_seconds": ("SQL time per request.", DURATION_BUCKETS),
+        "http_request_template_duration_seconds": (
+            "Template render time per request.",
+            DURATION_BUCKETS,
+        ),
+        "http_response_size_bytes": ("Response body size.", SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        self._requests: dict[tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, view: str, value: float) -> None:
+        key = (metric, view)
+        if (histogram := self._histograms.get(key)) is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    key, Histogram(self.HISTOGRAMS[metric][1])
+                )
+        histogram.observe(value)
+
+    def count_request(self, view: str, status: int) -> None:
+        with self._lock:
+            self._requests[(view, status)] = self._requests.get((view, status), 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text exposition format."""
+        pid = os.getpid()
+        lines = [
+            "# HELP http_requests_total Requests, by URL name and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            requests = sorted(self._requests.items())
+            histograms = sorted(self._histograms.items())
+        for (view, status), count in requests:
+            lines.append(
+                f'http_requests_total{{pid="{pid}",view="{view}",status="{status}"}} {count}'
+            )
+
+        for metric, (help_text, _) in self.HISTOGRAMS.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, view), histogram in histograms:
+                if name != metric:
+                    continue
+                lines.extend(
+                    _histogram_lines(metric, f'pid="{pid}",view="{view}"', histogram)
+                )
+        lines.extend(_connection_lines(pid))
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(metric: str, labels: str, histogram: Histogram) -> list[str]:
+    counts, count, total = histogram.snapshot()
+    lines = [
+        f'{metric}_bucket{{{labels},le="{upper_bound}"}} {bucket_count}'
+        for upper_bound, bucket_count in zip(histogram.buckets, counts)
+    ]
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {count}')
+    lines.append(f"{metric}_sum{{{labels}}} {total}")
+    lines.append(f"{metric}_count{{{labels}}} {count}")
+    return lines
+
+
+# -- The database connection statistics (see webportal.db_backends)
+CONNECTION_METRICS = {
+    "open": ("db_connections_open", "gauge", "Connections held by a thread."),
+    "in_use": ("db_connections_in_use", "gauge", "Connections used by a request."),
+    "waiting": ("db_connections_waiting", "gauge", "Requests waiting for the pool."),
+    "pool_size": ("db_pool_size", "gauge", "Connections in the pool."),
+    "pool_available": ("db_pool_available", "gauge", "Idle connections in the pool."),
+    "opened": ("db_connections_opened_total", "counter", "New connections."),
+    "reused": ("db_connections_reused_total", "counter", "Re-used connections."),
+    "health_check_failures": (
+        "db_connection_health_check_failures_total",
+        "counter",
+        "Connections which failed the health check before re-use.",
+    ),
+}
+
+
+def _connection_lines(pid: int) -> list[str]:
+    from webportal.db_backends import all_connection_stats
+
+    databases = {
+        alias: (stats.snapshot(), stats.connect_seconds)
+        for alias, stats in all_connection_stats().items()
+    }
+    lines = []
+    for key, (metric, metric_type, help_text) in CONNECTION_METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for alias, (values, _) in databases.items():
+            if key in values:
+                lines.append(
+                    f'{metric}{{pid="{pid}",database="{alias}"}} {values[key]}'
+                )
+
+    metric = "db_connect_duration_seconds"
+    lines.append(
+        f"# HELP {metric} Time to open a connection, or take one from the pool."
+    )
+    lines.append(f"# TYPE {metric} histogram")
+    for alias, (_, connect_seconds) in databases.items():
+        lines.extend(
+            _histogram_lines(metric, f'pid="{pid}",database="{alias}"', connect_seconds)
+        )
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+# ---------------------------------------------------------------------------------------
+# -- Per-request collection
+
+
+class RequestStats:
+    """The SQL and template timings collected while handling a single request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+
+_current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def _sql_timer(execute, sql, params, many, context):
+    """connection.execute_wrapper which counts and times the queries of the request."""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_seconds += time.perf_counter() - start
+
+
+def _install_sql_timer(connection, **kwargs) -> None:
+    if _sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_timer)
+
+
+def install_sql_timers() -> None:
+    """Time the queries of every database connection: the open ones and new ones."""
+    connection_created.connect(_install_sql_timer)
+    for connection in connections.all(initialized_only=True):
+        _install_sql_timer(connection)
+
+
+def _template_timer(render: Callable) -> Callable:
+    """Wrap a render function so the (outermost) render time is added to the request."""
+
+    @functools.wraps(render)
+    def timed_render(*args, **kwargs):
+        stats = _current_stats.get()
+        if stats is None:
+            return render(*args, **kwargs)
+        stats.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(*args, **kwargs)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_seconds += time.perf_counter() - start
+
+    timed_render._metrics_timer = True  # type: ignore
+    return timed_render
+
+
+def install_template_timers() -> None:
+    """Time the Django template backend renders and the rendered (fragment) blocks."""
+    from django.template.backends.django import Template
+    from render_block import base as render_block_base
+
+    from webportal import fragments
+
+    if not getattr(Template.render, "_metrics_timer", False):
+        Template.render = _template_timer(Template.render)
+    if not getattr(render_block_base.django_render_block, "_metrics_timer", False):
+        render_block_base.django_render_block = _template_timer(
+            render_block_base.django_render_block
+        )
+    if not getattr(fragments.render_block, "_metrics_timer", False):
+        fragments.render_block = _template_timer(fragments.render_block)
+
+
+def _record_size(chunks: Iterator[bytes], view: str) -> Iterator[bytes]:
+    """Pass the streamed chunks through, recording the total size at the end."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    registry.observe("http_response_size_bytes", view, size)
+
+
+async def _arecord_size(
+    chunks: AsyncIterator[bytes], view: str
+) -> AsyncIterator[bytes]:
+    """The async version of _record_size, for async streamed responses."""
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    registry.observe("http_response_size_bytes", view, size)
+
+
+class RequestMetricsMiddleware:
+    """Record the timings, query counts and response size of every request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_template_timers()
+        install_sql_timers()
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.is_async:
+            return self.__acall__(request)  # type: ignore
+
+        # -- The connection may have been opened before the timers were installed
+        _install_sql_timer(connections["default"])
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        # -- The stats are passed on to the ORM's threads with the context
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)  # type: ignore
+        finally:
+            _current_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def _record(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        stats: RequestStats,
+        duration: float,
+    ) -> None:
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name if match else None) or "<unresolved>"
+        registry.count_request(view, response.status_code)
+        registry.observe("http_request_duration_seconds", view, duration)
+        registry.observe("http_request_db_queries", view, stats.queries)
+        registry.observe("http_request_db_duration_seconds", view, stats.sql_seconds)
+        registry.observe(
+            "http_request_template_duration_seconds", view, stats.template_seconds
+        )
+        if not response.streaming:
+            registry.observe("http_response_size_bytes", view, len(response.content))
+        elif response.is_async:  # type: ignore
+            response.streaming_content = _arecord_size(  # type: ignore
+                aiter(response.streaming_content), view  # type: ignore
+            )
+        else:
+            response.streaming_content = _record_size(  # type: ignore
+                iter(response.streaming_content), view  # type: ignore
+            )
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from webportal.uids import generate_short_uids
+
+UID_PREFIXES = {
+    "Material": "mat",
+    "Project": "prj",
+    "Assembly": "asm",
+    "Layer": "lyr",
+    "LayerSegment": "seg",
+}
+
+
+def deduplicate_uids(apps, schema_editor):
+    """Give a new UID to every row which shares its UID with another row."""
+    for model_name, prefix in UID_PREFIXES.items():
+        model = apps.get_model("webportal", model_name)
+        model.objects.filter(uid="").update(uid=None)
+
+        duplicates = (
+            model.objects.exclude(uid=None)
+            .values("uid")
+            .annotate(n=Count("pk"))
+            .filter(n__gt=1)
+            .values_list("uid", flat=True)
+        )
+        to_update = []
+        for uid in duplicates:
+            # -- Keep the oldest row's UID, re-number the rest
+            to_update.extend(model.objects.filter(uid=uid).order_by("pk")[1:])
+        if not to_update:
+            continue
+
+        new_uids = generate_short_uids(model, prefix, len(to_update))
+        for obj, new_uid in zip(to_update, new_uids):
+            obj.uid = new_uid
+        model.objects.bulk_update(to_update, ["uid"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0002_remove_assembly_user_assembly_created_by_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_uids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="assembly",
+            name="uid",
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="layer",
+            name="uid",
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="layersegment",
+            name="uid",
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="material",
+            name="uid",
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="project",
+            name="uid",
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:45
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0003_unique_uids"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="material",
+            index=models.Index(
+                models.F("user"),
+                models.F("category"),
+                django.db.models.functions.text.Lower("name"),
+                name="material_user_cat_name_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="material",
+            index=models.Index(
+                models.F("user"),
+                django.db.models.functions.text.Lower("name"),
+                name="material_user_name_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="material",
+            index=models.Index(
+                fields=["user", "conductivity"], name="material_user_cond_idx"
+            ),
+        ),
+    ]
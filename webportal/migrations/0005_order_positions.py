@@ -0,0 +1,171 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+POSITION_GAP = 1024
+BATCH_SIZE = 1000
+
+
+def _delete_orphans(children, parent_field: str, orders: dict[int, list]) -> None:
+    """Delete the children missing from their parent's order array.
+
+    Removing a child from the array was how it was deleted (and it was never shown
+    again), so these are deleted here rather than given a position, which would
+    make them visible again.
+    """
+    kept = {parent_pk: set(pks or ()) for parent_pk, pks in orders.items()}
+    rows = children.values_list("pk", parent_field).iterator(chunk_size=BATCH_SIZE)
+    orphans = [pk for pk, parent_pk in rows if pk not in kept.get(parent_pk, ())]
+    for i in range(0, len(orphans), BATCH_SIZE):
+        children.filter(pk__in=orphans[i : i + BATCH_SIZE]).delete()
+
+
+def _set_positions(children, parent_field: str, orders: dict[int, list]) -> None:
+    """Give each child a sparse position, in its parent's order-array order.
+
+    Any children missing from the array go after the listed ones, in pk order.
+    """
+    by_parent: dict[int, list] = {}
+    for child in children.order_by("pk").iterator(chunk_size=BATCH_SIZE):
+        by_parent.setdefault(getattr(child, parent_field), []).append(child)
+
+    changed = []
+    for parent_pk, siblings in by_parent.items():
+        rank = {pk: i for i, pk in enumerate(orders.get(parent_pk) or [])}
+        siblings.sort(key=lambda child: rank.get(child.pk, len(rank)))
+        for i, child in enumerate(siblings):
+            child.position = (i + 1) * POSITION_GAP
+            changed.append(child)
+    children.bulk_update(changed, ["position"], batch_size=BATCH_SIZE)
+
+
+def _move_to_positions(model, parent_field: str, orders: dict[int, list]) -> None:
+    _delete_orphans(model.objects.all(), parent_field, orders)
+    _set_positions(model.objects.all(), parent_field, orders)
+
+
+def arrays_to_positions(apps, schema_editor):
+    """Move the order arrays to the position columns.
+
+    Layers and LayerSegments which are not in their parent's order array were
+    hidden (deleted), and are now deleted for good: this cannot be reversed.
+    Assemblies are all kept: the sidebar listed every Assembly of the Project,
+    and new ones were never added to the array, so the unlisted ones go last.
+    """
+    Project = apps.get_model("webportal", "Project")
+    Assembly = apps.get_model("webportal", "Assembly")
+    Layer = apps.get_model("webportal", "Layer")
+    LayerSegment = apps.get_model("webportal", "LayerSegment")
+
+    assembly_orders = dict(Project.objects.values_list("pk", "assembly_id_order"))
+
+    # -- New-project assemblies were only linked to their project by the array
+    for project_pk, assembly_pks in assembly_orders.items():
+        if assembly_pks:
+            Assembly.objects.filter(pk__in=assembly_pks, project=None).update(
+                project_id=project_pk
+            )
+
+    _set_positions(Assembly.objects.all(), "project_id", assembly_orders)
+    # -- Parents first, so that a deleted Layer's segments are gone with it
+    _move_to_positions(
+        Layer,
+        "assembly_id",
+        dict(Assembly.objects.values_list("pk", "layer_id_order")),
+    )
+    _move_to_positions(
+        LayerSegment,
+        "layer_id",
+        dict(Layer.objects.values_list("pk", "segment_id_order")),
+    )
+
+
+def positions_to_arrays(apps, schema_editor):
+    Project = apps.get_model("webportal", "Project")
+    Assembly = apps.get_model("webportal", "Assembly")
+    Layer = apps.get_model("webportal", "Layer")
+    LayerSegment = apps.get_model("webportal", "LayerSegment")
+
+    for parent_model, children, parent_field, array_field in (
+        (Project, Assembly, "project_id", "assembly_id_order"),
+        (Assembly, Layer, "assembly_id", "layer_id_order"),
+        (Layer, LayerSegment, "layer_id", "segment_id_order"),
+    ):
+        orders: dict[int, list[int]] = {}
+        rows = children.objects.order_by("position", "pk").values_list(
+            parent_field, "pk"
+        )
+        for parent_pk, pk in rows.iterator(chunk_size=BATCH_SIZE):
+            orders.setdefault(parent_pk, []).append(pk)
+        parents = list(parent_model.objects.filter(pk__in=orders))
+        for parent in parents:
+            setattr(parent, array_field, orders[parent.pk])
+        parent_model.objects.bulk_update(parents, [array_field], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0004_material_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assembly",
+            name="position",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="layer",
+            name="position",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="layersegment",
+            name="position",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(arrays_to_positions, positions_to_arrays),
+        migrations.RemoveField(
+            model_name="assembly",
+            name="layer_id_order",
+        ),
+        migrations.RemoveField(
+            model_name="layer",
+            name="segment_id_order",
+        ),
+        migrations.RemoveField(
+            model_name="project",
+            name="assembly_id_order",
+        ),
+        migrations.AlterModelOptions(
+            name="assembly",
+            options={"ordering": ["position", "pk"]},
+        ),
+        migrations.AlterModelOptions(
+            name="layer",
+            options={"ordering": ["position", "pk"]},
+        ),
+        migrations.AlterModelOptions(
+            name="layersegment",
+            options={"ordering": ["position", "pk"]},
+        ),
+        migrations.AddIndex(
+            model_name="assembly",
+            index=models.Index(
+                fields=["project", "position"], name="assembly_project_pos_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="layer",
+            index=models.Index(
+                fields=["assembly", "position"], name="layer_assembly_pos_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="layersegment",
+            index=models.Index(
+                fields=["layer", "position"], name="segment_layer_pos_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0005_order_positions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assembly",
+            name="r_isothermal",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="assembly",
+            name="r_parallel",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="assembly",
+            name="r_total",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="assembly",
+            name="thermal_stale",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="assembly",
+            name="u_value",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="layer",
+            name="r_value",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
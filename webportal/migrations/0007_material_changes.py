@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0006_thermal_results"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MaterialChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("material_id", models.BigIntegerField()),
+                ("uid", models.CharField(blank=True, max_length=12, null=True)),
+                ("user_id", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("C", "created"), ("U", "updated"), ("D", "deleted")],
+                        max_length=1,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user_id", "id"], name="material_change_user_idx"
+                    )
+                ],
+            },
+        ),
+    ]
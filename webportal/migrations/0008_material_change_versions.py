@@ -0,0 +1,58 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def number_the_changes(apps, schema_editor):
+    """Give the existing changes their id as the version, and start the counter."""
+    MaterialChange = apps.get_model("webportal", "MaterialChange")
+    MaterialChangeCounter = apps.get_model("webportal", "MaterialChangeCounter")
+    MaterialChange.objects.update(version=models.F("id"))
+    latest = MaterialChange.objects.aggregate(latest=models.Max("id"))["latest"]
+    MaterialChangeCounter.objects.create(pk=1, version=latest or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0007_material_changes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MaterialChangeCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="materialchange",
+            name="material_change_user_idx",
+        ),
+        migrations.AddField(
+            model_name="materialchange",
+            name="version",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(number_the_changes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="materialchange",
+            name="version",
+            field=models.BigIntegerField(unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="materialchange",
+            index=models.Index(
+                fields=["user_id", "version"], name="material_change_user_idx"
+            ),
+        ),
+    ]
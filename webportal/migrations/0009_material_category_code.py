@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:05
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def copy_category_codes(apps, schema_editor):
+    """Copy each Material's category code onto it (one UPDATE per category)."""
+    Material = apps.get_model("webportal", "Material")
+    MaterialCategory = apps.get_model("webportal", "MaterialCategory")
+    for pk, code in MaterialCategory.objects.values_list("pk", "category"):
+        Material.objects.filter(category_id=pk).update(category_code=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webportal", "0008_material_change_versions"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="material",
+            name="material_user_cat_name_idx",
+        ),
+        migrations.AddField(
+            model_name="material",
+            name="category_code",
+            field=models.CharField(default="", editable=False, max_length=2),
+        ),
+        migrations.RunPython(copy_category_codes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="material",
+            index=models.Index(
+                models.F("user"),
+                models.F("category_code"),
+                django.db.models.functions.text.Lower("name"),
+                name="material_user_code_name_idx",
+            ),
+        ),
+    ]
@@ -1,17 +1,15 @@
-import uuid
+import operator
+import threading
+from bisect import bisect_left
+from functools import reduce
+from typing import Iterable
 
 from django.contrib.auth.models import AbstractUser, Group
-from django.db import models
-
-
-def generate_short_uid(_model_type, _prefix: str) -> str:
-    """Generates a short (12-character) UID string. ie: 'mat6af2fd74'."""
-    while True:
-        _prefix = (_prefix.lower() + "___")[:3]
-        uid = _prefix + str(int(uuid.uuid4().time_low))[2:]
-        if not _model_type.objects.filter(uid=uid).exists():
-            return uid
+from django.db import models, transaction
+from django.db.models.functions import Lower, NullIf
 
+from webportal.pagination import merge_partitions
+from webportal.uids import ShortUIDQuerySet, generate_short_uid
 
 # ---------------------------------------------------------------------------------------
 # -- Users
@@ -145,6 +143,54 @@ class User(AbstractUser):
         super().save(*args, **kwargs)
 
 
+class MaterialCategoryManager(models.Manager):
+    """Caches the (fixed) MaterialCategory rows for the life of the process.
+
+    Works like Django's ContentTypeManager: the rows are loaded once per worker
+    (per database) and then looked up by code or pk without a query. The cache is
+    cleared after 'post_migrate' and whenever a MaterialCategory is saved or deleted.
+    """
+
+    _cache: dict[str, dict[str, "MaterialCategory"]] = {}
+    _lock = threading.Lock()
+
+    def _get_cache(self) -> dict[str, "MaterialCategory"]:
+        if (categories := self._cache.get(self.db)) is None:
+            with self._lock:
+                if (categories := self._cache.get(self.db)) is None:
+                    categories = {c.category: c for c in self.all()}
+                    self._cache[self.db] = categories
+        return categories
+
+    def get_for_code(self, code: str) -> "MaterialCategory":
+        """Return the MaterialCategory for the code, creating it if it is missing."""
+        categories = self._get_cache()
+        if category := categories.get(code):
+            return category
+        if code not in self.model.CATEGORY_NAMES:
+            raise self.model.DoesNotExist(f"Invalid category: {code}")
+        category, created = self.get_or_create(category=code)
+        categories[code] = category
+        return category
+
+    def get_for_id(self, pk: int) -> "MaterialCategory":
+        """Return the MaterialCategory with the primary-key."""
+        for category in self._get_cache().values():
+            if category.pk == pk:
+                return category
+        category = self.get(pk=pk)
+        self._get_cache()[category.category] = category
+        return category
+
+    def get_all_cached(self) -> list["MaterialCategory"]:
+        """Return all of the MaterialCategories, in the model's default order."""
+        return sorted(self._get_cache().values(), key=lambda c: c.category)
+
+    def clear_cache(self) -> None:
+        """Forget the cached rows. They will be re-loaded on the next lookup."""
+        self._cache.clear()
+
+
 class MaterialCategory(models.Model):
     MATERIAL_CATEGORIES = (
         ("IN", "Insulation"),
@@ -160,37 +206,158 @@ class MaterialCategory(models.Model):
         ("AD", "Air [Downward Heat Flow]"),
         ("MT", "Metal"),
     )
+    CATEGORY_NAMES = dict(MATERIAL_CATEGORIES)
+    CATEGORY_CODES = {name: code for code, name in MATERIAL_CATEGORIES}
+
     category = models.CharField(
         choices=MATERIAL_CATEGORIES, max_length=2, null=False, blank=False, unique=True
     )
+    objects = MaterialCategoryManager()
 
     @property
     def display_name(self) -> str:
-        return dict(self.MATERIAL_CATEGORIES).get(self.category, self.category)
+        return self.CATEGORY_NAMES.get(self.category, self.category)
 
     @classmethod
     def get_category_display_name(cls, code: str) -> str | None:
-        return dict(cls.MATERIAL_CATEGORIES).get(code.upper().strip())
+        return cls.CATEGORY_NAMES.get(code.upper().strip())
 
     @classmethod
     def get_category_code(cls, display_name: str) -> str | None:
-        label_to_code = {v: k for k, v in cls.MATERIAL_CATEGORIES}
-        return label_to_code.get(display_name.strip(), None)
+        return cls.CATEGORY_CODES.get(display_name.strip(), None)
 
     class Meta:
         verbose_name_plural = "Material Categories"
         ordering = ["category"]
 
     def __str__(self) -> str:
-        return dict(self.MATERIAL_CATEGORIES).get(self.category, self.category)
+        return self.CATEGORY_NAMES.get(self.category, self.category)
 
 
 # ---------------------------------------------------------------------------------------
 # -- Materials
 
+# -- Materials owned by this user are visible to everyone
+PUBLIC_LIBRARY_USER_ID = 1
+
+# -- W/(m-K) -> Btu/(hr-ft-°F)
+IP_CONDUCTIVITY_FACTOR = 0.577789236
+INCHES_PER_FOOT = 12
+
+
+def conductivity_factor(unit_system: str) -> float:
+    """Return the factor to convert a conductivity [W/(m-K)] to the unit-system."""
+    return IP_CONDUCTIVITY_FACTOR if unit_system == "IP" else 1.0
+
+
+def resistivity_factor(unit_system: str) -> float:
+    """Return the factor so that resistivity = 1 / (conductivity [W/(m-K)] * factor).
+
+    SI resistivity is in (m-K)/W, IP resistivity is per-inch: (hr-ft²-°F)/(Btu-in).
+    """
+    if unit_system == "IP":
+        return IP_CONDUCTIVITY_FACTOR * INCHES_PER_FOOT
+    return 1.0
+
+
+def visible_owners(user_pk: int | None) -> list[models.Q]:
+    """The (disjoint) owners of the Materials a user can see: them, and the public.
+
+    Each owner's Materials are served in order by the (user, ...) indexes, whereas
+    the OR of them has to be sorted: see pagination.merge_partitions.
+    """
+    return [
+        models.Q(user_id=pk) for pk in dict.fromkeys((user_pk, PUBLIC_LIBRARY_USER_ID))
+    ]
+
+
+class MaterialQuerySet(ShortUIDQuerySet):
+    def visible_to(self, user_pk: int | None) -> "MaterialQuerySet":
+        """The user's own Materials, plus the public library."""
+        return self.filter(reduce(operator.or_, visible_owners(user_pk)))
+
+    def with_list_columns(self, unit_system: str) -> "MaterialQuerySet":
+        """The columns (and default order) shown in the materials list."""
+        return (
+            self.select_related("category")
+            .with_display_values(unit_system)
+            .annotate(lower_name=Lower("name"))
+            .order_by("category_code", "lower_name", "pk")
+        )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            if obj.category_id is not None:
+                obj.category_code = MaterialCategory.objects.get_for_id(
+                    obj.category_id
+                ).category
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def name_search(self, user_pk: int, term: str, stop: int) -> "MaterialQuerySet":
+        """The user's visible Materials whose name starts with the term, by name.
+
+        The term is matched in any case, and only the first 'stop' are read.
+        """
+        materials = self.visible_to(user_pk).annotate(lower_name=Lower("name"))
+        if term:
+            materials = materials.filter(lower_name__startswith=term.lower())
+        return merge_partitions(
+            materials, visible_owners(user_pk), ("lower_name", "pk"), stop
+        )
+
+    def with_display_values(self, unit_system: str) -> "MaterialQuerySet":
+        """Annotate the conductivity and resistivity, in the unit-system, in the database."""
+        k = models.F("conductivity")
+        return self.annotate(
+            display_conductivity=models.ExpressionWrapper(
+                k * models.Value(conductivity_factor(unit_system)),
+                output_field=models.FloatField(),
+            ),
+            display_resistivity=models.ExpressionWrapper(
+                models.Value(1.0)
+                / NullIf(k * models.Value(resistivity_factor(unit_system)), 0.0),
+                output_field=models.FloatField(),
+            ),
+        )
+
+    def filter_resistivity(
+        self,
+        unit_system: str,
+        minimum: float | None = None,
+        maximum: float | None = None,
+    ) -> "MaterialQuerySet":
+        """Filter by a resistivity range, as a (indexable) range on the conductivity."""
+        factor = resistivity_factor(unit_system)
+        qs = self
+        if minimum is not None and minimum > 0:
+            qs = qs.filter(conductivity__lte=1.0 / (minimum * factor))
+        if maximum is not None:
+            if maximum <= 0:
+                return qs.none()
+            qs = qs.filter(conductivity__gte=1.0 / (maximum * factor))
+        return qs
+
+    def filter_conductivity(
+        self,
+        unit_system: str,
+        minimum: float | None = None,
+        maximum: float | None = None,
+    ) -> "MaterialQuerySet":
+        """Filter by a conductivity range, given in the unit-system."""
+        factor = conductivity_factor(unit_system)
+        qs = self
+        if minimum is not None:
+            qs = qs.filter(conductivity__gte=minimum / factor)
+        if maximum is not None:
+            qs = qs.filter(conductivity__lte=maximum / factor)
+        return qs
+
 
 class Material(models.Model):
-    uid = models.CharField(null=True, blank=True, max_length=12)
+    UID_PREFIX = "mat"
+
+    uid = models.CharField(null=True, blank=True, max_length=12, unique=True)
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -208,30 +375,48 @@ class Material(models.Model):
     category = models.ForeignKey(
         MaterialCategory, null=True, blank=True, on_delete=models.CASCADE
     )
+    # -- A copy of category.category, so that the list's category order (by code,
+    # -- as the MaterialCategory ordering) can be read from an index
+    category_code = models.CharField(max_length=2, editable=False, default="")
+    objects = MaterialQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values) -> "Material":
+        instance = super().from_db(db, field_names, values)
+        # -- Remember the saved conductivity, to tell if it was edited
+        instance._saved_conductivity = instance.__dict__.get("conductivity")
+        return instance
+
+    @property
+    def conductivity_changed(self) -> bool:
+        """True if the conductivity differs from the one last loaded or saved."""
+        return getattr(self, "_saved_conductivity", None) != self.conductivity
 
     def save(self, *args, **kwargs):
         # -- Generate the UID if it does not exist
         if not self.uid:
-            self.uid = generate_short_uid(Material, "mat")
+            self.uid = generate_short_uid(Material, self.UID_PREFIX)
 
         # -- Ensure the Category is one of the allowed ones
-        allowed_categories = dict(MaterialCategory.MATERIAL_CATEGORIES)
-        if not self.category:
+        if self.category_id:
+            try:
+                category = MaterialCategory.objects.get_for_id(self.category_id)
+            except MaterialCategory.DoesNotExist:
+                raise ValueError(f"Invalid category: {self.category_id}")
+        else:
+            category = self.category
+        if not category:
             raise ValueError("Category is required")
 
-        if self.category.category not in allowed_categories.keys():
-            raise ValueError(f"Invalid category: {self.category}")
+        if category.category not in MaterialCategory.CATEGORY_NAMES:
+            raise ValueError(f"Invalid category: {category}")
 
-        if self.category.display_name not in allowed_categories.values():
-            raise ValueError(f"Invalid category: {self.category}")
-
-        # -- Check if the category exists in the database, if not, create it
-        category, created = MaterialCategory.objects.get_or_create(
-            category=self.category.category
-        )
-        self.category = category
+        # -- Use the (cached) database row for the category, creating it if needed
+        self.category = MaterialCategory.objects.get_for_code(category.category)
+        self.category_code = self.category.category
 
         super().save(*args, **kwargs)
+        self._saved_conductivity = self.conductivity
 
     def __str__(self):
         return self.name
@@ -239,19 +424,213 @@ class Material(models.Model):
     class Meta:
         # Order by Category Name (lookup), then by Material Name
         ordering = ["category", "name"]
+        indexes = [
+            # -- Materials list: the user's (or public) materials, by category and name
+            models.Index(
+                "user",
+                "category_code",
+                Lower("name"),
+                name="material_user_code_name_idx",
+            ),
+            # -- Materials list sorted by name, and the select2 search (in name order;
+            # -- its 'LOWER(name) LIKE' prefix is only an index range on PostgreSQL
+            # -- with the C collation)
+            models.Index("user", Lower("name"), name="material_user_name_idx"),
+            # -- Conductivity / resistivity sorts and range filters
+            models.Index(
+                fields=["user", "conductivity"], name="material_user_cond_idx"
+            ),
+        ]
+
+
+class MaterialChangeQuerySet(models.QuerySet):
+    def visible_to(self, user_pk: int | None) -> "MaterialChangeQuerySet":
+        """The changes to the user's own Materials, and to the public library."""
+        return self.filter(reduce(operator.or_, visible_owners(user_pk)))
+
+    def latest_version_queryset(self, user_pk: int | None) -> "MaterialChangeQuerySet":
+        """The query for latest_version: one index seek per owner, not a MAX over all
+        of their changes."""
+        latest = merge_partitions(
+            self.visible_to(user_pk), visible_owners(user_pk), ("-version",), 1
+        )
+        return latest.values_list("version", flat=True)
+
+    def latest_version(self, user_pk: int | None) -> int:
+        """The version of the latest change to the user's visible library (or 0)."""
+        return next(iter(self.latest_version_queryset(user_pk)), 0)
+
+    async def alatest_version(self, user_pk: int | None) -> int:
+        """The async version of latest_version."""
+        return next(iter([v async for v in self.latest_version_queryset(user_pk)]), 0)
+
+
+class MaterialChangeCounter(models.Model):
+    """The latest version of the change-log (a single row)."""
+
+    version = models.BigIntegerField(default=0)
+
+    ROW_PK = 1
+
+    @classmethod
+    def reserve(cls, count: int) -> models.Subquery:
+        """Take the next 'count' versions, and return the (SQL of the) last one.
+
+        Must run in a transaction: the counter row then stays locked until it
+        commits, so that versions are taken in commit order.
+        """
+        row = cls.objects.filter(pk=cls.ROW_PK)
+        if not row.update(version=models.F("version") + count):
+            # -- (ie: the table was flushed) Carry on from the latest change
+            latest = MaterialChange.objects.aggregate(latest=models.Max("version"))
+            cls.objects.create(pk=cls.ROW_PK, version=(latest["latest"] or 0) + count)
+        return models.Subquery(row.values("version"))
+
+
+class MaterialChange(models.Model):
+    """A record of one create, update or delete of a Material (the change-log).
+
+    The version only ever grows, in the order the changes were committed, so a
+    client which mirrors the material library asks for the changes since the last
+    version it has seen, and never misses one. (Unlike the id: concurrent
+    transactions can commit their ids out of order.)
+    """
+
+    CREATED, UPDATED, DELETED = "C", "U", "D"
+    ACTIONS = ((CREATED, "created"), (UPDATED, "updated"), (DELETED, "deleted"))
+    ACTION_NAMES = dict(ACTIONS)
+
+    version = models.BigIntegerField(unique=True)
+    # -- Not ForeignKeys: the changes of deleted Materials (and users) are kept
+    material_id = models.BigIntegerField()
+    uid = models.CharField(null=True, blank=True, max_length=12)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(choices=ACTIONS, max_length=1)
+    objects = MaterialChangeQuerySet.as_manager()
+
+    @classmethod
+    def record(cls, materials: Iterable[Material], action: str) -> None:
+        """Add the change of each of the Materials to the change-log."""
+        materials = list(materials)
+        if not materials:
+            return
+        with transaction.atomic(savepoint=False):
+            last = MaterialChangeCounter.reserve(len(materials))
+            cls.objects.bulk_create(
+                cls(
+                    version=last - (len(materials) - 1 - i),
+                    material_id=m.pk,
+                    uid=m.uid,
+                    user_id=m.user_id,  # type: ignore
+                    action=action,
+                )
+                for i, m in enumerate(materials)
+            )
+
+    class Meta:
+        indexes = [
+            # -- The changes to a user's (or the public) library, since a version
+            models.Index(
+                fields=["user_id", "version"], name="material_change_user_idx"
+            ),
+        ]
+
+
+# ---------------------------------------------------------------------------------------
+# -- Ordering
+
+# -- Sibling positions are spaced out, so an item can be put between two others
+# -- without renumbering the rest.
+POSITION_GAP = 1024
+
+
+def next_position(siblings: models.QuerySet) -> int:
+    """The position after the last of the siblings."""
+    last = siblings.aggregate(last=models.Max("position"))["last"]
+    return POSITION_GAP if last is None else last + POSITION_GAP
+
+
+def _in_order(positions: list[tuple[int, int]]) -> set[int]:
+    """The indexes of the longest run of (index, position) with increasing positions."""
+    tails: list[int] = []  # -- the smallest last position of a run of each length
+    tail_items: list[int] = []
+    parents: list[int | None] = []
+    for n, (_, position) in enumerate(positions):
+        k = bisect_left(tails, position)
+        parents.append(tail_items[k - 1] if k else None)
+        if k == len(tails):
+            tails.append(position)
+            tail_items.append(n)
+        else:
+            tails[k] = position
+            tail_items[k] = n
+
+    keep = set()
+    item = tail_items[-1] if tail_items else None
+    while item is not None:
+        keep.add(positions[item][0])
+        item = parents[item]
+    return keep
+
+
+def assign_positions(items: list) -> list:
+    """Set the 'position' of each item so that they sort in the order of the list.
+
+    Saved items which are already in order keep their position, and the others
+    (and any new items) are put in the gaps between them. Only if a gap is too
+    small are all of the items renumbered. Returns the saved items which moved.
+    """
+    keep = _in_order([(i, item.position) for i, item in enumerate(items) if item.pk])
+    positions = [item.position if i in keep else None for i, item in enumerate(items)]
+
+    start = 0
+    while start < len(items):
+        if positions[start] is not None:
+            start += 1
+            continue
+        end = start
+        while end < len(items) and positions[end] is None:
+            end += 1
+        low = positions[start - 1] if start else 0
+        high = positions[end] if end < len(items) else None
+        step = POSITION_GAP if high is None else (high - low) // (end - start + 1)
+        if step < 1:
+            positions = [(i + 1) * POSITION_GAP for i in range(len(items))]
+            break
+        for i in range(start, end):
+            positions[i] = low + step * (i - start + 1)
+        start = end
+
+    moved = []
+    for item, position in zip(items, positions):
+        if item.pk and item.position != position:
+            moved.append(item)
+        item.position = position
+    return moved
 
 
 # ---------------------------------------------------------------------------------------
 # -- Projects
 
 
-class ProjectQuerySet(models.QuerySet):
+class ProjectQuerySet(ShortUIDQuerySet):
     def filter_by_team(self, team):
         return self.filter(create_by__team=team)
 
+    def with_assembly_tree(self) -> "ProjectQuerySet":
+        """Prefetch the full Assembly -> Layer -> LayerSegment -> Material tree.
+
+        Costs 4 queries in total, no matter how many assemblies or layers.
+        """
+        return self.prefetch_related(
+            models.Prefetch("assemblies", queryset=Assembly.objects.with_layer_tree())
+        )
+
 
 class Project(models.Model):
-    uid = models.CharField(null=True, blank=True, max_length=12)
+    UID_PREFIX = "prj"
+
+    uid = models.CharField(null=True, blank=True, max_length=12, unique=True)
     name = models.CharField(max_length=100, default="new project")
     created_at = models.DateTimeField(auto_now_add=True)
     create_by = models.ForeignKey(
@@ -261,18 +640,15 @@ class Project(models.Model):
         null=True,
         blank=True,
     )
-    assembly_id_order = models.JSONField(default=list)
     objects = ProjectQuerySet.as_manager()
 
     @classmethod
     def create_new_project(cls, user: User, name: str) -> "Project":
-        """Create a new Project object."""
-        new_assembly = Assembly.objects.create(created_by=user, name="assembly")
-        new_assembly.save()
-        new_project = Project.objects.create(
-            create_by=user, name=name, assembly_id_order=[new_assembly.pk]
+        """Create a new Project object, with a single Assembly."""
+        new_project = Project.objects.create(create_by=user, name=name)
+        Assembly.objects.create(
+            created_by=user, name="assembly", project=new_project, position=POSITION_GAP
         )
-        new_project.save()
         return new_project
 
     @classmethod
@@ -293,35 +669,28 @@ class Project(models.Model):
         return self.create_by.team
 
     def get_ordered_assemblies(self) -> list["Assembly"]:
-        """Return assemblies ordered according to the assembly_id_order field."""
-        # Sort assemblies by the order in assembly_order
-        assemblies = {assembly.pk: assembly for assembly in self.assemblies.all()}
-        return [
-            assemblies[assembly_id]
-            for assembly_id in self.assembly_id_order
-            if assembly_id in assemblies
-        ]
+        """Return the assemblies, in 'position' order."""
+        return list(self.assemblies.all())
 
     def delete_assembly(self, assembly_pk: int) -> None:
         """Delete an assembly from the project."""
-        if assembly_pk in self.assembly_id_order:
-            self.assembly_id_order.remove(assembly_pk)
-            self.save()
+        self.assemblies.filter(pk=assembly_pk).delete()
 
     def add_new_assembly(self) -> "Assembly | None":
-        """Add a new assembly to the project."""
+        """Add a new assembly to the end of the project."""
         if not self.team or self.team.name == "PUBLIC":
             return None
 
-        assembly = Assembly.objects.create(user=self.team.created_by)
-        self.assembly_id_order.append(assembly.pk)
-        self.save()
-        return assembly
+        return Assembly.objects.create(
+            project=self,
+            created_by=self.team.created_by,
+            position=next_position(self.assemblies),
+        )
 
     def save(self, *args, **kwargs) -> None:
         # -- Generate the UID if it does not exist
         if not self.uid:
-            self.uid = generate_short_uid(Project, "prj")
+            self.uid = generate_short_uid(Project, self.UID_PREFIX)
         super().save(*args, **kwargs)
 
     @property
@@ -336,8 +705,31 @@ class Project(models.Model):
 # -- Assemblies
 
 
+class AssemblyQuerySet(ShortUIDQuerySet):
+    def with_layer_tree(self) -> "AssemblyQuerySet":
+        """Prefetch the Layer -> LayerSegment -> Material -> MaterialCategory tree.
+
+        Costs 3 queries in total, no matter how many layers or segments. The
+        prefetched rows (in 'position' order) are used by get_ordered_layers /
+        get_ordered_segments.
+        """
+        segments = LayerSegment.objects.select_related("material__category")
+        layers = Layer.objects.prefetch_related(
+            models.Prefetch("segments", queryset=segments)
+        )
+        return self.select_related("project").prefetch_related(
+            models.Prefetch("layers", queryset=layers)
+        )
+
+    def mark_thermal_stale(self) -> int:
+        """Mark the stored thermal results as stale (see webportal.thermal), in one query."""
+        return self.update(thermal_stale=True)
+
+
 class Assembly(models.Model):
-    uid = models.CharField(null=True, blank=True, max_length=12)
+    UID_PREFIX = "asm"
+
+    uid = models.CharField(null=True, blank=True, max_length=12, unique=True)
     project = models.ForeignKey(
         Project,
         on_delete=models.CASCADE,
@@ -354,38 +746,51 @@ class Assembly(models.Model):
         null=True,
         blank=True,
     )
-    layer_id_order = models.JSONField(default=list)
+    position = models.IntegerField(default=0)
+    # -- Stored thermal results (see webportal.thermal.store_results), without films
+    r_isothermal = models.FloatField(null=True, blank=True)
+    r_parallel = models.FloatField(null=True, blank=True)
+    r_total = models.FloatField(null=True, blank=True)
+    u_value = models.FloatField(null=True, blank=True)
+    thermal_stale = models.BooleanField(default=True)
+    objects = AssemblyQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["position", "pk"]
+        indexes = [
+            models.Index(
+                fields=["project", "position"], name="assembly_project_pos_idx"
+            )
+        ]
+
+    @classmethod
+    def load_tree(cls, assembly_pk: int) -> "Assembly":
+        """Return the Assembly with all of its layers, segments and materials loaded."""
+        return cls.objects.with_layer_tree().get(pk=assembly_pk)
 
     @classmethod
     def create_new_assembly(
         cls, user: "User", name: str, project: Project
     ) -> "Assembly":
-        """Create a new Assembly object."""
-        new_assembly = cls.objects.create(created_by=user, name=name, project=project)
-        new_assembly.save()
-        return new_assembly
+        """Create a new Assembly object, at the end of the Project."""
+        return cls.objects.create(
+            created_by=user,
+            name=name,
+            project=project,
+            position=next_position(project.assemblies),
+        )
 
     def get_ordered_layers(self) -> list["Layer"]:
-        """Return layers ordered according to the layer_id_order field."""
-        # Sort layers by the order in layer_order
-        layers = {layer.pk: layer for layer in self.layers.all()}
-        return [
-            layers[layer_id] for layer_id in self.layer_id_order if layer_id in layers
-        ]
+        """Return the layers, in 'position' order."""
+        return list(self.layers.all())
 
     def delete_layer(self, layer_pk: int) -> None:
         """Delete a layer from the assembly."""
-        if layer_pk in self.layer_id_order:
-            self.layer_id_order.remove(layer_pk)
-            self.save()
+        self.layers.filter(pk=layer_pk).delete()
 
     def add_new_layer(self) -> "Layer":
-        """Add a new layer to the assembly."""
-        layer = Layer.new_layer_with_single_segment(assembly=self)
-        # .objects.create(assembly=self, thickness=1.0)
-        self.layer_id_order.append(layer.pk)
-        self.save()
-        return layer
+        """Add a new layer to the end of the assembly."""
+        return Layer.new_layer_with_single_segment(assembly=self)
 
     def set_name(self, name: str) -> None:
         """Set the name of the assembly."""
@@ -395,7 +800,7 @@ class Assembly(models.Model):
     def save(self, *args, **kwargs) -> None:
         # -- Generate the UID if it does not exist
         if not self.uid:
-            self.uid = generate_short_uid(Assembly, "asm")
+            self.uid = generate_short_uid(Assembly, self.UID_PREFIX)
         super().save(*args, **kwargs)
 
     @property
@@ -406,41 +811,67 @@ class Assembly(models.Model):
         return self.name
 
 
+# -- Saving or deleting a Layer / LayerSegment (ie: in the admin) marks its Assembly's
+# -- stored thermal results as stale. (The bulk writes of webportal.layer_operations
+# -- store the results themselves, and Materials mark their own, see signals.py)
+class LayerQuerySet(ShortUIDQuerySet):
+    def delete(self):
+        Assembly.objects.filter(layers__in=self).mark_thermal_stale()
+        return super().delete()
+
+
 class Layer(models.Model):
-    uid = models.CharField(null=True, blank=True, max_length=12)
+    UID_PREFIX = "lyr"
+
+    uid = models.CharField(null=True, blank=True, max_length=12, unique=True)
     assembly = models.ForeignKey(
         Assembly, on_delete=models.CASCADE, related_name="layers"
     )
     thickness = models.FloatField()
-    segment_id_order = models.JSONField(default=list)
+    position = models.IntegerField(default=0)
+    # -- The stored isothermal-plane R-value [m2-K/W], None if it is unknown
+    r_value = models.FloatField(null=True, blank=True)
+    objects = LayerQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["position", "pk"]
+        indexes = [
+            models.Index(fields=["assembly", "position"], name="layer_assembly_pos_idx")
+        ]
 
     def save(self, *args, **kwargs) -> None:
         # -- Generate the UID if it does not exist
         if not self.uid:
-            self.uid = generate_short_uid(Assembly, "lyr")
+            self.uid = generate_short_uid(Layer, self.UID_PREFIX)
         super().save(*args, **kwargs)
+        self._assemblies.mark_thermal_stale()
+
+    def delete(self, *args, **kwargs):
+        self._assemblies.mark_thermal_stale()
+        return super().delete(*args, **kwargs)
+
+    @property
+    def _assemblies(self) -> AssemblyQuerySet:
+        return Assembly.objects.filter(pk=self.assembly_id)
 
     @property
     def segments(self) -> models.QuerySet["LayerSegment"]:
         return self.segments_set.all()  # type: ignore
 
-    def get_ordered_segments(self):
-        """Return segments ordered according to the segment_id_order field."""
-        # Sort segments by the order in layer_order
-        segments = {segment.pk: segment for segment in self.segments.all()}
-        return [
-            segments[layer_id]
-            for layer_id in self.segment_id_order
-            if layer_id in segments
-        ]
+    def get_ordered_segments(self) -> list["LayerSegment"]:
+        """Return the segments, in 'position' order."""
+        return list(self.segments.all())
 
     @classmethod
     def new_layer_with_single_segment(cls, assembly: Assembly) -> "Layer":
-        """Create a new layer with a single segment."""
-        layer = cls.objects.create(assembly=assembly, thickness=1.0)
-        segment = LayerSegment.objects.create(layer=layer)
-        layer.segment_id_order.append(segment.pk)
-        layer.save()
+        """Create a new layer with a single segment, at the end of the assembly."""
+        layer = cls.objects.create(
+            assembly=assembly, thickness=1.0, position=next_position(assembly.layers)
+        )
+        # -- (Bulk, as the layer's save has already marked the Assembly as stale)
+        LayerSegment.objects.bulk_create(
+            [LayerSegment(layer=layer, position=POSITION_GAP)]
+        )
         return layer
 
     def set_layer_thickness(self, thickness: float) -> None:
@@ -452,19 +883,46 @@ class Layer(models.Model):
         return f"{self.thickness} mm"
 
 
+class LayerSegmentQuerySet(ShortUIDQuerySet):
+    def delete(self):
+        Assembly.objects.filter(layers__segments__in=self).mark_thermal_stale()
+        return super().delete()
+
+
 class LayerSegment(models.Model):
-    uid = models.CharField(null=True, blank=True, max_length=12)
+    UID_PREFIX = "seg"
+
+    uid = models.CharField(null=True, blank=True, max_length=12, unique=True)
     layer = models.ForeignKey(
         Layer, on_delete=models.CASCADE, null=True, related_name="segments"
     )
     material = models.ForeignKey(Material, on_delete=models.CASCADE, null=True)
+    position = models.IntegerField(default=0)
+    objects = LayerSegmentQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["position", "pk"]
+        indexes = [
+            models.Index(fields=["layer", "position"], name="segment_layer_pos_idx")
+        ]
 
     def save(self, *args, **kwargs) -> None:
         # -- Generate the UID if it does not exist
         if not self.uid:
-            self.uid = generate_short_uid(LayerSegment, "seg")
+            self.uid = generate_short_uid(LayerSegment, self.UID_PREFIX)
 
         super().save(*args, **kwargs)
+        self._assemblies.mark_thermal_stale()
+
+    def delete(self, *args, **kwargs):
+        self._assemblies.mark_thermal_stale()
+        return super().delete(*args, **kwargs)
+
+    @property
+    def _assemblies(self) -> AssemblyQuerySet:
+        if self.layer_id is None:
+            return Assembly.objects.none()
+        return Assembly.objects.filter(layers=self.layer_id)
 
     def set_segment_material(self, material: Material) -> None:
         """Set the material of the segment."""
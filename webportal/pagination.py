@@ -0,0 +1,199 @@
+"""Keyset (cursor) pagination.
+
+Unlike Django's `Paginator`, a keyset page never runs a `COUNT(*)` and never
+uses `OFFSET`: each page is fetched with a `WHERE (keys) > (last row's keys)`
+filter, so every page costs the same no matter how deep it is.
+
+That only holds when an index serves the key order. A QuerySet which is the OR of
+several index ranges (ie: a user's own and the public Materials) is sorted as a
+whole, so it is read instead per partition, each of them in key order and
+limited to the page (see `merge_partitions`): the database then only sorts the
+few rows of the page.
+"""
+
+import base64
+import json
+import operator
+from functools import reduce
+from typing import Any, Iterator, Sequence
+
+from django.db import models
+
+
+def encode_cursor(values: list[Any], direction: str) -> str:
+    """Return the URL-safe cursor token for the key values."""
+    data = json.dumps({"k": values, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[list[Any], str]:
+    """Return the key values and the direction ('n' or 'p') from a cursor token."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values, direction = data["k"], data["d"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if not isinstance(values, list) or direction not in ("n", "p"):
+        raise ValueError(f"Invalid cursor: {token}")
+    return values, direction
+
+
+def merge_partitions(
+    queryset: models.QuerySet,
+    partitions: Sequence[models.Q],
+    keys: Sequence[str],
+    limit: int,
+) -> models.QuerySet:
+    """The first `limit` rows of the QuerySet in key order, read per partition.
+
+    The partitions must be disjoint, and together cover the QuerySet. The first
+    `limit` pks of each one are read in key order (by an index), in a subquery, and
+    only those rows are sorted. (A UNION would do, but SQLite does not allow a
+    LIMIT in the parts of one.)
+    """
+    if len(partitions) < 2:
+        return queryset.order_by(*keys)[:limit]
+    firsts = [
+        models.Q(pk__in=queryset.filter(q).order_by(*keys).values("pk")[:limit])
+        for q in partitions
+    ]
+    # -- The page rows are found by pk alone: the QuerySet's own filters are in the
+    # -- subqueries, and left in here would tempt the planner away from the pks
+    page = queryset.all()
+    page.query.clear_where()
+    return page.filter(reduce(operator.or_, firsts)).order_by(*keys)[:limit]
+
+
+class KeysetPage:
+    """A single page of objects, with the cursors for the next / previous pages."""
+
+    def __init__(
+        self,
+        object_list: list,
+        next_cursor: str | None = None,
+        previous_cursor: str | None = None,
+    ):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self) -> Iterator:
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __repr__(self) -> str:
+        return f"<KeysetPage: {len(self)} objects>"
+
+
+def _field_name(key: str) -> str:
+    return key.removeprefix("-")
+
+
+def _reversed_key(key: str) -> str:
+    return key[1:] if key.startswith("-") else f"-{key}"
+
+
+class KeysetPaginator:
+    """Paginate a QuerySet by the (unique) combination of the key fields.
+
+    The keys must be fields or annotations on the QuerySet, in sort order (use a
+    '-' prefix for descending keys), and the last key must be unique (ie: 'pk').
+    With 'partitions', each page is read with merge_partitions.
+    """
+
+    def __init__(
+        self,
+        queryset: models.QuerySet,
+        keys: tuple[str, ...],
+        per_page: int,
+        partitions: Sequence[models.Q] = (),
+    ):
+        self.queryset = queryset
+        self.keys = keys
+        self.per_page = per_page
+        self.partitions = partitions
+
+    def _key_values(self, obj) -> list[Any]:
+        return [getattr(obj, _field_name(key)) for key in self.keys]
+
+    def _after(self, values: list[Any], lookup: str) -> models.Q:
+        """Return the Q for rows sorted after (gt) or before (lt) the key values."""
+        flipped = {"gt": "lt", "lt": "gt"}
+        q = models.Q()
+        for i, key in enumerate(self.keys):
+            equal = {_field_name(k): v for k, v in zip(self.keys[:i], values[:i])}
+            key_lookup = flipped[lookup] if key.startswith("-") else lookup
+            q |= models.Q(**equal, **{f"{_field_name(key)}__{key_lookup}": values[i]})
+        return q
+
+    def _page_queryset(
+        self, cursor: str | None
+    ) -> tuple[models.QuerySet, list[Any] | None, str]:
+        """The QuerySet for the page after (or before) the cursor, and the cursor."""
+        values, direction = None, "n"
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+            except ValueError:
+                values = None
+            if values is not None and len(values) != len(self.keys):
+                values, direction = None, "n"
+
+        qs, keys = self.queryset, self.keys
+        if values is not None and direction == "n":
+            qs = qs.filter(self._after(values, "gt"))
+        elif values is not None:
+            qs = qs.filter(self._after(values, "lt"))
+            keys = tuple(_reversed_key(key) for key in keys)
+
+        # -- Fetch one extra row to know if there is another page in this direction
+        qs = merge_partitions(qs, self.partitions, keys, self.per_page + 1)
+        return qs, values, direction
+
+    def page_queryset(self, cursor: str | None = None) -> models.QuerySet:
+        """The QuerySet which reads the page (ie: to EXPLAIN it)."""
+        return self._page_queryset(cursor)[0]
+
+    def _build_page(
+        self, rows: list, values: list[Any] | None, direction: str
+    ) -> KeysetPage:
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == "p" and values is not None:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        if not rows:
+            return KeysetPage([])
+        return KeysetPage(
+            rows,
+            next_cursor=(
+                encode_cursor(self._key_values(rows[-1]), "n") if has_next else None
+            ),
+            previous_cursor=(
+                encode_cursor(self._key_values(rows[0]), "p") if has_previous else None
+            ),
+        )
+
+    def page(self, cursor: str | None = None) -> KeysetPage:
+        """Return the page which follows (or precedes) the cursor."""
+        qs, values, direction = self._page_queryset(cursor)
+        return self._build_page(list(qs), values, direction)
+
+    async def apage(self, cursor: str | None = None) -> KeysetPage:
+        """The async version of page, using the async ORM."""
+        qs, values, direction = self._page_queryset(cursor)
+        return self._build_page([row async for row in qs], values, direction)
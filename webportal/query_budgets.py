@@ -0,0 +1,36 @@
+"""Per-view SQL query budgets.
+
+Every view in `webportal.views` declares the most SQL queries it may run with the
+`@query_budget(n)` decorator. The budget must not depend on the amount of data:
+tests/test_query_budgets.py runs every view against a small and a large dataset
+and fails if either run goes over budget, or if the large run needs more queries
+than the small one (ie: an N+1 lookup), listing the SQL of the offending run.
+"""
+
+from typing import Callable, Iterable
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Declare the maximum number of SQL queries the view may run per request."""
+
+    def decorator(view: Callable) -> Callable:
+        view.query_budget = max_queries  # type: ignore
+        return view
+
+    return decorator
+
+
+def get_query_budget(view: Callable) -> int | None:
+    """Return the view's query budget, looking through any wrapping decorators."""
+    while view is not None:
+        if (budget := getattr(view, "query_budget", None)) is not None:
+            return budget
+        view = getattr(view, "__wrapped__", None)  # type: ignore
+    return None
+
+
+def format_queries(queries: Iterable[dict]) -> str:
+    """Return the captured queries (ie: CaptureQueriesContext) as a numbered list."""
+    return "\n".join(
+        f"  {i:>3}. {query['sql']}" for i, query in enumerate(queries, start=1)
+    )
@@ -1,7 +1,15 @@
+import csv
+import io
+import json
+from typing import Any, Iterator
+
+from django.db import transaction
+from django.db.models import QuerySet
 from import_export import fields, resources
 from import_export.widgets import ForeignKeyWidget
 
-from webportal.models import Material, MaterialCategory
+from webportal.models import Material, MaterialCategory, MaterialChange, User
+from webportal.uids import assign_short_uids, existing_uids
 
 
 class MaterialResource(resources.ModelResource):
@@ -13,7 +21,7 @@ class MaterialResource(resources.ModelResource):
 
     def dehydrate_category(self, obj: Material) -> str | None:
         # Get the display-name for the 'category' from its code
-        return MaterialCategory.get_category_display_name(obj.category.category)  # type: ignore
+        return MaterialCategory.CATEGORY_NAMES.get(obj.category.category)  # type: ignore
 
     def before_import_row(self, row, **kwargs) -> None:
         # Convert the category display-name back to the category-code
@@ -21,7 +29,8 @@ class MaterialResource(resources.ModelResource):
             code = MaterialCategory.get_category_code(row["category"])
 
             # Ensure that the category exists in the database
-            MaterialCategory.objects.get_or_create(category=code)
+            if code:
+                MaterialCategory.objects.get_for_code(code)
             row["category"] = code
 
         # Set the user field for each Material instance
@@ -32,6 +41,62 @@ class MaterialResource(resources.ModelResource):
     def after_init_instance(self, instance, new, row, **kwargs):
         instance.user = kwargs.get("user")
 
+    def _export_rows(self, queryset: QuerySet, chunk_size: int) -> Iterator[list]:
+        """The export columns of each Material (with the category's display-name)."""
+        columns = [
+            "category__category" if name == "category" else name
+            for name in self._meta.fields
+        ]
+        category_index = columns.index("category__category")
+        rows = queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+        for row in rows:
+            row = list(row)
+            row[category_index] = MaterialCategory.CATEGORY_NAMES.get(
+                row[category_index]
+            )
+            yield row
+
+    def iter_csv(self, queryset: QuerySet, chunk_size: int = 2000) -> Iterator[str]:
+        """Yield the same CSV as `export(queryset).csv`, a chunk of rows at a time.
+
+        Rows are read as plain tuples with a server-side cursor, so memory use stays
+        flat no matter how many Materials are exported.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.get_export_headers())
+
+        for i, row in enumerate(self._export_rows(queryset, chunk_size), start=1):
+            writer.writerow(row)
+            if i % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if remainder := buffer.getvalue():
+            yield remainder
+
+    def iter_dicts(self, queryset: QuerySet, chunk_size: int = 2000) -> Iterator[dict]:
+        """Yield each Material as a dict of the export columns, by name."""
+        names = list(self._meta.fields)
+        for row in self._export_rows(queryset, chunk_size):
+            yield dict(zip(names, row))
+
+    def iter_json(self, queryset: QuerySet, chunk_size: int = 2000) -> Iterator[str]:
+        """Yield the Materials as a JSON array of objects (see `iter_dicts`).
+
+        Like `iter_csv`, a chunk of rows at a time.
+        """
+        chunk = ["["]
+        for i, row in enumerate(self.iter_dicts(queryset, chunk_size), start=1):
+            if i > 1:
+                chunk.append(",")
+            chunk.append(json.dumps(row, separators=(",", ":")))
+            if i % chunk_size == 0:
+                yield "".join(chunk)
+                chunk.clear()
+        chunk.append("]")
+        yield "".join(chunk)
+
     class Meta:
         model = Material
         fields = (
@@ -53,3 +118,155 @@ class MaterialResource(resources.ModelResource):
             "comments",
             "color_argb",
         )
+
+
+# ---------------------------------------------------------------------------------------
+# -- Bulk Import
+
+
+class MaterialImportResult:
+    """The outcome of a bulk Material import."""
+
+    def __init__(self):
+        self.created: list[Material] = []
+        self.skipped: int = 0
+        self.errors: list[str] = []
+
+    def has_errors(self) -> bool:
+        return bool(self.errors)
+
+
+class MaterialImporter:
+    """Validate and import a whole CSV of Materials in a single pass.
+
+    The CSV uses the same columns as `MaterialResource` exports. Every row is
+    validated in memory first and nothing is written if any row has an error.
+    Rows which match a Material already in the user's library (on all of
+    `MaterialResource.Meta.import_id_fields`) are skipped. All the new rows are
+    then written with `bulk_create`, in one transaction.
+    """
+
+    def __init__(self, user: User, batch_size: int = 1000):
+        self.user = user
+        self.batch_size = batch_size
+
+    def _categories(self) -> dict[str, MaterialCategory]:
+        """Return all the MaterialCategories by code, creating any which are missing."""
+        return {
+            code: MaterialCategory.objects.get_for_code(code)
+            for code in MaterialCategory.CATEGORY_NAMES
+        }
+
+    def _existing_keys(self) -> set[tuple]:
+        """Return the import_id_fields values of every Material in the user's library."""
+        id_fields = [
+            "category__category" if name == "category" else name
+            for name in MaterialResource.Meta.import_id_fields
+        ]
+        return set(
+            Material.objects.filter(user=self.user)
+            .values_list(*id_fields)
+            .iterator(chunk_size=self.batch_size)
+        )
+
+    @staticmethod
+    def _text(row: dict[str, Any], column: str) -> str | None:
+        value = (row.get(column) or "").strip()
+        return value or None
+
+    @staticmethod
+    def _float(row: dict[str, Any], column: str, default: float | None) -> float:
+        value = (row.get(column) or "").strip()
+        if not value:
+            if default is None:
+                raise ValueError(f"'{column}' is required")
+            return default
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"'{column}' must be a number, got '{value}'")
+
+    def _build_material(self, row: dict[str, Any], categories) -> Material:
+        """Return a new (unsaved) Material for the CSV row, or raise ValueError."""
+        category_name = (row.get("category") or "").strip()
+        code = MaterialCategory.CATEGORY_CODES.get(category_name, category_name.upper())
+        if code not in categories:
+            raise ValueError(f"Invalid category: '{category_name}'")
+
+        name = self._text(row, "name")
+        if not name:
+            raise ValueError("'name' is required")
+
+        conductivity = self._float(row, "conductivity", None)
+        if conductivity <= 0:
+            raise ValueError("Conductivity must be greater than 0")
+
+        emissivity = self._float(row, "emissivity", 0.9)
+        if emissivity < 0 or emissivity > 1:
+            raise ValueError("Emissivity must be between 0.0 and 1.0")
+
+        return Material(
+            uid=self._text(row, "uid"),
+            user=self.user,
+            name=name,
+            conductivity=conductivity,
+            emissivity=emissivity,
+            source=self._text(row, "source"),
+            comments=self._text(row, "comments"),
+            color_argb=self._text(row, "color_argb") or "255,255,255,255",
+            category=categories[code],
+        )
+
+    def _assign_uids(self, materials: list[Material]) -> None:
+        """Keep each row's UID unless it is already taken, otherwise allocate a new one."""
+        uids = [m.uid for m in materials if m.uid]
+        taken = existing_uids(Material, set(uids))
+        seen: set[str] = set()
+        for material in materials:
+            if material.uid in taken or material.uid in seen:
+                material.uid = None
+            elif material.uid:
+                seen.add(material.uid)
+        assign_short_uids(Material, materials)
+
+    def import_csv(self, csv_text: str) -> MaterialImportResult:
+        """Validate and import the Materials from the CSV text."""
+        result = MaterialImportResult()
+        categories = self._categories()
+        existing = self._existing_keys()
+
+        new_materials: list[Material] = []
+        for line_number, row in enumerate(csv.DictReader(io.StringIO(csv_text)), 2):
+            try:
+                material = self._build_material(row, categories)
+            except ValueError as e:
+                result.errors.append(f"Line {line_number}: {e}")
+                continue
+
+            key = (
+                material.category.category,  # type: ignore
+                material.name,
+                material.conductivity,
+                material.emissivity,
+                material.source,
+                material.comments,
+                material.color_argb,
+            )
+            if key in existing:
+                result.skipped += 1
+                continue
+            existing.add(key)
+            new_materials.append(material)
+
+        if result.has_errors():
+            return result
+
+        with transaction.atomic():
+            self._assign_uids(new_materials)
+            result.created = Material.objects.bulk_create(
+                new_materials, batch_size=self.batch_size
+            )
+            # -- bulk_create does not send post_save, so record the changes here
+            # -- (which also invalidates the cached material-list responses)
+            MaterialChange.record(result.created, MaterialChange.CREATED)
+        return result
@@ -3,10 +3,11 @@ import os
 
 import dotenv
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
 from django.dispatch import receiver
 
-from .models import Team, User
+from .models import Material, MaterialCategory, MaterialChange, Team, User
+from .thermal import invalidate_material_results
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
@@ -55,3 +56,66 @@ def create_super_user(sender, **kwargs):
             logger.info("Superuser 'admin' already exists.")
     except Exception as e:
         logger.error(f"Error creating superuser: {e}")
+
+
+@receiver(post_migrate)
+def create_material_categories(sender, **kwargs):
+    """Ensure all of the MaterialCategories exist, and reset the category cache."""
+    try:
+        MaterialCategory.objects.bulk_create(
+            [
+                MaterialCategory(category=code)
+                for code in MaterialCategory.CATEGORY_NAMES
+            ],
+            ignore_conflicts=True,
+        )
+    except Exception as e:
+        logger.error(f"Error creating material categories: {e}")
+    finally:
+        MaterialCategory.objects.clear_cache()
+
+
+@receiver(post_save, sender=MaterialCategory)
+@receiver(post_delete, sender=MaterialCategory)
+def clear_material_category_cache(sender, **kwargs):
+    """Reset the category cache whenever a MaterialCategory is changed."""
+    MaterialCategory.objects.clear_cache()
+
+
+@receiver(post_save, sender=MaterialCategory)
+def update_material_category_codes(sender, instance, created, raw=False, **kwargs):
+    """Keep the Materials' copy of the category code (ie: after an admin edit)."""
+    if not created and not raw:
+        Material.objects.filter(category=instance).exclude(
+            category_code=instance.category
+        ).update(category_code=instance.category)
+
+
+@receiver(post_save, sender=Material)
+def record_material_save(sender, instance, created, raw=False, **kwargs):
+    """Add the new (or changed) Material to the change-log.
+
+    (Its new version also invalidates the cached material-list responses.)
+    """
+    if not raw:
+        action = MaterialChange.CREATED if created else MaterialChange.UPDATED
+        MaterialChange.record([instance], action)
+
+
+@receiver(post_delete, sender=Material)
+def record_material_delete(sender, instance, **kwargs):
+    """Add the deleted Material to the change-log."""
+    MaterialChange.record([instance], MaterialChange.DELETED)
+
+
+@receiver(post_save, sender=Material)
+def invalidate_material_thermal_results(sender, instance, created, **kwargs):
+    """Mark the Assemblies using the Material as stale, if its conductivity changed."""
+    if not created and instance.conductivity_changed:
+        invalidate_material_results(instance.pk)
+
+
+@receiver(pre_delete, sender=Material)
+def invalidate_deleted_material_thermal_results(sender, instance, **kwargs):
+    """Mark the Assemblies using the Material as stale, before its segments go."""
+    invalidate_material_results(instance.pk)
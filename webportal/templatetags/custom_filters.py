@@ -1,22 +1,20 @@
 from django import template
 
+from webportal.models import conductivity_factor, resistivity_factor
+
 register = template.Library()
 
 
 @register.filter
 def display_conductivity(conductivity, request):
     unit_system = request.session.get("unit_system", "SI")
-    if unit_system == "IP":
-        conductivity = conductivity * 0.577789236
-    return conductivity
+    return conductivity * conductivity_factor(unit_system)
 
 
 @register.filter
 def display_resistivity(conductivity, request):
     unit_system = request.session.get("unit_system", "SI")
-    if unit_system == "IP":
-        conductivity = 1 / (conductivity * 0.577789236 * 12)
-    return conductivity
+    return 1 / (conductivity * resistivity_factor(unit_system))
 
 
 @register.filter
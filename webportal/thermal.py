@@ -0,0 +1,312 @@
+"""Assembly thermal calculations (R-value / U-value).
+
+All calculations run on padded NumPy arrays so that any number of assemblies are
+evaluated together in a single vectorized pass:
+
+    thickness       (n_assemblies, n_layers)                [m]
+    conductivity    (n_assemblies, n_layers, n_segments)    [W/(m-K)]
+    fraction        (n_assemblies, n_layers, n_segments)    [-] width of each segment
+
+Missing layers are padded with zero-thickness layers and missing segments with
+zero-width segments, so they add no resistance. Segments without a Material have
+an unknown conductivity (NaN) which makes that assembly's results NaN.
+
+LayerSegments do not store a width, so the segments in a Layer are taken to be of
+equal width.
+
+Results follow ISO-6946 naming:
+    * isothermal-plane: each layer's segments are combined in parallel, and the
+      layers are then added in series (the 'lower' bound).
+    * parallel-path: the assembly is cut into sections through all the layers,
+      each section's layers are added in series and the sections are then
+      combined in parallel (the 'upper' bound).
+    * total: the average of the two.
+
+The results (without surface films) are also stored on the Layer / Assembly rows,
+so reading an assembly's U-value is a column read. Views which edit layers call
+`store_results` for the Assembly afterwards, which re-reads only the thickness
+and conductivity columns and writes the rows whose results changed. Saving or
+deleting a Layer / LayerSegment (ie: in the admin), or editing a Material's
+conductivity, marks the Assemblies as stale (in one query); they are
+recalculated together the next time they are read with `get_stored_results`.
+(Queryset `update()` calls do not mark anything.)
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from webportal.models import Assembly, Layer, Project
+
+
+@dataclass
+class AssemblyArrays:
+    """The padded input arrays for a batch of assemblies."""
+
+    thickness: np.ndarray
+    conductivity: np.ndarray
+    fraction: np.ndarray
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.conductivity.shape  # type: ignore
+
+    @classmethod
+    def from_rows(
+        cls, rows: Sequence[Sequence[tuple[float, Sequence[float | None]]]]
+    ) -> "AssemblyArrays":
+        """Build the arrays from the (thickness, segment conductivities) of each
+        assembly's layers, in order. A conductivity of None is unknown.
+        """
+        n_assemblies = len(rows)
+        n_layers = max((len(layers) for layers in rows), default=0)
+        n_segments = max(
+            (len(segments) for layers in rows for _, segments in layers), default=0
+        )
+        n_segments = max(n_segments, 1)
+
+        thickness = np.zeros((n_assemblies, n_layers))
+        conductivity = np.ones((n_assemblies, n_layers, n_segments))
+        fraction = np.zeros((n_assemblies, n_layers, n_segments))
+        fraction[:, :, 0] = 1.0
+        for i, layers in enumerate(rows):
+            for j, (layer_thickness, conductivities) in enumerate(layers):
+                thickness[i, j] = layer_thickness
+                if not conductivities:
+                    conductivity[i, j, 0] = np.nan
+                    continue
+                fraction[i, j, :] = 0.0
+                fraction[i, j, : len(conductivities)] = 1.0 / len(conductivities)
+                conductivity[i, j, : len(conductivities)] = [
+                    np.nan if k is None else k for k in conductivities
+                ]
+        return cls(thickness, conductivity, fraction)
+
+    @classmethod
+    def from_layers(
+        cls, assembly_layers: Sequence[Sequence[Layer]]
+    ) -> "AssemblyArrays":
+        """Build the arrays from the ordered Layers of each assembly.
+
+        Segments are read with `Layer.get_ordered_segments` so load the layers with
+        `Assembly.objects.with_layer_tree()` to avoid a query per layer.
+        """
+        return cls.from_rows(
+            [
+                [
+                    (
+                        layer.thickness,
+                        [
+                            seg.material.conductivity if seg.material else None
+                            for seg in layer.get_ordered_segments()
+                        ],
+                    )
+                    for layer in layers
+                ]
+                for layers in assembly_layers
+            ]
+        )
+
+    @classmethod
+    def from_assemblies(cls, assemblies: Iterable[Assembly]) -> "AssemblyArrays":
+        """Build the arrays from the Assemblies, in their layer order."""
+        return cls.from_layers([asm.get_ordered_layers() for asm in assemblies])
+
+
+@dataclass
+class ThermalResults:
+    """The thermal results for a batch of assemblies. R in m2-K/W, U in W/(m2-K)."""
+
+    layer_r_values: np.ndarray
+    r_isothermal: np.ndarray
+    r_parallel: np.ndarray
+    r_total: np.ndarray
+    u_value: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.r_total)
+
+
+def segment_r_values(arrays: AssemblyArrays) -> np.ndarray:
+    """Return the R-value of every segment. Shape: (n_assemblies, n_layers, n_segments)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return arrays.thickness[:, :, np.newaxis] / arrays.conductivity
+
+
+def layer_r_values(arrays: AssemblyArrays) -> np.ndarray:
+    """Return the isothermal-plane R-value of every layer. Shape: (n_assemblies, n_layers)."""
+    # -- Zero-width (padding) segments must not carry a NaN into the sum
+    weighted_k = np.where(
+        arrays.fraction > 0, arrays.fraction * arrays.conductivity, 0.0
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return arrays.thickness / weighted_k.sum(axis=-1)
+
+
+def parallel_path_r_values(arrays: AssemblyArrays, r_films: float = 0.0) -> np.ndarray:
+    """Return the parallel-path R-value of each assembly. Shape: (n_assemblies,)."""
+    n_assemblies, n_layers, n_segments = arrays.shape
+    if n_layers == 0:
+        return np.full(n_assemblies, r_films)
+
+    # -- Section boundaries are the union of every layer's segment edges
+    seg_ends = np.cumsum(arrays.fraction, axis=-1)
+    seg_ends /= seg_ends[:, :, -1:]
+    edges = np.sort(
+        np.concatenate(
+            [np.zeros((n_assemblies, 1)), seg_ends.reshape(n_assemblies, -1)], axis=-1
+        ),
+        axis=-1,
+    )
+    widths = np.diff(edges, axis=-1)
+    midpoints = edges[:, :-1] + widths / 2
+
+    # -- The segment (in every layer) which each section passes through
+    seg_index = (
+        seg_ends[:, :, np.newaxis, :] <= midpoints[:, np.newaxis, :, np.newaxis]
+    ).sum(axis=-1)
+    seg_index = np.minimum(seg_index, n_segments - 1)
+
+    section_layer_r = np.take_along_axis(segment_r_values(arrays), seg_index, axis=-1)
+    section_r = section_layer_r.sum(axis=1) + r_films
+    with np.errstate(divide="ignore", invalid="ignore"):
+        section_u = np.where(widths > 0, widths / section_r, 0.0)
+        return 1.0 / section_u.sum(axis=-1)
+
+
+def calculate(
+    arrays: AssemblyArrays, r_si: float = 0.0, r_se: float = 0.0
+) -> ThermalResults:
+    """Calculate the thermal results for every assembly in the arrays.
+
+    r_si / r_se are the interior / exterior surface film resistances [m2-K/W]
+    added to each assembly's total.
+    """
+    r_films = r_si + r_se
+    layers_r = layer_r_values(arrays)
+    r_isothermal = layers_r.sum(axis=-1) + r_films
+    r_parallel = parallel_path_r_values(arrays, r_films)
+    r_total = (r_isothermal + r_parallel) / 2
+    with np.errstate(divide="ignore"):
+        u_value = 1.0 / r_total
+    return ThermalResults(layers_r, r_isothermal, r_parallel, r_total, u_value)
+
+
+def calculate_assemblies(
+    assemblies: Sequence[Assembly], r_si: float = 0.0, r_se: float = 0.0
+) -> ThermalResults:
+    """Calculate the thermal results for the Assemblies, in the order given."""
+    return calculate(AssemblyArrays.from_assemblies(assemblies), r_si, r_se)
+
+
+def calculate_project(
+    project: Project, r_si: float = 0.0, r_se: float = 0.0
+) -> tuple[list[Assembly], ThermalResults]:
+    """Calculate the thermal results for all of the Project's Assemblies."""
+    assemblies = list(Assembly.objects.filter(project=project).with_layer_tree())
+    return assemblies, calculate_assemblies(assemblies, r_si, r_se)
+
+
+# ---------------------------------------------------------------------------------------
+# -- Stored results
+
+
+def _stored(value: float) -> float | None:
+    """Unknown (NaN) and unbounded results are stored as None."""
+    return float(value) if np.isfinite(value) else None
+
+
+RESULT_FIELDS = ("r_isothermal", "r_parallel", "r_total", "u_value")
+
+
+def store_results(assembly_pks: Iterable[int]) -> list[Assembly]:
+    """Recalculate and store the layer and assembly results of the Assemblies.
+
+    Reads only the layer thicknesses and segment conductivities, in one query,
+    and then writes just the Layers whose R-value changed and the Assemblies.
+    Returns the stored (unsaved, results-only) Assembly rows, in order.
+    """
+    assembly_pks = list(dict.fromkeys(assembly_pks))
+    if not assembly_pks:
+        return []
+    layer_rows = (
+        Layer.objects.filter(assembly_id__in=assembly_pks)
+        .order_by("assembly_id", "position", "pk", "segments__position", "segments__pk")
+        .values_list(
+            "assembly_id",
+            "pk",
+            "thickness",
+            "r_value",
+            "segments__pk",
+            "segments__material__conductivity",
+        )
+    )
+    # -- {assembly: {layer: (thickness, stored r_value, segment conductivities)}}
+    layers: dict[int, dict[int, tuple]] = {pk: {} for pk in assembly_pks}
+    for (
+        assembly_pk,
+        layer_pk,
+        thickness,
+        r_value,
+        segment_pk,
+        conductivity,
+    ) in layer_rows:
+        _, _, conductivities = layers[assembly_pk].setdefault(
+            layer_pk, (thickness, r_value, [])
+        )
+        if segment_pk is not None:
+            conductivities.append(conductivity)
+
+    results = calculate(
+        AssemblyArrays.from_rows(
+            [
+                [(thickness, conductivities) for thickness, _, conductivities in rows]
+                for rows in (layers[pk].values() for pk in assembly_pks)
+            ]
+        )
+    )
+
+    changed_layers = []
+    for i, assembly_pk in enumerate(assembly_pks):
+        for j, (layer_pk, (_, r_value, _)) in enumerate(layers[assembly_pk].items()):
+            if (new_r_value := _stored(results.layer_r_values[i, j])) != r_value:
+                changed_layers.append(Layer(pk=layer_pk, r_value=new_r_value))
+    if changed_layers:
+        Layer.objects.bulk_update(changed_layers, ["r_value"])
+
+    assemblies = []
+    for i, assembly_pk in enumerate(assembly_pks):
+        assembly = Assembly(pk=assembly_pk, thermal_stale=False)
+        # -- An Assembly without any layers has no result
+        if layers[assembly_pk]:
+            for name in RESULT_FIELDS:
+                setattr(assembly, name, _stored(getattr(results, name)[i]))
+        assemblies.append(assembly)
+    Assembly.objects.bulk_update(assemblies, [*RESULT_FIELDS, "thermal_stale"])
+    return assemblies
+
+
+def invalidate_material_results(material_pk: int) -> int:
+    """Mark every Assembly which uses the Material as stale, in one query."""
+    return (
+        Assembly.objects.filter(layers__segments__material_id=material_pk)
+        .distinct()
+        .update(thermal_stale=True)
+    )
+
+
+def get_stored_results(assemblies: Iterable[Assembly]) -> list[Assembly]:
+    """Return the (loaded) Assemblies with up-to-date stored results.
+
+    Any stale Assemblies are recalculated first, all together, and their result
+    fields are set in place, so they are not loaded again. (The r_value of any
+    Layers loaded with them is not refreshed.)
+    """
+    loaded = list(assemblies)
+    if stale := [assembly for assembly in loaded if assembly.thermal_stale]:
+        stored = {a.pk: a for a in store_results(a.pk for a in stale)}
+        for assembly in stale:
+            for name in [*RESULT_FIELDS, "thermal_stale"]:
+                setattr(assembly, name, getattr(stored[assembly.pk], name))
+    return loaded
@@ -0,0 +1,77 @@
+"""Short-UID allocation for the webportal models.
+
+UIDs are handed out in blocks: a whole batch of candidates is checked against the
+database with a single `uid IN (...)` query (per chunk) rather than one
+`.exists()` query per object. The unique index on each model's `uid` column is
+the final guard against collisions.
+"""
+
+import uuid
+from typing import Iterable
+
+from django.db import models
+
+# -- Keep well under SQLite's bound-parameter limit for the 'uid IN (...)' lookups
+UID_QUERY_CHUNK_SIZE = 900
+
+
+def _normalize_prefix(_prefix: str) -> str:
+    """Return the 3-character UID prefix. ie: 'Material' -> 'mat'."""
+    return (_prefix.lower() + "___")[:3]
+
+
+def new_short_uid(_prefix: str) -> str:
+    """Return a new (unchecked) short UID string. ie: 'mat6af2fd74'."""
+    return _normalize_prefix(_prefix) + str(int(uuid.uuid4().time_low))[2:]
+
+
+def existing_uids(_model_type, _uids: set[str]) -> set[str]:
+    """Return the subset of the UIDs which are already used in the database."""
+    existing: set[str] = set()
+    uids = list(_uids)
+    for i in range(0, len(uids), UID_QUERY_CHUNK_SIZE):
+        chunk = uids[i : i + UID_QUERY_CHUNK_SIZE]
+        existing.update(
+            _model_type._base_manager.filter(uid__in=chunk)
+            .order_by()
+            .values_list("uid", flat=True)
+        )
+    return existing
+
+
+def generate_short_uids(_model_type, _prefix: str, _count: int) -> list[str]:
+    """Generate a block of unique short UIDs which are not yet used by the model.
+
+    Costs one query per round (per chunk of UIDs). A second round is only needed
+    if a candidate collides with an existing UID.
+    """
+    uids: set[str] = set()
+    while len(uids) < _count:
+        candidates = {new_short_uid(_prefix) for _ in range(_count - len(uids))}
+        candidates -= uids
+        uids |= candidates - existing_uids(_model_type, candidates)
+    return list(uids)
+
+
+def generate_short_uid(_model_type, _prefix: str) -> str:
+    """Generates a short (12-character) UID string. ie: 'mat6af2fd74'."""
+    return generate_short_uids(_model_type, _prefix, 1)[0]
+
+
+def assign_short_uids(_model_type, _objs: Iterable[models.Model]) -> None:
+    """Set a new UID on each of the (unsaved) objects which do not have one yet."""
+    missing = [obj for obj in _objs if not getattr(obj, "uid", None)]
+    if not missing:
+        return
+    uids = generate_short_uids(_model_type, _model_type.UID_PREFIX, len(missing))
+    for obj, uid in zip(missing, uids):
+        obj.uid = uid  # type: ignore
+
+
+class ShortUIDQuerySet(models.QuerySet):
+    """QuerySet which allocates UIDs for all the objects in a `bulk_create` at once."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        assign_short_uids(self.model, objs)
+        return super().bulk_create(objs, *args, **kwargs)
@@ -1,10 +1,11 @@
 from django.urls import include, path
 
-from webportal.views import assembly, materials, settings, views
+from webportal.views import api, assembly, materials, settings, views
 
 urlpatterns = [
     path("select2/", include("django_select2.urls")),
     path("", views.index, name="index"),
+    path("metrics", views.metrics, name="metrics"),
     path("account-settings/", settings.account_settings, name="account-settings"),
     path(
         "account-settings/update-team-name/",
@@ -62,6 +63,7 @@ urlpatterns = [
         name="delete-material",
     ),
     path("get-materials", materials.get_materials, name="get-materials"),
+    path("materials/search", materials.material_search, name="material-search"),
     path("materials/export-csv", materials.export_csv, name="export-csv"),
     path(
         "materials/import-materials",
@@ -72,6 +74,15 @@ urlpatterns = [
         "materials/set-unit-system", materials.set_unit_system, name="set-unit-system"
     ),
     # -----------------------------------------------------------------------------------
+    # -- JSON API
+    path("api/materials", api.material_library, name="api-material-library"),
+    path("api/materials/changes", api.material_changes, name="api-material-changes"),
+    path(
+        "api/projects/<int:project_pk>/constructions",
+        api.project_constructions,
+        name="api-project-constructions",
+    ),
+    # -----------------------------------------------------------------------------------
     # -- Assemblies
     path("assemblies/", assembly.assemblies_page, name="assemblies-page-landing"),
     path("assemblies/<int:project_pk>/", assembly.assembly, name="assembly-landing"),
@@ -96,6 +107,16 @@ urlpatterns = [
         assembly.delete_assembly,
         name="delete-assembly",
     ),
+    path(
+        "assemblies/<int:project_pk>/<int:assembly_pk>/clone-assembly",
+        assembly.clone_assembly,
+        name="clone-assembly",
+    ),
+    path(
+        "assemblies/<int:project_pk>/clone-project",
+        assembly.clone_project,
+        name="clone-project",
+    ),
     # -----------------------------------------------------------------------------------
     # -- Assembly Details
     path(
@@ -118,4 +139,9 @@ urlpatterns = [
         assembly.update_layer_material,
         name="update-layer-material",
     ),
+    path(
+        "assemblies/<int:project_pk>/<int:assembly_pk>/layer-operations/",
+        assembly.layer_operations,
+        name="layer-operations",
+    ),
 ]
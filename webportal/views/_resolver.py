@@ -0,0 +1,165 @@
+"""A request-scoped identity map for the Projects, Assemblies and Layers of a request.
+
+A view, and every fragment builder it composes, gets its objects from the
+request's `ObjectResolver` rather than each running its own `get_object_or_404`.
+Each object is loaded (at most) once per request, with the check that it belongs
+to the user's Team in the same query: an Assembly or Layer is only found within
+its Project (and Assembly), and a Project only if it was created by the Team.
+Objects loaded together (ie: a Layer's Assembly and Project) are remembered too.
+"""
+
+from django.db import models
+from django.http import Http404, HttpRequest
+
+from webportal.models import Assembly, Layer, Project, User
+
+
+class ObjectResolver:
+    """The user's Projects, Assemblies and Layers, each loaded once (or raise Http404)."""
+
+    def __init__(self, user: User):
+        self.team_id = user.team_id  # type: ignore
+        self._projects: dict[int, Project] = {}
+        self._assemblies: dict[int, Assembly] = {}
+        self._trees: set[int] = set()
+        self._layers: dict[int, Layer] = {}
+        self._project_assemblies: dict[int, list[Assembly]] = {}
+
+    # -----------------------------------------------------------------------------------
+    # -- QuerySets, with the Team check
+
+    def _owned(self, queryset: models.QuerySet, team_lookup: str) -> models.QuerySet:
+        if self.team_id is None:
+            return queryset.none()
+        return queryset.filter(**{team_lookup: self.team_id})
+
+    def _project_qs(self, pk: int) -> models.QuerySet:
+        return self._owned(Project.objects.filter(pk=pk), "create_by__team_id")
+
+    def _assembly_qs(self, project_pk: int, pk: int, tree: bool) -> models.QuerySet:
+        assemblies = Assembly.objects.with_layer_tree() if tree else Assembly.objects
+        return self._owned(
+            assemblies.select_related("project").filter(pk=pk, project_id=project_pk),
+            "project__create_by__team_id",
+        )
+
+    def _layer_qs(self, project_pk: int, assembly_pk: int, pk: int) -> models.QuerySet:
+        return self._owned(
+            Layer.objects.select_related("assembly__project").filter(
+                pk=pk, assembly_id=assembly_pk, assembly__project_id=project_pk
+            ),
+            "assembly__project__create_by__team_id",
+        )
+
+    # -----------------------------------------------------------------------------------
+    # -- The identity map
+
+    def remember(self, obj: Project | Assembly | Layer) -> None:
+        """Add the object (ie: a new one) and the objects loaded with it to the map."""
+        if isinstance(obj, Layer):
+            self._layers[obj.pk] = obj
+            obj = obj.assembly
+        if isinstance(obj, Assembly):
+            self._assemblies.setdefault(obj.pk, obj)
+            if (project := self._projects.get(obj.project_id)) is not None:  # type: ignore
+                obj.project = project
+            obj = obj.project
+        self._projects.setdefault(obj.pk, obj)
+
+    def forget(self, obj: Project | Assembly | Layer) -> None:
+        """Drop the (ie: deleted or changed) object, so it is loaded again if needed."""
+        if isinstance(obj, Project):
+            self._projects.pop(obj.pk, None)
+            self._project_assemblies.pop(obj.pk, None)
+        elif isinstance(obj, Assembly):
+            self._assemblies.pop(obj.pk, None)
+            self._trees.discard(obj.pk)
+            self._project_assemblies.pop(obj.project_id, None)  # type: ignore
+        else:
+            self._layers.pop(obj.pk, None)
+
+    def _cached_assembly(self, pk: int, tree: bool) -> Assembly | None:
+        if tree and pk not in self._trees:
+            return None
+        return self._assemblies.get(pk)
+
+    def _remember_assembly(self, assembly: Assembly, tree: bool) -> Assembly:
+        self._assemblies[assembly.pk] = assembly
+        if tree:
+            self._trees.add(assembly.pk)
+        self.remember(assembly)
+        return assembly
+
+    # -----------------------------------------------------------------------------------
+    # -- Sync
+
+    def project(self, pk: int) -> Project:
+        if (project := self._projects.get(pk)) is None:
+            if (project := self._project_qs(pk).first()) is None:
+                raise Http404("No Project matches the given query.")
+            self.remember(project)
+        return project
+
+    def assembly(self, project_pk: int, pk: int, tree: bool = False) -> Assembly:
+        """The Assembly in the Project, with its whole Layer tree if 'tree' is set."""
+        if (assembly := self._cached_assembly(pk, tree)) is None:
+            if (assembly := self._assembly_qs(project_pk, pk, tree).first()) is None:
+                raise Http404("No Assembly matches the given query.")
+            self._remember_assembly(assembly, tree)
+        return assembly
+
+    def layer(self, project_pk: int, assembly_pk: int, pk: int) -> Layer:
+        if (layer := self._layers.get(pk)) is None:
+            if (layer := self._layer_qs(project_pk, assembly_pk, pk).first()) is None:
+                raise Http404("No Layer matches the given query.")
+            self.remember(layer)
+        return layer
+
+    def project_assemblies(self, project_pk: int) -> list[Assembly]:
+        """The Project's Assemblies, in order (for the sidebar)."""
+        if (assemblies := self._project_assemblies.get(project_pk)) is None:
+            project = self.project(project_pk)
+            assemblies = list(Assembly.objects.filter(project=project))
+            self._project_assemblies[project_pk] = assemblies
+        return assemblies
+
+    # -----------------------------------------------------------------------------------
+    # -- Async
+
+    async def aproject(self, pk: int) -> Project:
+        if (project := self._projects.get(pk)) is None:
+            if (project := await self._project_qs(pk).afirst()) is None:
+                raise Http404("No Project matches the given query.")
+            self.remember(project)
+        return project
+
+    async def aassembly(self, project_pk: int, pk: int, tree: bool = False) -> Assembly:
+        if (assembly := self._cached_assembly(pk, tree)) is None:
+            qs = self._assembly_qs(project_pk, pk, tree)
+            if (assembly := await qs.afirst()) is None:
+                raise Http404("No Assembly matches the given query.")
+            self._remember_assembly(assembly, tree)
+        return assembly
+
+    async def aproject_assemblies(self, project_pk: int) -> list[Assembly]:
+        if (assemblies := self._project_assemblies.get(project_pk)) is None:
+            project = await self.aproject(project_pk)
+            assemblies = [a async for a in Assembly.objects.filter(project=project)]
+            self._project_assemblies[project_pk] = assemblies
+        return assemblies
+
+
+def get_resolver(request: HttpRequest) -> ObjectResolver:
+    """The request's ObjectResolver (created on first use)."""
+    if (resolver := getattr(request, "_object_resolver", None)) is None:
+        resolver = ObjectResolver(request.user)  # type: ignore
+        request._object_resolver = resolver  # type: ignore
+    return resolver
+
+
+async def aget_resolver(request: HttpRequest) -> ObjectResolver:
+    """The async version of get_resolver."""
+    if (resolver := getattr(request, "_object_resolver", None)) is None:
+        resolver = ObjectResolver(await request.auser())  # type: ignore
+        request._object_resolver = resolver  # type: ignore
+    return resolver
@@ -23,10 +23,7 @@ class LayerView:
         self.layer = layer
         self.segments = layer.get_ordered_segments()
         self.forms = [
-            MaterialSearchForm(
-                prefix=f"form_{segment.pk}",
-                initial={"material": segment.material.pk if segment.material else None},
-            )
+            MaterialSearchForm(prefix=f"form_{segment.pk}", material=segment.material)
             for segment in self.segments
         ]
 
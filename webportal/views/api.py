@@ -0,0 +1,191 @@
+"""Read-only JSON API for desktop clients (ie: the Rhino / Grasshopper Honeybee-PH scripts)."""
+
+from typing import Iterator
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.text import compress_sequence
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import etag, require_safe
+from django.views.decorators.vary import vary_on_headers
+
+from webportal import honeybee_ph
+from webportal.caching import visible_library_version
+from webportal.models import Material, MaterialChange
+from webportal.query_budgets import query_budget
+from webportal.resources import MaterialResource
+from webportal.views._resolver import get_resolver
+
+# -- Bumped whenever the JSON documents change shape
+API_VERSION = 1
+
+
+def _accepts_gzip(request: WSGIRequest) -> bool:
+    return bool(re_accepts_gzip.search(request.headers.get("Accept-Encoding", "")))
+
+
+def _streaming_json_response(
+    request: WSGIRequest, content: Iterator[bytes]
+) -> StreamingHttpResponse:
+    """Stream the JSON, gzipped if the client accepts it."""
+    if _accepts_gzip(request):
+        # -- (Without BREACH's random padding: the body holds no secret which a
+        # -- request could reflect, and a strong ETag needs the same bytes each time)
+        response = StreamingHttpResponse(
+            compress_sequence(content), content_type="application/json"
+        )
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = StreamingHttpResponse(content, content_type="application/json")
+    return response
+
+
+# ---------------------------------------------------------------------------------------
+# -- Material Library
+
+
+def _material_library_etag(request: WSGIRequest) -> str | None:
+    """A strong ETag of the user's visible library: its version, and the encoding.
+
+    The version is that of the latest change to the library in the database (read
+    before the Materials, and only once), so every worker gives an unchanged library
+    the same ETag, and a conditional GET of it is answered (304) without reading any
+    Materials.
+    """
+    if not request.user.is_authenticated:
+        return None
+    version = visible_library_version(request)
+    encoding = "gzip" if _accepts_gzip(request) else "identity"
+    return f"materials-{API_VERSION}-{request.user.pk}-{version}-{encoding}"
+
+
+def _material_library_json(request: WSGIRequest) -> Iterator[bytes]:
+    # -- The version is read first (by the ETag): a change made while the rows are
+    # -- read is sent again by the change feed, which is safe (changes are idempotent).
+    version = visible_library_version(request)
+    materials = Material.objects.visible_to(request.user.pk).order_by("pk")
+    yield f'{{"api_version":{API_VERSION},"version":{version},"materials":'.encode()
+    for chunk in MaterialResource().iter_json(materials):
+        yield chunk.encode()
+    yield b"}"
+
+
+@query_budget(4)
+@login_required
+@require_safe
+@vary_on_headers("Accept-Encoding")
+@cache_control(private=True, no_cache=True)
+@etag(_material_library_etag)
+def material_library(request: WSGIRequest) -> StreamingHttpResponse:
+    """The user's visible material library (their own and the public Materials), as JSON.
+
+    Materials are in a stable order (by id), streamed, and gzipped if the client
+    accepts it. Send the ETag back as 'If-None-Match' to get a 304 (Not Modified)
+    until the library changes. The 'version' is where the change feed picks up.
+    """
+    return _streaming_json_response(request, _material_library_json(request))
+
+
+# ---------------------------------------------------------------------------------------
+# -- Material Library Changes (delta-sync)
+
+
+def _change_page_params(request: WSGIRequest) -> tuple[int, int]:
+    page_size = settings.MATERIAL_CHANGES_PAGE_SIZE
+    try:
+        since = int(request.GET.get("since", 0))
+        limit = min(int(request.GET.get("limit", page_size)), page_size)
+    except ValueError:
+        raise ValueError("'since' and 'limit' must be whole numbers")
+    if since < 0 or limit < 1:
+        raise ValueError("'since' must be 0 or more, and 'limit' 1 or more")
+    return since, limit
+
+
+@query_budget(4)
+@login_required
+@require_safe
+@gzip_page
+@cache_control(private=True, no_cache=True)
+def material_changes(request: WSGIRequest) -> JsonResponse | HttpResponseBadRequest:
+    """The changes to the user's visible material library since a version, by page.
+
+    'since' is the 'version' of the library (from /api/materials), or of the last
+    page. Each changed Material is in a page once, with its latest change and
+    (unless it was deleted) its current columns. Ask again with the page's
+    'version' while 'has_more' is true.
+    """
+    try:
+        since, limit = _change_page_params(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    changes = list(
+        MaterialChange.objects.visible_to(request.user.pk)
+        .filter(version__gt=since)
+        .order_by("version")[: limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # -- Only the latest change of each Material, in version order
+    latest = sorted(
+        {c.material_id: c for c in changes}.values(), key=lambda c: c.version
+    )
+    changed = [c.material_id for c in latest if c.action != MaterialChange.DELETED]
+    columns = {}
+    if changed:
+        materials = Material.objects.filter(pk__in=changed).order_by("pk")
+        columns = {row["uid"]: row for row in MaterialResource().iter_dicts(materials)}
+
+    return JsonResponse(
+        {
+            "api_version": API_VERSION,
+            "since": since,
+            "version": changes[-1].version if changes else since,
+            "has_more": has_more,
+            "changes": [
+                {
+                    "version": change.version,
+                    "action": MaterialChange.ACTION_NAMES[change.action],
+                    "uid": change.uid,
+                    "material": (
+                        None
+                        if change.action == MaterialChange.DELETED
+                        else columns.get(change.uid)
+                    ),
+                }
+                for change in latest
+            ],
+        }
+    )
+
+
+# ---------------------------------------------------------------------------------------
+# -- Project Export (Honeybee-PH)
+
+
+@query_budget(6)
+@login_required
+@require_safe
+@vary_on_headers("Accept-Encoding")
+def project_constructions(
+    request: WSGIRequest, project_pk: int
+) -> StreamingHttpResponse:
+    """The Project's Assemblies as Honeybee-PH constructions (see webportal.honeybee_ph).
+
+    Streamed as the Project is read, in a fixed number of queries.
+    """
+    project = get_resolver(request).project(project_pk)
+    content = (
+        chunk.encode() for chunk in honeybee_ph.iter_project_json(project, API_VERSION)
+    )
+    response = _streaming_json_response(request, content)
+    response["Content-Disposition"] = (
+        f'attachment; filename="{project.uid}_constructions.json"'
+    )
+    return response
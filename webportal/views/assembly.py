@@ -1,19 +1,29 @@
+import json
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.core.handlers.wsgi import WSGIRequest
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, render
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.shortcuts import render
 from django.template import Context
 from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
-from render_block import render_block_to_string
 
-from webportal.models import Assembly, Layer, Material, Project
+from webportal import cloning
+from webportal.fragments import render_fragment
+from webportal.layer_operations import LayerOperationsResult, apply_layer_operations
+from webportal.models import Assembly, Material, Project
+from webportal.query_budgets import query_budget
+from webportal.thermal import get_stored_results, store_results
+from webportal.views._resolver import ObjectResolver, aget_resolver, get_resolver
 from webportal.views._types import LayerView, get_user
 
 # ---------------------------------------------------------------------------------------
 # -- Assembly-Views
 
 
+@query_budget(6)
 @login_required
 def assemblies_page(
     request: WSGIRequest, project_pk: int | None = None
@@ -37,11 +47,8 @@ def assemblies_page(
     return render(request, "webportal/assemblies.html", context)
 
 
-def sidebar_add_assembly_button(request: WSGIRequest, project_pk: int) -> str:
-    """HTML String for the Assembly sidebar-add-button."""
-
-    active_project = get_object_or_404(Project, pk=project_pk)
-    return render_block_to_string(
+def _render_sidebar_add_button(request: WSGIRequest, active_project: Project) -> str:
+    return render_fragment(
         "webportal/partials/assemblies/sidebar.html",
         block_name="assembly-sidebar-add-button",
         context=Context(
@@ -53,14 +60,20 @@ def sidebar_add_assembly_button(request: WSGIRequest, project_pk: int) -> str:
     )
 
 
-def sidebar_assembly_list(
-    request: WSGIRequest, project_pk: int, assembly_pk: int | None
-) -> str:
-    """HTML String for the Assembly sidebar-list of all assemblies in the project."""
+def sidebar_add_assembly_button(request: WSGIRequest, project_pk: int) -> str:
+    """HTML String for the Assembly sidebar-add-button."""
+
+    active_project = get_resolver(request).project(project_pk)
+    return _render_sidebar_add_button(request, active_project)
 
-    active_project = get_object_or_404(Project, pk=project_pk)
-    project_assemblies = Assembly.objects.filter(project=active_project)
-    return render_block_to_string(
+
+def _render_sidebar_list(
+    request: WSGIRequest,
+    active_project: Project,
+    project_assemblies: Iterable[Assembly],
+    assembly_pk: int | None,
+) -> str:
+    return render_fragment(
         "webportal/partials/assemblies/sidebar.html",
         block_name="assembly-sidebar-list",
         context=Context(
@@ -74,22 +87,40 @@ def sidebar_assembly_list(
     )
 
 
-def assembly_detail(project_pk: int, assembly_pk: int | None) -> str:
-    """HTML String for the Assembly detail view with all layer and materials."""
+def sidebar_assembly_list(
+    request: WSGIRequest, project_pk: int, assembly_pk: int | None
+) -> str:
+    """HTML String for the Assembly sidebar-list of all assemblies in the project."""
+
+    resolver = get_resolver(request)
+    active_project = resolver.project(project_pk)
+    project_assemblies = resolver.project_assemblies(project_pk)
+    return _render_sidebar_list(
+        request, active_project, project_assemblies, assembly_pk
+    )
 
-    active_project = get_object_or_404(Project, pk=project_pk)
-    if assembly_pk:
-        this_assembly = get_object_or_404(Assembly, pk=assembly_pk)
-        layers: list[Layer] = this_assembly.get_ordered_layers()
-        if not layers:
-            this_assembly.add_new_layer()
-            layers = this_assembly.get_ordered_layers()
 
+def _render_assembly_thermal(request: WSGIRequest, assembly: Assembly) -> str:
+    """The Assembly's stored R / U-values, as an out-of-band swap."""
+    return render_fragment(
+        "webportal/partials/assemblies/assembly.html",
+        block_name="assembly-thermal",
+        context=Context({"assembly": assembly, "thermal_oob": True}),
+        request=request,
+    )
+
+
+def _render_assembly_detail(
+    active_project: Project, this_assembly: Assembly | None
+) -> str:
+    if this_assembly:
         return render_to_string(
             "webportal/partials/assemblies/assembly.html",
             context={
                 "assembly": this_assembly,
-                "layer_views": (LayerView(layer) for layer in layers),
+                "layer_views": (
+                    LayerView(layer) for layer in this_assembly.get_ordered_layers()
+                ),
                 "active_project": active_project,
             },
         )
@@ -102,31 +133,109 @@ def assembly_detail(project_pk: int, assembly_pk: int | None) -> str:
         )
 
 
-@login_required
-def change_project(request: WSGIRequest) -> HttpResponse:
-    print(f">> change_project/")
+def assembly_detail(
+    request: WSGIRequest, project_pk: int, assembly_pk: int | None
+) -> str:
+    """HTML String for the Assembly detail view with all layer and materials."""
+
+    resolver = get_resolver(request)
+    this_assembly = None
+    if assembly_pk:
+        # -- Load the whole Layer / Segment / Material tree up front (fixed # of queries)
+        this_assembly = resolver.assembly(project_pk, assembly_pk, tree=True)
+        if not this_assembly.get_ordered_layers():
+            this_assembly.add_new_layer()
+            resolver.forget(this_assembly)
+            this_assembly = resolver.assembly(project_pk, assembly_pk, tree=True)
+        get_stored_results([this_assembly])
+    return _render_assembly_detail(resolver.project(project_pk), this_assembly)
 
-    if new_project_pk := request.GET.get("project_pk", None):
-        project_pk = int(new_project_pk)
-    else:
-        if this_team := get_user(request).team:
-            if project := Project.get_team_default_project(this_team):
-                project_pk = project.pk
+
+def _render_project_uid(active_project: Project) -> str:
+    return (
+        f'<span id="active-project-uid" hx-swap-oob="true">{active_project.uid}</span>'
+    )
+
+
+def project_html(request: WSGIRequest, project_pk: int) -> str:
+    """HTML String for switching the page to the Project: sidebar, empty detail, UID."""
 
     sidebar_button = sidebar_add_assembly_button(request, project_pk)
     sidebar_list = sidebar_assembly_list(request, project_pk, None)
-    assembly_html = assembly_detail(project_pk, None)
+    assembly_html = assembly_detail(request, project_pk, None)
+
+    active_project = get_resolver(request).project(project_pk)
+    return (
+        assembly_html
+        + sidebar_button
+        + sidebar_list
+        + _render_project_uid(active_project)
+    )
 
-    active_project = get_object_or_404(Project, pk=project_pk)
-    active_uid = (
-        f'<span id="active-project-uid" hx-swap-oob="true">{active_project.uid}</span>'
+
+def assembly_html(
+    request: WSGIRequest, project_pk: int, assembly_pk: int | None
+) -> str:
+    """HTML String for the Assembly detail view and the sidebar-list."""
+
+    return assembly_detail(request, project_pk, assembly_pk) + sidebar_assembly_list(
+        request, project_pk, assembly_pk
     )
-    full_html = assembly_html + sidebar_button + sidebar_list + active_uid
-    return HttpResponse(full_html, content_type="text/html")
 
 
+# ---------------------------------------------------------------------------------------
+# -- Async (ASGI) Assembly-Views
+#
+# The read-only views load their data with the async ORM, so that under an ASGI
+# server a slow request does not hold up a whole worker. The data is loaded up
+# front and the templates are rendered without touching the database.
+
+
+async def _aload_assembly(
+    resolver: ObjectResolver, project_pk: int, assembly_pk: int | None
+) -> Assembly | None:
+    """The Assembly with its Layer / Segment / Material tree, or None."""
+    if not assembly_pk:
+        return None
+    this_assembly = await resolver.aassembly(project_pk, assembly_pk, tree=True)
+    if not this_assembly.get_ordered_layers():
+        await sync_to_async(this_assembly.add_new_layer)()
+        resolver.forget(this_assembly)
+        this_assembly = await resolver.aassembly(project_pk, assembly_pk, tree=True)
+    if this_assembly.thermal_stale:
+        await sync_to_async(get_stored_results)([this_assembly])
+    return this_assembly
+
+
+@query_budget(6)
+@login_required
+async def change_project(request: WSGIRequest) -> HttpResponse:
+    print(f">> change_project/")
+
+    resolver = await aget_resolver(request)
+    if new_project_pk := request.GET.get("project_pk", None):
+        active_project = await resolver.aproject(int(new_project_pk))
+    else:
+        active_project = None
+        if resolver.team_id:
+            active_project = await Project.get_team_projects(resolver.team_id).afirst()
+        if active_project is None:
+            raise Http404("No Project matches the given query.")
+        resolver.remember(active_project)
+
+    project_assemblies = await resolver.aproject_assemblies(active_project.pk)
+    html = (
+        _render_assembly_detail(active_project, None)
+        + _render_sidebar_add_button(request, active_project)
+        + _render_sidebar_list(request, active_project, project_assemblies, None)
+        + _render_project_uid(active_project)
+    )
+    return HttpResponse(html, content_type="text/html")
+
+
+@query_budget(9)
 @login_required
-def assembly(
+async def assembly(
     request: WSGIRequest, project_pk: int, assembly_pk: int | None = None
 ) -> HttpResponse:
     """The Assembly view with the sidebar.
@@ -136,9 +245,15 @@ def assembly(
 
     print(f">> assembly/{project_pk}/{assembly_pk}")
 
-    assembly_html = assembly_detail(project_pk, assembly_pk)
-    sidebar_project_list_html = sidebar_assembly_list(request, project_pk, assembly_pk)
-    full_html = assembly_html + sidebar_project_list_html
+    # -- (The Assembly is loaded with its Project)
+    resolver = await aget_resolver(request)
+    this_assembly = await _aload_assembly(resolver, project_pk, assembly_pk)
+    active_project = await resolver.aproject(project_pk)
+    project_assemblies = await resolver.aproject_assemblies(project_pk)
+
+    full_html = _render_assembly_detail(
+        active_project, this_assembly
+    ) + _render_sidebar_list(request, active_project, project_assemblies, assembly_pk)
     return HttpResponse(full_html, content_type="text/html")
 
 
@@ -146,6 +261,7 @@ def assembly(
 # -- Assembly-Operations
 
 
+@query_budget(4)
 @login_required
 @require_POST
 def update_assembly_name(
@@ -153,66 +269,109 @@ def update_assembly_name(
 ) -> HttpResponse:
     print(f">> {project_pk}/{assembly_pk}/update_assembly_name")
 
-    this_assembly = get_object_or_404(Assembly, pk=assembly_pk)
+    resolver = get_resolver(request)
+    this_assembly = resolver.assembly(project_pk, assembly_pk)
     if name := request.POST.get("name"):
         this_assembly.set_name(name)
 
     template_name = "webportal/partials/assemblies/assembly.html"
-    active_project = get_object_or_404(Project, pk=project_pk)
+    active_project = resolver.project(project_pk)
     context = Context(
         {
             "assembly": this_assembly,
             "active_project": active_project,
         }
     )
-    detail_view_name = render_block_to_string(
+    detail_view_name = render_fragment(
         template_name, block_name="assembly-name", context=context, request=request
     )
     sidebar_name = f"<div id='assembly-name-{this_assembly.pk}' hx-swap-oob='true'>{this_assembly.name}</div>"
     return HttpResponse(content=detail_view_name + sidebar_name)
 
 
+@query_budget(20)
 @login_required
 @require_POST
 def add_new_assembly(request: WSGIRequest, project_pk: int) -> HttpResponse:
     print(f">> add_new_assembly/{project_pk}")
 
-    active_project = get_object_or_404(Project, pk=project_pk)
+    active_project = get_resolver(request).project(project_pk)
     new_assembly = Assembly.create_new_assembly(
         user=get_user(request),
         name="unnamed",
         project=active_project,
     )
 
-    return assembly(request, project_pk, new_assembly.pk)
+    return HttpResponse(
+        assembly_html(request, project_pk, new_assembly.pk), content_type="text/html"
+    )
 
 
+@query_budget(14)
 @login_required
 def delete_assembly(
     request: WSGIRequest, project_pk: int, assembly_pk: int
 ) -> HttpResponse:
     print(f">> {project_pk}/{assembly_pk}/delete_assembly")
 
-    this_assembly = get_object_or_404(Assembly, pk=assembly_pk)
+    resolver = get_resolver(request)
+    this_assembly = resolver.assembly(project_pk, assembly_pk)
+    resolver.forget(this_assembly)
     this_assembly.delete()
-    active_project = get_object_or_404(Project, pk=project_pk)
-    project_assemblies = Assembly.objects.filter(project=active_project)
-    return assembly(
-        request,
-        project_pk,
-        getattr(project_assemblies.first(), "pk", None),
+    project_assemblies = resolver.project_assemblies(project_pk)
+    first_assembly_pk = project_assemblies[0].pk if project_assemblies else None
+    return HttpResponse(
+        assembly_html(request, project_pk, first_assembly_pk),
+        content_type="text/html",
+    )
+
+
+@query_budget(18)
+@login_required
+@require_POST
+def clone_project(request: WSGIRequest, project_pk: int) -> HttpResponse:
+    """Copy the Project, with all of its assemblies, layers and segments."""
+    resolver = get_resolver(request)
+    resolver.project(project_pk)
+    try:
+        new_project = cloning.clone_project(project_pk, get_user(request))
+    except Project.DoesNotExist:
+        raise Http404("No Project matches the given query.")
+    resolver.remember(new_project)
+    return HttpResponse(project_html(request, new_project.pk), content_type="text/html")
+
+
+@query_budget(22)
+@login_required
+@require_POST
+def clone_assembly(
+    request: WSGIRequest, project_pk: int, assembly_pk: int
+) -> HttpResponse:
+    """Copy the Assembly, with all of its layers and segments, within the Project."""
+    get_resolver(request).assembly(project_pk, assembly_pk)
+    try:
+        new_assembly = cloning.clone_assembly(
+            project_pk, assembly_pk, get_user(request)
+        )
+    except Assembly.DoesNotExist:
+        raise Http404("No Assembly matches the given query.")
+    return HttpResponse(
+        assembly_html(request, project_pk, new_assembly.pk), content_type="text/html"
     )
 
 
+@query_budget(13)
 @login_required
 def add_layer(request: WSGIRequest, project_pk: int, assembly_pk: int) -> HttpResponse:
     print(f">> {project_pk}/{assembly_pk}/add_layer")
 
-    this_assembly = get_object_or_404(Assembly, id=assembly_pk)
+    resolver = get_resolver(request)
+    this_assembly = resolver.assembly(project_pk, assembly_pk)
     new_layer = this_assembly.add_new_layer()
-    active_project = get_object_or_404(Project, pk=project_pk)
+    (stored,) = store_results([assembly_pk])
+    active_project = resolver.project(project_pk)
 
-    layer_html = render_block_to_string(
+    layer_html = render_fragment(
         "webportal/partials/assemblies/assembly.html",
         block_name="layer",
         context=Context(
@@ -224,23 +383,30 @@ def add_layer(request: WSGIRequest, project_pk: int, assembly_pk: int) -> HttpRe
         ),
         request=request,
     )
-    return HttpResponse(layer_html, content_type="text/html")
+    return HttpResponse(
+        layer_html + _render_assembly_thermal(request, stored), content_type="text/html"
+    )
 
 
+@query_budget(13)
 @login_required
 def delete_layer(
     request: WSGIRequest, project_pk: int, assembly_pk: int, layer_pk: int
 ) -> HttpResponse:
     print(f">> {project_pk}/{assembly_pk}/delete_layer/{layer_pk}")
 
-    this_assembly = get_object_or_404(Assembly, id=assembly_pk)
-    this_assembly.delete_layer(layer_pk)
-    this_layer = get_object_or_404(Layer, id=layer_pk)
+    resolver = get_resolver(request)
+    this_layer = resolver.layer(project_pk, assembly_pk, layer_pk)
+    resolver.forget(this_layer)
     this_layer.delete()
+    store_results([assembly_pk])
 
-    return assembly(request, project_pk, assembly_pk)
+    return HttpResponse(
+        assembly_html(request, project_pk, assembly_pk), content_type="text/html"
+    )
 
 
+@query_budget(8)
 @login_required
 @require_POST
 def update_layer_thickness(
@@ -248,12 +414,17 @@ def update_layer_thickness(
 ) -> HttpResponse:
     print(f">> {project_pk}/{assembly_pk}/update_layer_thickness/{layer_pk}")
 
-    this_layer = get_object_or_404(Layer, id=layer_pk)
+    this_layer = get_resolver(request).layer(project_pk, assembly_pk, layer_pk)
     if thickness := request.POST.get("thickness"):
         this_layer.set_layer_thickness(float(thickness))
+        (stored,) = store_results([this_layer.assembly_id])
+        return HttpResponse(
+            f"{this_layer.thickness}{_render_assembly_thermal(request, stored)}"
+        )
     return HttpResponse(this_layer.thickness)
 
 
+@query_budget(10)
 @login_required
 @require_POST
 def update_layer_material(
@@ -261,7 +432,7 @@ def update_layer_material(
 ) -> HttpResponse:
     print(f">> {project_pk}/{assembly_pk}/update_layer_material/{layer_pk}")
 
-    this_layer = get_object_or_404(Layer, id=layer_pk)
+    this_layer = get_resolver(request).layer(project_pk, assembly_pk, layer_pk)
     # TODO: Support multiple segments.
     # for now, set all segments to the same material...
     for segment in this_layer.segments.all():
@@ -269,5 +440,94 @@ def update_layer_material(
         if mat_id := request.POST.get(f"form_{segment.pk}-material", None):
             new_material = Material.objects.get(id=mat_id)
             segment.set_segment_material(new_material)
-            return HttpResponse(new_material.name)
+            (stored,) = store_results([this_layer.assembly_id])
+            return HttpResponse(
+                f"{new_material.name}{_render_assembly_thermal(request, stored)}"
+            )
     return HttpResponse()
+
+
+def _layer_operation_fragments(
+    request: WSGIRequest, project: Project, result: LayerOperationsResult
+) -> str:
+    """The out-of-band HTML swaps for only the layers changed by the operations."""
+    template_name = "webportal/partials/assemblies/assembly.html"
+    assembly = result.assembly
+    layers = assembly.get_ordered_layers()
+    context = {"assembly": assembly, "active_project": project}
+
+    # -- A reorder moves every layer, so send the whole (re-ordered) list
+    if result.reordered:
+        return render_fragment(
+            template_name,
+            block_name="assembly-layers",
+            context=Context(
+                {
+                    **context,
+                    "layer_views": [LayerView(layer) for layer in layers],
+                    "layers_oob": True,
+                }
+            ),
+            request=request,
+        )
+
+    fragments = [
+        f'<div id="layer-{pk}" hx-swap-oob="delete"></div>' for pk in result.deleted
+    ]
+    created = set(result.created)
+    for i, layer in enumerate(layers):
+        if layer.pk not in created and layer.pk not in result.changed:
+            continue
+        html = render_fragment(
+            template_name,
+            block_name="layer",
+            context=Context(
+                {
+                    **context,
+                    "layer_view": LayerView(layer),
+                    "layer_oob": "true" if layer.pk not in created else "",
+                }
+            ),
+            request=request,
+        )
+        if layer.pk in created:
+            # -- New layers go after the layer before them (created in order)
+            position = (
+                f"afterend:#layer-{layers[i - 1].pk}"
+                if i > 0
+                else "afterbegin:#assembly-layers"
+            )
+            html = f'<div hx-swap-oob="{position}">{html}</div>'
+        fragments.append(html)
+    return "".join(fragments)
+
+
+@query_budget(26)
+@login_required
+@require_POST
+def layer_operations(
+    request: WSGIRequest, project_pk: int, assembly_pk: int
+) -> HttpResponse:
+    """Apply a batch of layer operations (see webportal.layer_operations) at once.
+
+    The operations are sent as JSON, either as the request body
+    ({"operations": [...]}) or in an 'operations' form field. Returns only the
+    changed layers, as out-of-band swaps.
+    """
+    active_project = get_resolver(request).project(project_pk)
+    try:
+        if request.content_type == "application/json":
+            operations = json.loads(request.body).get("operations")
+        else:
+            operations = json.loads(request.POST.get("operations", ""))
+        result = apply_layer_operations(
+            project_pk, assembly_pk, operations, get_user(request)
+        )
+    except Assembly.DoesNotExist:
+        raise Http404("No Assembly matches the given query.")
+    except (ValueError, AttributeError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    html = _layer_operation_fragments(request, active_project, result)
+    html += _render_assembly_thermal(request, result.assembly)
+    return HttpResponse(html, content_type="text/html")
@@ -1,23 +1,36 @@
+import logging
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.core.handlers.wsgi import WSGIRequest
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.db.models.functions import Lower
-from django.http import HttpResponse, JsonResponse
+from django.db.models import QuerySet
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_http_methods, require_POST
 from django_htmx.http import retarget
-from tablib import Dataset
 
+from webportal.caching import alibrary_cache_key, library_cache_key
 from webportal.filters import MaterialCategoryFilter
 from webportal.forms import MaterialForm
-from webportal.models import Material
-from webportal.resources import MaterialResource
-from webportal.views._types import UnitSystem
+from webportal.models import Material, MaterialCategory, User, visible_owners
+from webportal.pagination import KeysetPaginator
+from webportal.query_budgets import query_budget
+from webportal.resources import MaterialImporter, MaterialResource
+from webportal.views._types import UnitSystem, get_user
+
+logger = logging.getLogger(__name__)
+
+# -- The most import errors listed in the response (all of them are logged)
+IMPORT_ERRORS_SHOWN = 20
 
 
+@query_budget(4)
 @require_POST
 def set_unit_system(request: WSGIRequest) -> HttpResponse:
     if request.POST.get("unit-system", None):
@@ -41,28 +54,66 @@ def set_unit_system(request: WSGIRequest) -> HttpResponse:
 # -- Materials-List Views
 
 
+def _count_cache_params(request: WSGIRequest) -> list:
+    return sorted(
+        (k, v) for k, v in request.GET.lists() if k not in ("page", "cursor", "sort")
+    )
+
+
+def _get_material_count(request: WSGIRequest, queryset: QuerySet) -> int:
+    """Return the (cached) total number of materials for the user and filters."""
+    key = library_cache_key(
+        "material-count",
+        request,
+        _count_cache_params(request),
+        request.session.get("unit_system", UnitSystem.SI.value),
+    )
+    return cache.get_or_set(
+        key, queryset.count, timeout=settings.MATERIAL_COUNT_CACHE_SECONDS
+    )
+
+
 def _get_materials(request: WSGIRequest) -> dict:
-    """Helper function to get the materials for the materials page."""
-    materials = Material.objects.filter(
-        Q(user=request.user) | Q(user__id=1)
-    ).select_related("category", "user")
-
-    # -- order by name, case-insensitive
-    materials = materials.annotate(lower_name=Lower("name")).order_by(
-        "category", "lower_name"
+    """Helper function to get the materials for the materials page.
+
+    Pages through the materials by cursor (keyset) unless an explicit '?page=N'
+    is requested, in which case the classic numbered pages are used.
+    """
+    unit_system = request.session.get("unit_system", UnitSystem.SI.value)
+    # -- order by category, then by name (case-insensitive)
+    materials = Material.objects.visible_to(request.user.pk).with_list_columns(
+        unit_system
+    )
+    materials_filter = MaterialCategoryFilter(
+        request.GET, queryset=materials, request=request
     )
-    materials_filter = MaterialCategoryFilter(request.GET, queryset=materials)
-    paginator = Paginator(materials_filter.qs, settings.PAGE_SIZE)
-    page = request.GET.get("page", 1)
-    material_page = paginator.page(page)
+    material_count = _get_material_count(request, materials_filter.qs)
+
+    if page := request.GET.get("page", None):
+        paginator = Paginator(
+            materials_filter.qs.order_by(*materials_filter.sort_keys),
+            settings.PAGE_SIZE,
+        )
+        paginator.count = material_count
+        material_page = paginator.page(page)
+    else:
+        paginator = KeysetPaginator(
+            materials_filter.qs,
+            keys=materials_filter.sort_keys,
+            per_page=settings.PAGE_SIZE,
+            partitions=visible_owners(request.user.pk),
+        )
+        material_page = paginator.page(request.GET.get("cursor", None))
 
     return {
         "materials": material_page,
+        "material_count": material_count,
         "filter": materials_filter,
         "current_user": request.user,
     }
 
 
+@query_budget(5)
 @login_required
 def materials_page(request: WSGIRequest) -> HttpResponse:
     """The main Material-List view page. Called on first load."""
@@ -70,24 +121,154 @@ def materials_page(request: WSGIRequest) -> HttpResponse:
     return render(request, "webportal/materials.html", context)
 
 
+# ---------------------------------------------------------------------------------------
+# -- Async (ASGI) Materials-List Views
+#
+# The read-only (HTMX) views load the materials with the async ORM and the async
+# cache API, so that under an ASGI server a slow request does not hold up a worker.
+# Everything the templates need is loaded before rendering.
+
+
+async def _aget_material_count(
+    request: WSGIRequest, user_pk: int, unit_system: str, queryset: QuerySet
+) -> int:
+    """The async version of _get_material_count."""
+    key = await alibrary_cache_key(
+        "material-count", request, user_pk, _count_cache_params(request), unit_system
+    )
+    if (count := await cache.aget(key)) is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, timeout=settings.MATERIAL_COUNT_CACHE_SECONDS)
+    return count
+
+
+def _validate_filter(materials_filter: MaterialCategoryFilter) -> None:
+    """Validate the filter, and load the (cached) categories its form shows."""
+    materials_filter.is_valid()
+    MaterialCategory.objects.get_all_cached()
+
+
+async def _aget_materials(request: WSGIRequest, user: User) -> dict:
+    """The async version of _get_materials."""
+    # -- Also loads the session, for the unit-system template filters
+    unit_system = await request.session.aget("unit_system", UnitSystem.SI.value)
+    materials = Material.objects.visible_to(user.pk).with_list_columns(unit_system)
+    materials_filter = MaterialCategoryFilter(
+        request.GET, queryset=materials, request=request
+    )
+    await sync_to_async(_validate_filter)(materials_filter)
+    material_count = await _aget_material_count(
+        request, user.pk, unit_system, materials_filter.qs
+    )
+
+    if page := request.GET.get("page", None):
+        paginator = Paginator(
+            materials_filter.qs.order_by(*materials_filter.sort_keys),
+            settings.PAGE_SIZE,
+        )
+        paginator.count = material_count
+        material_page = paginator.page(page)
+        material_page.object_list = [m async for m in material_page.object_list]
+    else:
+        paginator = KeysetPaginator(
+            materials_filter.qs,
+            keys=materials_filter.sort_keys,
+            per_page=settings.PAGE_SIZE,
+            partitions=visible_owners(user.pk),
+        )
+        material_page = await paginator.apage(request.GET.get("cursor", None))
+
+    return {
+        "materials": material_page,
+        "material_count": material_count,
+        "filter": materials_filter,
+        "current_user": user,
+    }
+
+
+async def _render_materials_fragment(
+    request: WSGIRequest, template_name: str
+) -> HttpResponse:
+    """Render the materials template, or return it from the cache if nothing changed.
+
+    The cache key covers the user, the filter / page / cursor, the unit system and the
+    version of the user's visible library, which is bumped on every Material change.
+    """
+    user = await request.auser()
+    key = await alibrary_cache_key(
+        "materials-fragment",
+        request,
+        user.pk,
+        template_name,
+        sorted(request.GET.lists()),
+        await request.session.aget("unit_system", UnitSystem.SI.value),
+    )
+    if (html := await cache.aget(key)) is None:
+        context = await _aget_materials(request, user)
+        html = render_to_string(template_name, context, request=request)
+        await cache.aset(key, html, timeout=settings.MATERIAL_FRAGMENT_CACHE_SECONDS)
+    return HttpResponse(html)
+
+
+@query_budget(5)
 @login_required
-def materials_list(request: WSGIRequest) -> HttpResponse:
+async def materials_list(request: WSGIRequest) -> HttpResponse:
     """The material-list when page is loaded via HTMX."""
-    context = _get_materials(request)
-    return render(request, "webportal/partials/materials/container.html", context)
+    return await _render_materials_fragment(
+        request, "webportal/partials/materials/container.html"
+    )
 
 
+@query_budget(5)
 @login_required
-def get_materials(request: WSGIRequest) -> HttpResponse:
+async def get_materials(request: WSGIRequest) -> HttpResponse:
     """Get the materials list when the user interacts with the filters."""
-    context = _get_materials(request)
-    return render(request, "webportal/partials/materials/table.html", context)
+    return await _render_materials_fragment(
+        request, "webportal/partials/materials/table.html"
+    )
+
+
+@query_budget(4)
+@login_required
+async def material_search(request: WSGIRequest) -> JsonResponse:
+    """Select2 AJAX search: the user's visible Materials which start with the 'term'.
+
+    Results are cached for MATERIAL_SEARCH_CACHE_SECONDS, per user, term, page and
+    library version.
+    """
+    term = request.GET.get("term", "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+
+    user = await request.auser()
+    key = await alibrary_cache_key(
+        "material-search", request, user.pk, term.lower(), page
+    )
+    if (data := await cache.aget(key)) is None:
+        limit = settings.MATERIAL_SEARCH_LIMIT
+        start = (page - 1) * limit
+        materials = Material.objects.name_search(user.pk, term, start + limit + 1)
+        rows = [row async for row in materials.values_list("pk", "name")[start:]]
+        data = {
+            "results": [{"id": pk, "text": name} for pk, name in rows[:limit]],
+            "pagination": {"more": len(rows) > limit},
+        }
+        await cache.aset(key, data, timeout=settings.MATERIAL_SEARCH_CACHE_SECONDS)
+
+    response = JsonResponse(data)
+    patch_cache_control(
+        response, private=True, max_age=settings.MATERIAL_SEARCH_CACHE_SECONDS
+    )
+    return response
 
 
 # ---------------------------------------------------------------------------------------
 # -- Materials-List Operations
 
 
+@query_budget(7)
 @login_required
 def create_material(request: WSGIRequest) -> HttpResponse:
     if request.method == "POST":
@@ -109,6 +290,7 @@ def create_material(request: WSGIRequest) -> HttpResponse:
     return render(request, "webportal/partials/materials/create.html", context)
 
 
+@query_budget(3)
 @login_required
 def update_material(request: WSGIRequest, pk: int) -> HttpResponse:
     material = get_object_or_404(Material, pk=pk)
@@ -134,6 +316,7 @@ def update_material(request: WSGIRequest, pk: int) -> HttpResponse:
     return render(request, "webportal/partials/materials/update.html", context)
 
 
+@query_budget(8)
 @login_required
 @require_http_methods(["DELETE"])
 def delete_material(request: WSGIRequest, pk: int) -> HttpResponse:
@@ -149,8 +332,9 @@ def delete_material(request: WSGIRequest, pk: int) -> HttpResponse:
 # -- Materials-List I/O
 
 
+@query_budget(3)
 @login_required
-def export_csv(request: WSGIRequest) -> HttpResponse | JsonResponse:
+def export_csv(request: WSGIRequest) -> HttpResponse | StreamingHttpResponse:
     # -- If the request comes from HTMX, do a client-side redirect but now
     # -- as a normal (ie: non-HTMX / Ajax) request to allow file downloading.
     if getattr(request, "htmx", None):
@@ -158,20 +342,20 @@ def export_csv(request: WSGIRequest) -> HttpResponse | JsonResponse:
 
     material_filter = MaterialCategoryFilter(
         request.GET,
-        queryset=Material.objects.filter(
-            Q(user=request.user) | Q(user__id=1)
-        ).select_related("category"),
+        queryset=Material.objects.visible_to(request.user.pk).select_related(
+            "category"
+        ),
+        request=request,
     )
 
-    data = MaterialResource().export(material_filter.qs)
-    if csv_data := getattr(data, "csv", None):
-        response = HttpResponse(csv_data)
-        response["Content-Disposition"] = "attachment; filename=ph_materials.csv"
-        return response
-    else:
-        return JsonResponse({"message": "No data to export"})
+    response = StreamingHttpResponse(
+        MaterialResource().iter_csv(material_filter.qs), content_type="text/csv"
+    )
+    response["Content-Disposition"] = "attachment; filename=ph_materials.csv"
+    return response
 
 
+@query_budget(9)
 @login_required
 def import_materials(request: WSGIRequest) -> HttpResponse:
     if request.method == "POST":
@@ -182,27 +366,27 @@ def import_materials(request: WSGIRequest) -> HttpResponse:
             context = {"message": "Please select a file to import"}
             return render(request, "webportal/partials/materials/import.html", context)
 
-        resource = MaterialResource()
-        dataset = Dataset()
-        dataset.load(file.read().decode("utf-8"), format="csv")
-
         # -------------------------------------------------------------------------------
-        # -- Check the import data for errors
-        result = resource.import_data(dataset, user=request.user, dry_run=True)
-
-        for row in result:
-            for error in row.errors:
-                print(f"IMPORT ERROR: {error}")
+        # -- Validate every row, then create all the new Materials in a single pass
+        user = get_user(request)
+        result = MaterialImporter(user=user).import_csv(file.read().decode("utf-8-sig"))
 
         if result.has_errors():
-            print(result.base_errors)
-            context = {"message": "Sorry, an error occurred during upload"}
+            logger.warning(
+                "Material import for user %s failed: %s",
+                user.pk,
+                "; ".join(result.errors),
+            )
+            context = {
+                "message": (
+                    f"Nothing was imported: {len(result.errors)} row(s) have errors."
+                ),
+                "errors": result.errors[:IMPORT_ERRORS_SHOWN],
+                "more_errors": max(len(result.errors) - IMPORT_ERRORS_SHOWN, 0),
+            }
             return render(request, "webportal/partials/materials/success.html", context)
 
-        # -------------------------------------------------------------------------------
-        # Create the new Material objects in the Database
-        resource.import_data(dataset, user=request.user, dry_run=False)
-        context = {"message": f"{len(dataset)} materials imported successfully!"}
+        context = {"message": f"{len(result.created)} materials imported successfully!"}
         return render(request, "webportal/partials/materials/success.html", context)
 
     # -- GET request
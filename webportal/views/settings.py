@@ -4,15 +4,17 @@ from django.http import HttpResponse
 from django.shortcuts import render
 from django.template import Context
 from django.views.decorators.http import require_POST
-from render_block import render_block_to_string
 
+from webportal.fragments import render_fragment
 from webportal.models import User
+from webportal.query_budgets import query_budget
 from webportal.views._types import get_user
 
 # ---------------------------------------------------------------------------------------
 # -- User / Team Management Views
 
 
+@query_budget(6)
 @login_required
 def account_settings(request: WSGIRequest) -> HttpResponse:
     print(">> account_settings")
@@ -26,6 +28,7 @@ def account_settings(request: WSGIRequest) -> HttpResponse:
     return render(request, "webportal/account_settings.html", context)
 
 
+@query_budget(5)
 @require_POST
 @login_required
 def update_team_name(request: WSGIRequest) -> HttpResponse:
@@ -45,6 +48,7 @@ def update_team_name(request: WSGIRequest) -> HttpResponse:
     return HttpResponse(user.team.name)
 
 
+@query_budget(4)
 @require_POST
 @login_required
 def update_first_name(request: WSGIRequest) -> HttpResponse:
@@ -57,6 +61,7 @@ def update_first_name(request: WSGIRequest) -> HttpResponse:
     return HttpResponse(user.first_name)
 
 
+@query_budget(4)
 @require_POST
 @login_required
 def update_last_name(request: WSGIRequest) -> HttpResponse:
@@ -69,6 +74,7 @@ def update_last_name(request: WSGIRequest) -> HttpResponse:
     return HttpResponse(user.last_name)
 
 
+@query_budget(4)
 @require_POST
 @login_required
 def update_email(request: WSGIRequest) -> HttpResponse:
@@ -81,6 +87,7 @@ def update_email(request: WSGIRequest) -> HttpResponse:
     return HttpResponse(user.email)
 
 
+@query_budget(7)
 @require_POST
 @login_required
 def invite_user_to_team(request: WSGIRequest) -> HttpResponse:
@@ -98,6 +105,7 @@ def invite_user_to_team(request: WSGIRequest) -> HttpResponse:
     return HttpResponse("Invite User to Team")
 
 
+@query_budget(4)
 @require_POST
 @login_required
 def accept_team_invite(request: WSGIRequest) -> HttpResponse:
@@ -111,6 +119,7 @@ def accept_team_invite(request: WSGIRequest) -> HttpResponse:
     return HttpResponse(f"Joined Team '{team_invited_to.name}'")
 
 
+@query_budget(5)
 @require_POST
 @login_required
 def decline_team_invite(request: WSGIRequest) -> HttpResponse:
@@ -124,6 +133,7 @@ def decline_team_invite(request: WSGIRequest) -> HttpResponse:
     return HttpResponse(f"Declined Team '{team_invited_to.name}'")
 
 
+@query_budget(6)
 @require_POST
 @login_required
 def leave_team(request: WSGIRequest) -> HttpResponse:
@@ -132,7 +142,7 @@ def leave_team(request: WSGIRequest) -> HttpResponse:
     user = get_user(request)
     user.leave_team()
 
-    block_html = render_block_to_string(
+    block_html = render_fragment(
         "webportal/partials/account_settings/settings.html",
         block_name="teams",
         context=Context(
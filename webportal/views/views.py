@@ -1,8 +1,35 @@
+import secrets
+
+from django.conf import settings
 from django.core.handlers.wsgi import WSGIRequest
 from django.http import HttpResponse
 from django.shortcuts import render
 
+from webportal.metrics import registry
+from webportal.query_budgets import query_budget
+
 
 # ---------------------------------------------------------------------------------------
+@query_budget(2)
 def index(request: WSGIRequest) -> HttpResponse:
     return render(request, "webportal/index.html")
+
+
+# ---------------------------------------------------------------------------------------
+def _metrics_allowed(request: WSGIRequest) -> bool:
+    """Staff users, or a scraper with the 'Authorization: Bearer <METRICS_TOKEN>'."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get("Authorization", "")
+    return bool(token) and secrets.compare_digest(auth, f"Bearer {token}")
+
+
+@query_budget(2)
+def metrics(request: WSGIRequest) -> HttpResponse:
+    """The request metrics of this process, in the Prometheus text format."""
+    if not _metrics_allowed(request):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )